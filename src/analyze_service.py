@@ -0,0 +1,171 @@
+"""
+analyze_service.py
+==================
+
+This module provides one endpoint that runs several services over the same text, for clients (such as an
+enrichment pipeline) that would otherwise send every document to `/ner/`, `/text2vec/` and `/paraphrase/` in turn.
+
+A request is parsed, authenticated and checked against WORD_LIMIT once. The requested operations then run at the
+same time, each on its own service's executor, so the request takes about as long as its slowest operation
+rather than the sum of all three. Each operation goes through the same path as its own endpoint: single texts
+are micro-batched with concurrent requests, batches run as one call, and the NER result cache, the paraphrase
+result cache and the embedding cache all apply.
+
+Configuration:
+    - Uses WORD_LIMIT and the `*_ENABLED` settings of the services; an operation whose service is disabled is
+      rejected with a 400.
+
+Models:
+    - AnalyzeRequest: `text` or `texts`, the `operations` to run (`ner`, `text2vec`, `paraphrase`; all three by
+      default), optional per-operation `models`, NER's `structured`, text2vec's `format` (except `npy`),
+      `dimensions` and `normalize`, and `priority`/`deadline_ms` (see `deadlines.py`).
+
+API Endpoints:
+    - POST `/`: With `text`, returns one object per operation (`ner.entities`, `text2vec.vector`,
+      `paraphrase.paraphrased_text`) and `timings_ms`. With `texts`, returns `results`, one such object per text
+      (or an `error` for a text over WORD_LIMIT), and `timings_ms`. `timings_ms` holds the milliseconds each
+      operation took, including its wait for the executor, and the `total`.
+
+"""
+
+import asyncio
+import time
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+from .batching import BATCH_MAX_TEXTS
+from .deadlines import request_options, cancel_on_disconnect, Priority
+from .metrics import stage, count_error
+from .vector_formats import prepare_vectors, encode_vector
+from . import ner_service, text2vec_service, paraphraser_service
+
+Operation = Literal["ner", "text2vec", "paraphrase"]
+
+OPERATIONS = {
+    "ner": (ner_service, ner_service.NER_ENABLED),
+    "text2vec": (text2vec_service, text2vec_service.TEXT2VEC_ENABLED),
+    "paraphrase": (paraphraser_service, paraphraser_service.PARAPHRASE_ENABLED),
+}
+
+# The services share one limit unless they were configured apart; a text must fit all that it goes to
+WORD_LIMIT = min(ner_service.WORD_LIMIT, text2vec_service.WORD_LIMIT, paraphraser_service.WORD_LIMIT)
+
+analyze_router = APIRouter()
+
+class AnalyzeRequest(BaseModel):
+    text: Optional[str] = None
+    texts: Optional[List[str]] = None
+    operations: List[Operation] = ["ner", "text2vec", "paraphrase"]
+    models: Optional[Dict[Operation, str]] = None
+    structured: bool = False
+    format: Literal["json", "float32", "float16", "int8"] = "json"
+    dimensions: Optional[int] = Field(None, gt=0)
+    normalize: bool = False
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
+
+async def analyze_text(operation, request, text, length, model):
+    # One text through the same path as the operation's own endpoint
+    if operation == "ner":
+        entities = await ner_service.ner_results.get_or_compute(
+            ner_service.result_key(model, text), lambda: ner_service.recognize(text, length, model))
+        return [{"entities": ner_service.format_entities(text, entities, request.structured)}]
+    if operation == "text2vec":
+        async with text2vec_service.text2vec_executor.admit():
+            vector = await text2vec_service.vectorize_async(text, length, model)
+        return vector_results([vector], request)
+    paraphrased_text = await paraphraser_service.paraphrase_results.get_or_compute(
+        paraphraser_service.greedy_key(text, model), lambda: paraphraser_service.paraphrase_greedy(text, length, model))
+    return [{"paraphrased_text": paraphrased_text}]
+
+async def analyze_texts(operation, request, texts, model):
+    # A list of texts in one call, like the operation's `/batch` endpoint
+    if operation == "ner":
+        entities_per_text = await ner_service.recognize_texts(texts, model)
+        return [{"entities": ner_service.format_entities(text, entities, request.structured)}
+                for text, entities in zip(texts, entities_per_text)]
+    if operation == "text2vec":
+        async with text2vec_service.text2vec_executor.admit():
+            vectors = await text2vec_service.vectorize_many_async(texts, model)
+        return vector_results(vectors, request)
+    return [{"paraphrased_text": text} for text in await paraphraser_service.paraphrase_texts(texts, model)]
+
+def vector_results(vectors, request):
+    with stage("text2vec", "serialize"):
+        prepared = prepare_vectors(vectors, request.dimensions, request.normalize)
+        return [encode_vector(vector, request.format) for vector in prepared]
+
+async def timed(operation, work, timings):
+    start = time.perf_counter()
+    try:
+        return await work
+    finally:
+        timings[operation] = round((time.perf_counter() - start) * 1000, 3)
+
+async def run_operations(request, operations, models, texts, lengths):
+    # Every operation on its own executor at the same time; if one fails, the others are cancelled
+    timings = {}
+    if request.text is not None:
+        tasks = [asyncio.ensure_future(timed(operation, analyze_text(operation, request, texts[0], lengths[0],
+                                                                     models[operation]), timings))
+                 for operation in operations]
+    else:
+        tasks = [asyncio.ensure_future(timed(operation, analyze_texts(operation, request, texts, models[operation]),
+                                             timings))
+                 for operation in operations]
+    try:
+        outputs = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return dict(zip(operations, outputs)), {operation: timings[operation] for operation in operations}
+
+@analyze_router.post("/")
+async def analyze(request: AnalyzeRequest, http_request: Request = None):
+    start = time.perf_counter()
+    with stage("analyze", "validate"):
+        if (request.text is None) == (request.texts is None):
+            count_error("analyze", "validation")
+            return JSONResponse(content={"error": "Send either 'text' or 'texts'."}, status_code=400)
+        if request.texts is not None and len(request.texts) > BATCH_MAX_TEXTS:
+            count_error("analyze", "batch_too_large")
+            return JSONResponse(content={"error": f"Batch exceeds {BATCH_MAX_TEXTS} texts. Please split it into smaller batches."}, status_code=400)
+        operations = list(dict.fromkeys(request.operations))
+        if not operations:
+            count_error("analyze", "validation")
+            return JSONResponse(content={"error": "Request at least one operation."}, status_code=400)
+        disabled = [operation for operation in operations if not OPERATIONS[operation][1]]
+        if disabled:
+            count_error("analyze", "service_disabled")
+            return JSONResponse(content={"error": f"Disabled services: {', '.join(disabled)}."}, status_code=400)
+        requested_models = request.models or {}
+        models = {operation: OPERATIONS[operation][0].resolve_model(requested_models.get(operation))
+                  for operation in operations}
+        request_options(request.priority, request.deadline_ms, default_lane="bulk" if request.texts is not None else None)
+
+        texts = [request.text] if request.text is not None else request.texts
+        lengths = [len(text.split()) for text in texts]
+        accepted = [index for index, length in enumerate(lengths) if length <= WORD_LIMIT]
+        if request.text is not None and not accepted:
+            count_error("analyze", "input_too_long")
+            return JSONResponse(content={"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
+
+    outputs, timings = {}, {}
+    if accepted:
+        work = run_operations(request, operations, models, [texts[index] for index in accepted],
+                              [lengths[index] for index in accepted])
+        outputs, timings = await cancel_on_disconnect("analyze", http_request, work)
+    timings["total"] = round((time.perf_counter() - start) * 1000, 3)
+
+    if request.text is not None:
+        return {**{operation: outputs[operation][0] for operation in operations}, "timings_ms": timings}
+
+    results = [None] * len(texts)
+    for index in range(len(texts)):
+        if lengths[index] > WORD_LIMIT:
+            count_error("analyze", "input_too_long")
+            results[index] = {"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}
+    for position, index in enumerate(accepted):
+        results[index] = {operation: outputs[operation][position] for operation in operations}
+    return {"results": results, "timings_ms": timings}
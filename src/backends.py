@@ -0,0 +1,354 @@
+"""
+backends.py
+===========
+
+This module provides the inference backends each service can run on, and a tool to check their accuracy.
+
+On CPU-only nodes fp32 eager PyTorch is the main throughput limit. Each service can pick a backend:
+
+    - `torch`: The original fp32 PyTorch model (default).
+    - `torch-int8`: PyTorch with dynamic int8 quantization of every `nn.Linear` layer. Weights are stored as int8
+      and activations are quantized on the fly; no calibration data is needed.
+    - `onnx`: The model exported to ONNX and run through ONNX Runtime. Requires the optional `optimum[onnxruntime]`
+      package: install requirements-onnx.txt instead of requirements.txt.
+
+Converted models can be cached on local disk, so a warm restart loads the finished artifact instead of
+quantizing or exporting again: fp32 weights as safetensors (SentenceTransformers in their own format),
+int8 models as a pickled module and ONNX models as `.onnx` files. Delete the cache directory after
+upgrading torch, transformers or optimum.
+
+Imports:
+    - `torch` and `transformers` for loading and quantizing models.
+    - `optimum.onnxruntime` (imported only when the `onnx` backend is selected).
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - NER_BACKEND, TEXT2VEC_BACKEND, PARAPHRASE_BACKEND: Read by the service modules; one of the values above.
+    - MODEL_CACHE_DIR: Directory for converted model artifacts (default is "", no caching).
+
+Functions:
+    - `registry_name`: Registry name for a model on a given backend.
+    - `artifact_dir`: Cache directory for a model on a given backend.
+    - `load_token_classifier`: Loads the NER model on a backend.
+    - `load_seq2seq`: Loads the paraphrase (T5) model on a backend.
+    - `load_sentence_transformer`: Loads the text2vec model on a backend.
+    - `model_bytes`: Stored size of a model's weights.
+    - `check_backend`: Compares a backend against fp32 on sample texts (latency, memory, agreement).
+
+Usage:
+    python -m src.backends ner torch-int8 [--model NAME] [--input texts.txt]
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import time
+from decouple import config
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+MODEL_CACHE_DIR = config('MODEL_CACHE_DIR', default="")
+
+logger = logging.getLogger(__name__)
+
+# Written last, so a half-written artifact (e.g. the process was killed) is never loaded
+_COMPLETE_MARKER = ".complete"
+
+
+def registry_name(name, backend):
+    """
+    Returns the name a model is registered under, so fp32 and optimized copies can coexist.
+    """
+    return name if backend == "torch" else f"{name} [{backend}]"
+
+
+def artifact_dir(name, backend, cache_dir=None):
+    """
+    Returns the directory holding the converted artifact for `name` on `backend`.
+    """
+    cache_dir = MODEL_CACHE_DIR if cache_dir is None else cache_dir
+    return os.path.join(cache_dir, name.replace("/", "--"), backend)
+
+
+def _cached(name, backend, build, save, restore, cache_dir=None):
+    # Loads the artifact from the cache if a complete one exists; otherwise builds it and saves it for next time
+    cache_dir = MODEL_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return build()
+
+    path = artifact_dir(name, backend, cache_dir)
+    if os.path.exists(os.path.join(path, _COMPLETE_MARKER)):
+        try:
+            return restore(path)
+        except Exception as exc:
+            logger.warning("Could not load cached %s artifact for %s, rebuilding: %s", backend, name, exc)
+
+    model = build()
+    staging = f"{path}.tmp-{os.getpid()}"
+    try:
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        save(model, staging)
+        open(os.path.join(staging, _COMPLETE_MARKER), "w").close()
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(staging, path)
+    except Exception as exc:
+        # The cache only speeds up restarts; never fail a load because of it
+        logger.warning("Could not cache %s artifact for %s: %s", backend, name, exc)
+        shutil.rmtree(staging, ignore_errors=True)
+    return model
+
+
+def _save_module(model, path):
+    import torch
+    torch.save(model, os.path.join(path, "model.pt"))
+
+
+def _restore_module(path):
+    import torch
+    return torch.load(os.path.join(path, "model.pt"))
+
+
+def _save_pretrained(model, path):
+    model.save_pretrained(path, safe_serialization=True)
+
+
+def _check(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Use one of: {', '.join(BACKENDS)}.")
+
+
+def _quantize(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnxruntime():
+    try:
+        from optimum import onnxruntime
+    except ImportError as exc:
+        raise ImportError("The 'onnx' backend requires optimum with ONNX Runtime: pip install 'optimum[onnxruntime]'") from exc
+    return onnxruntime
+
+
+def load_token_classifier(name, backend):
+    """
+    Loads a token classification (NER) model on `backend`.
+    """
+    _check(backend)
+    if backend == "onnx":
+        ort_class = _onnxruntime().ORTModelForTokenClassification
+        return _cached(name, backend, lambda: ort_class.from_pretrained(name, export=True),
+                       lambda model, path: model.save_pretrained(path), ort_class.from_pretrained)
+
+    from transformers import AutoModelForTokenClassification
+    if backend == "torch-int8":
+        return _cached(name, backend, lambda: _quantize(AutoModelForTokenClassification.from_pretrained(name)),
+                       _save_module, _restore_module)
+    return _cached(name, backend, lambda: AutoModelForTokenClassification.from_pretrained(name),
+                   _save_pretrained, AutoModelForTokenClassification.from_pretrained)
+
+
+def load_seq2seq(name, backend):
+    """
+    Loads a sequence-to-sequence (T5) model on `backend`.
+    """
+    _check(backend)
+    if backend == "onnx":
+        ort_class = _onnxruntime().ORTModelForSeq2SeqLM
+        return _cached(name, backend, lambda: ort_class.from_pretrained(name, export=True),
+                       lambda model, path: model.save_pretrained(path), ort_class.from_pretrained)
+
+    from transformers import T5ForConditionalGeneration
+    if backend == "torch-int8":
+        return _cached(name, backend, lambda: _quantize(T5ForConditionalGeneration.from_pretrained(name)),
+                       _save_module, _restore_module)
+    return _cached(name, backend, lambda: T5ForConditionalGeneration.from_pretrained(name),
+                   _save_pretrained, T5ForConditionalGeneration.from_pretrained)
+
+
+def load_sentence_transformer(name, backend):
+    """
+    Loads a SentenceTransformer on `backend`.
+
+    For `onnx`, the transformer encoder inside the SentenceTransformer is swapped for an ONNX Runtime model;
+    tokenization, pooling and normalization still run through the usual SentenceTransformer modules.
+    """
+    _check(backend)
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch-int8":
+        return _cached(name, backend, lambda: _quantize(SentenceTransformer(name)), _save_module, _restore_module)
+    if backend == "torch":
+        return _cached(name, backend, lambda: SentenceTransformer(name),
+                       lambda model, path: model.save(path), SentenceTransformer)
+
+    # Only the exported encoder is cached; the SentenceTransformer around it is cheap to build
+    model = SentenceTransformer(name)
+    transformer = model._first_module()
+    ort_class = _onnxruntime().ORTModelForFeatureExtraction
+    checkpoint = transformer.auto_model.name_or_path
+    encoder = _cached(name, backend, lambda: ort_class.from_pretrained(checkpoint, export=True),
+                      lambda encoder, path: encoder.save_pretrained(path), ort_class.from_pretrained)
+    transformer.auto_model = _onnx_encoder_module(encoder)
+    return model
+
+
+def _onnx_encoder_module(encoder):
+    # `auto_model` is a registered child module, so torch only accepts an nn.Module there. The wrapper answers
+    # the way a Hugging Face encoder called with return_dict=False does: token embeddings first.
+    import torch
+
+    class OnnxEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = encoder
+            self.config = encoder.config
+            # Where the .onnx files are, so the registry can measure the encoder (see estimate_memory_bytes)
+            self.model_save_dir = encoder.model_save_dir
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None, return_dict=False):
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if token_type_ids is not None:
+                inputs["token_type_ids"] = token_type_ids
+            return (self.encoder(**inputs).last_hidden_state,)
+
+    return OnnxEncoder()
+
+
+def model_bytes(model):
+    """
+    Size of a model's weights as stored: the serialized state dict for PyTorch (which includes packed
+    int8 weights), or the ONNX files for ONNX Runtime models.
+    """
+    save_dir = getattr(model, "model_save_dir", None)
+    if save_dir is not None:
+        return sum(os.path.getsize(os.path.join(save_dir, f)) for f in os.listdir(save_dir) if f.endswith((".onnx", ".onnx_data")))
+
+    import io
+    import torch
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _timed(fn, texts):
+    start = time.perf_counter()
+    outputs = [fn(text) for text in texts]
+    return outputs, (time.perf_counter() - start) * 1000 / len(texts)
+
+
+def _ner_runner(name, backend):
+    from transformers import AutoTokenizer, pipeline
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = load_token_classifier(name, backend)
+    nlp = pipeline("ner", model=model, tokenizer=tokenizer)
+    return (lambda text: {(e['start'], e['end'], e['entity']) for e in nlp(text)}), model
+
+
+def _text2vec_runner(name, backend):
+    model = load_sentence_transformer(name, backend)
+    return (lambda text: model.encode([text])[0]), model
+
+
+def _paraphrase_runner(name, backend):
+    from transformers import T5Tokenizer
+    tokenizer = T5Tokenizer.from_pretrained(name)
+    model = load_seq2seq(name, backend)
+
+    def run(text):
+        input_ids = tokenizer.encode("paraphrase: " + text, return_tensors="pt")
+        return tokenizer.decode(model.generate(input_ids, max_length=128)[0], skip_special_tokens=True)
+    return run, model
+
+
+def _agreement(service, baseline, candidate):
+    if service == "ner":
+        # Token-level F1 of (start, end, label) triples, with fp32 as the reference
+        matched = sum(len(b & c) for b, c in zip(baseline, candidate))
+        predicted = sum(len(c) for c in candidate)
+        expected = sum(len(b) for b in baseline)
+        if predicted + expected == 0:
+            return {"entity_f1": 1.0}
+        return {"entity_f1": round(2 * matched / (predicted + expected), 4)}
+    if service == "text2vec":
+        import numpy as np
+        cosines = [float(np.dot(b, c) / (np.linalg.norm(b) * np.linalg.norm(c))) for b, c in zip(baseline, candidate)]
+        return {"mean_cosine": round(sum(cosines) / len(cosines), 6), "min_cosine": round(min(cosines), 6)}
+    exact = sum(b == c for b, c in zip(baseline, candidate))
+    return {"exact_match_rate": round(exact / len(baseline), 4)}
+
+
+RUNNERS = {"ner": _ner_runner, "text2vec": _text2vec_runner, "paraphrase": _paraphrase_runner}
+
+
+def check_backend(service, backend, name, texts):
+    """
+    Runs `texts` through the fp32 model and through `backend`, and compares latency, memory and outputs.
+
+    Args:
+    - service (str): "ner", "text2vec" or "paraphrase".
+    - backend (str): Backend to compare against fp32 `torch`.
+    - name (str): Model name.
+    - texts (list): Sample inputs.
+
+    Returns:
+    - dict: Per-backend mean latency (ms per text), stored weight size and peak RSS growth, plus the
+      agreement metrics.
+    """
+    report = {"service": service, "model": name, "texts": len(texts)}
+    outputs = {}
+    for current in ("torch", backend):
+        before = _peak_rss_bytes()
+        run, model = RUNNERS[service](name, current)
+        run(texts[0])  # warm-up
+        outputs[current], latency = _timed(run, texts)
+        report[current] = {"mean_latency_ms": round(latency, 2),
+                           "model_bytes": model_bytes(model),
+                           "peak_rss_growth_bytes": _peak_rss_bytes() - before}
+    report["agreement"] = _agreement(service, outputs["torch"], outputs[backend])
+    return report
+
+
+DEFAULT_MODELS = {
+    "ner": "dbmdz/bert-large-cased-finetuned-conll03-english",
+    "text2vec": "sentence-transformers/multi-qa-MiniLM-L6-cos-v1",
+    "paraphrase": "t5-small",
+}
+
+SAMPLE_TEXTS = [
+    "Jenny Cox washed the dishes from the morning rush in the Silo.",
+    "She had heard it was different in the Mids, where people worked in IT.",
+    "Her husband thought the people at the top and bottom knew their places.",
+    "Riptide Transformation Services runs on port 8019 in Seattle, Washington.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an inference backend against fp32 PyTorch.")
+    parser.add_argument("service", choices=sorted(RUNNERS))
+    parser.add_argument("backend", choices=BACKENDS)
+    parser.add_argument("--model", help="Model name (defaults to the service's default model).")
+    parser.add_argument("--input", help="Text file with one sample per line (defaults to built-in samples).")
+    args = parser.parse_args()
+
+    texts = SAMPLE_TEXTS
+    if args.input:
+        with open(args.input) as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    # Note: peak RSS only grows, so the second backend's figure is an upper bound on its own footprint.
+    report = check_backend(args.service, args.backend, args.model or DEFAULT_MODELS[args.service], texts)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
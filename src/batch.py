@@ -0,0 +1,390 @@
+"""
+batch.py
+========
+
+This module runs NER, vectorization or paraphrasing over a large file offline, without going through HTTP,
+for nightly reprocessing.
+
+It reuses the model loading and post-processing of the service modules, so every output line is what the
+service's `/batch` endpoint would return for that text:
+
+    - The input is read as a stream, a window of `--window` records at a time, so memory use stays flat however
+      large the file is.
+    - Within a window, texts are sorted by length and cut into batches of `--batch-size`, so each batch pads
+      as little as possible. The batches are spread over the worker processes of `worker_pool.py`: the model is
+      loaded once in the parent, shared copy-on-write and every worker is pinned to its own cores. The next
+      window is read and dispatched while the current one finishes, so the workers do not idle between windows.
+    - Results are put back in input order and written one JSON line per input record, as each window
+      completes. Records that cannot be processed (invalid lines, texts over WORD_LIMIT) get an `error` line.
+
+The output file only ever holds whole windows of finished records, so after a crash `--resume` truncates a
+partially written last line, skips as many input records as there are output lines and carries on. The run's
+settings are kept next to the output in `<output>.meta.json`, and a resume with a different service, model,
+input file or field is refused.
+
+Imports:
+    - `argparse`, `csv`, `json` and `concurrent.futures` from the standard library.
+    - `pyarrow.parquet` (imported only for Parquet input; not in requirements.txt).
+
+Functions:
+    - `detect_format`: Input format from the file extension.
+    - `read_records`: Streams `(id, text, error)` records from JSONL, CSV or Parquet.
+    - `length_batches`: Groups the texts of a window into length-sorted batches.
+    - `resume_point`: Truncates a partial last output line and counts the finished records.
+    - `process`: Runs records through a pool and writes the results in input order.
+
+Usage:
+    python -m src.batch ner|text2vec|paraphrase --input docs.jsonl --output results.jsonl \\
+        [--text-field text] [--id-field id] [--model NAME] [--workers N] [--batch-size 64] [--resume]
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+FORMATS = ("jsonl", "csv", "parquet")
+SERVICES = ("ner", "text2vec", "paraphrase")
+
+# Seconds between progress reports on stderr
+PROGRESS_INTERVAL = 10
+
+
+def detect_format(path):
+    """
+    Returns the input format for `path` from its extension: `csv` (also `.tsv`), `parquet` or `jsonl`.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".tsv"):
+        return "csv"
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    return "jsonl"
+
+
+def read_records(path, fmt, text_field="text", id_field="id"):
+    """
+    Streams the records of an input file.
+
+    Args:
+    - path (str): Input file.
+    - fmt (str): `jsonl`, `csv` or `parquet`.
+    - text_field (str): Field holding the text.
+    - id_field (str): Field holding the record ID. Records without one are numbered from 1.
+
+    Yields:
+    - tuple: `(id, text, error)`, with `text` None and `error` set for records that cannot be processed.
+      Blank JSONL lines are skipped.
+    """
+    if fmt == "jsonl":
+        with open(path, "rb") as source:
+            number = 0
+            for raw in source:
+                if not raw.strip():
+                    continue
+                number += 1
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    yield number, None, "Line is not valid JSON."
+                    continue
+                if not isinstance(record, dict) or not isinstance(record.get(text_field), str):
+                    yield number, None, f"Each line must be a JSON object with a '{text_field}' string."
+                    continue
+                yield record.get(id_field, number), record[text_field], None
+    elif fmt == "csv":
+        with open(path, newline="", encoding="utf-8") as source:
+            reader = csv.DictReader(source, delimiter="\t" if path.lower().endswith(".tsv") else ",")
+            if text_field not in (reader.fieldnames or []):
+                raise ValueError(f"The CSV header has no '{text_field}' column.")
+            for number, row in enumerate(reader, 1):
+                text = row.get(text_field)
+                if text is None:
+                    yield row.get(id_field) or number, None, f"Row has no '{text_field}' value."
+                    continue
+                yield row.get(id_field) or number, text, None
+    elif fmt == "parquet":
+        import pyarrow.parquet as parquet
+
+        number = 0
+        source = parquet.ParquetFile(path)
+        columns = [text_field] + ([id_field] if id_field in source.schema_arrow.names else [])
+        for table in source.iter_batches(columns=columns):
+            for row in table.to_pylist():
+                number += 1
+                text = row.get(text_field)
+                if not isinstance(text, str):
+                    yield row.get(id_field, number), None, f"Row has no '{text_field}' string."
+                    continue
+                yield row.get(id_field, number), text, None
+    else:
+        raise ValueError(f"Unknown input format '{fmt}'. Use any of: {', '.join(FORMATS)}.")
+
+
+def length_batches(texts, batch_size):
+    """
+    Groups texts into batches of similar length.
+
+    Args:
+    - texts (dict): Texts by their position in the window.
+    - batch_size (int): Texts per batch.
+
+    Returns:
+    - list: Batches as lists of positions, shortest texts first.
+    """
+    order = sorted(texts, key=lambda index: len(texts[index].split()))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def resume_point(path):
+    """
+    Prepares an output file to be appended to: drops a partially written last line and counts the lines left.
+
+    Returns:
+    - int: Records already written (0 if the file does not exist).
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as output:
+        data = output.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            output.truncate(complete)
+        return data.count(b"\n", 0, complete)
+
+
+def ner_batch(texts, model, structured=False):
+    # Runs in a worker: one pipeline call, then the same span merging and formatting as /ner/batch
+    from . import ner_service
+
+    entities_per_text = ner_service.recognize_many(texts, model)
+    return [{"entities": ner_service.format_entities(text, entities, structured)}
+            for text, entities in zip(texts, entities_per_text)]
+
+
+def text2vec_batch(texts, model):
+    from . import text2vec_service
+
+    return [{"vector": vector.tolist()} for vector in text2vec_service.encode_matrix(texts, model=model)]
+
+
+def paraphrase_batch(texts, model):
+    from . import paraphraser_service
+
+    return [{"paraphrased_text": text} for text in paraphraser_service.paraphrase_many(texts, model_name=model)]
+
+
+def _service_module(service):
+    # Imported on demand, so only the selected service declares (and loads) its models
+    if service == "ner":
+        from . import ner_service
+        return ner_service
+    if service == "text2vec":
+        from . import text2vec_service
+        return text2vec_service
+    from . import paraphraser_service
+    return paraphraser_service
+
+
+def process(records, work, pool, output, word_limit, batch_size=64, window=4096, progress=None):
+    """
+    Runs records through `work` on `pool` and writes one result line per record, in input order.
+
+    Args:
+    - records (iterable): `(id, text, error)` tuples, see `read_records`.
+    - work (callable): Takes a list of texts and returns one result dict per text. Must be a picklable
+      top-level function (e.g. a `functools.partial` of one) for a process pool.
+    - pool (Executor): Where the batches run.
+    - output (file): Text file the JSON lines are written to; flushed and synced after every window.
+    - word_limit (int): Texts with more words get an `error` line instead of running.
+    - batch_size (int): Texts per call to `work`.
+    - window (int): Records read, sorted and dispatched together.
+    - progress (callable): Called with the counters after every window.
+
+    Returns:
+    - dict: `records`, `errors`, `seconds` and `docs_per_second` for this run.
+    """
+    stats = {"records": 0, "errors": 0, "seconds": 0.0, "docs_per_second": 0.0}
+    started = time.perf_counter()
+    # Up to two windows in flight: one finishing, the next already queued on the workers
+    inflight = deque()
+
+    def dispatch(chunk):
+        results = [None] * len(chunk)
+        texts = {}
+        for index, (record_id, text, error) in enumerate(chunk):
+            if error is None and len(text.split()) > word_limit:
+                error = f"Input text exceeds {word_limit} words. Please provide shorter text."
+            if error is None:
+                texts[index] = text
+            else:
+                results[index] = {"error": error}
+        futures = [(batch, pool.submit(work, [texts[index] for index in batch]))
+                   for batch in length_batches(texts, batch_size)]
+        inflight.append((chunk, results, futures))
+
+    def complete():
+        chunk, results, futures = inflight.popleft()
+        for batch, future in futures:
+            for index, result in zip(batch, future.result()):
+                results[index] = result
+        lines = []
+        for (record_id, _, _), result in zip(chunk, results):
+            stats["errors"] += "error" in result
+            lines.append(json.dumps({"id": record_id, **result}) + "\n")
+        output.write("".join(lines))
+        # On disk before the next window, so a resume never skips records whose results were lost
+        output.flush()
+        os.fsync(output.fileno())
+        stats["records"] += len(chunk)
+        stats["seconds"] = time.perf_counter() - started
+        stats["docs_per_second"] = round(stats["records"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        if progress is not None:
+            progress(stats)
+
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= window:
+            dispatch(chunk)
+            chunk = []
+            if len(inflight) > 1:
+                complete()
+    if chunk:
+        dispatch(chunk)
+    while inflight:
+        complete()
+    return stats
+
+
+def _run_settings(args, model_name):
+    stat = os.stat(args.input)
+    return {"service": args.service, "model": model_name, "input": os.path.abspath(args.input),
+            "input_size": stat.st_size, "input_mtime": stat.st_mtime, "format": args.format,
+            "text_field": args.text_field, "id_field": args.id_field,
+            "structured": args.structured and args.service == "ner"}
+
+
+def _report(every=PROGRESS_INTERVAL):
+    last = [0.0]
+
+    def progress(current):
+        if current["seconds"] - last[0] >= every:
+            last[0] = current["seconds"]
+            print(f"{current['records']} records, {current['docs_per_second']} docs/s", file=sys.stderr)
+    return progress
+
+
+def run(args):
+    """
+    Runs the command line `args`; see `main()`.
+
+    Returns:
+    - dict: The counters of `process()` plus `skipped`, the records a resumed run found already done.
+    """
+    from .model_registry import registry, ModelNotAllowed
+    from .backends import registry_name
+    from . import worker_pool
+
+    module = _service_module(args.service)
+    try:
+        model = module.resolve_model(args.model)
+    except ModelNotAllowed as exc:
+        raise SystemExit(str(exc))
+    backend = {"ner": "NER_BACKEND", "text2vec": "TEXT2VEC_BACKEND", "paraphrase": "PARAPHRASE_BACKEND"}[args.service]
+    settings = _run_settings(args, registry_name(model, getattr(module, backend)))
+
+    meta_path = args.output + ".meta.json"
+    skipped = 0
+    if os.path.exists(args.output) or os.path.exists(meta_path):
+        if not args.resume:
+            raise SystemExit(f"{args.output} already exists; pass --resume to continue it or remove it first.")
+        try:
+            with open(meta_path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            raise SystemExit(f"{meta_path} is missing or unreadable; cannot tell what {args.output} was made from.")
+        changed = [key for key in settings if previous.get(key) != settings[key]]
+        if changed:
+            raise SystemExit(f"Cannot resume: {', '.join(changed)} differ from the run that wrote {args.output}.")
+        skipped = resume_point(args.output)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(settings, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    if args.stub_models:
+        from . import stub_models
+        stub_models.install(registry)
+
+    work = {"ner": partial(ner_batch, model=model, structured=args.structured),
+            "text2vec": partial(text2vec_batch, model=model),
+            "paraphrase": partial(paraphrase_batch, model=model)}[args.service]
+
+    # Load (and pin) the selected model before any worker forks, so they all share one copy
+    registry.load_group(f"{args.service}:{model}", pin=True)
+    if args.workers > 0:
+        pool = worker_pool.start(workers=args.workers, torch_threads=args.torch_threads)
+    else:
+        pool = ThreadPoolExecutor(max_workers=1)
+
+    records = read_records(args.input, args.format, args.text_field, args.id_field)
+    for _ in range(skipped):
+        if next(records, None) is None:
+            break
+    if skipped:
+        print(f"Resuming after {skipped} records.", file=sys.stderr)
+    try:
+        with open(args.output, "a", encoding="utf-8") as output:
+            stats = process(records, work, pool, output, module.WORD_LIMIT, args.batch_size, args.window,
+                            _report(args.progress_seconds))
+    finally:
+        if args.workers > 0:
+            worker_pool.shutdown()
+        else:
+            pool.shutdown()
+    stats["skipped"] = skipped
+    return stats
+
+
+def _default_workers():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run NER, vectorization or paraphrasing over a file offline.")
+    parser.add_argument("service", choices=SERVICES)
+    parser.add_argument("--input", required=True, help="JSONL, CSV/TSV or Parquet file.")
+    parser.add_argument("--output", required=True, help="JSONL file with one result per input record, in order.")
+    parser.add_argument("--format", choices=FORMATS, help="Input format (defaults to the file extension).")
+    parser.add_argument("--text-field", default="text", help="Field or column holding the text.")
+    parser.add_argument("--id-field", default="id", help="Field or column holding the record ID.")
+    parser.add_argument("--model", help="One of the service's allowed models (defaults to its configured model).")
+    parser.add_argument("--structured", action="store_true", help="NER only: entities as objects with offsets.")
+    parser.add_argument("--workers", type=int, default=_default_workers(),
+                        help="Worker processes (defaults to one per available core; 0 runs in this process).")
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="torch threads per worker (defaults to one per core the worker is pinned to).")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per forward pass.")
+    parser.add_argument("--window", type=int, default=0,
+                        help="Records sorted by length together (defaults to 16 batches per worker).")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run into the same output.")
+    parser.add_argument("--progress-seconds", type=float, default=PROGRESS_INTERVAL,
+                        help="Seconds between progress reports.")
+    parser.add_argument("--stub-models", action="store_true",
+                        help="Use the deterministic stub models (see stub_models.py), e.g. to try a run without downloads.")
+    args = parser.parse_args()
+    args.format = args.format or detect_format(args.input)
+    args.window = args.window or args.batch_size * max(args.workers, 1) * 16
+
+    stats = run(args)
+    print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+batching.py
+===========
+
+This module provides a dynamic micro-batching layer that sits in front of a model.
+
+Requests that arrive within a short window are gathered, grouped by sequence length to limit
+padding waste, and sent through the model in a single batched forward pass. Each caller awaits
+its own result and never sees the other members of the batch.
+
+Every item keeps the lane and deadline of the request that submitted it (see `deadlines.py`). Items whose
+deadline has passed, or whose caller has gone away, are dropped before the batch is formed; a batch runs in
+the most urgent lane of its items until the last of their deadlines, and is cancelled (stopping a running
+`generate`) once every one of its callers has gone away.
+
+Imports:
+    - `asyncio` for futures and timers on the running event loop.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - BATCH_WINDOW_MS: How long to wait for more requests after the first one arrives (default is 5 ms).
+    - BATCH_MAX_SIZE: Maximum number of items sent to the model in one call (default is 16).
+    - BATCH_LENGTH_BUCKET: Width, in words, of the length buckets used to group items (default is 32).
+    - BATCH_MAX_TEXTS: Maximum number of texts accepted by a single `/batch` request (default is 256).
+
+Classes:
+    - `MicroBatcher`: Collects submitted items and runs them through a batch function.
+
+"""
+
+import asyncio
+from decouple import config
+from . import deadlines
+from .deadlines import DeadlineExceeded
+from .metrics import BATCH_SIZE
+
+BATCH_WINDOW_MS = config('BATCH_WINDOW_MS', default=5, cast=float)
+BATCH_MAX_SIZE = config('BATCH_MAX_SIZE', default=16, cast=int)
+BATCH_LENGTH_BUCKET = config('BATCH_LENGTH_BUCKET', default=32, cast=int)
+BATCH_MAX_TEXTS = config('BATCH_MAX_TEXTS', default=256, cast=int)
+
+
+class MicroBatcher:
+    """
+    Gathers items submitted within `window_ms` (up to `max_batch_size`) and runs them together.
+
+    `batch_fn` is a blocking callable that takes a list of items and returns a list of results
+    in the same order. It is run on `executor` (an `InferenceExecutor`), or the event loop's
+    default executor when none is given, so the loop stays free while the model works.
+
+    Args:
+    - batch_fn (callable): Blocking function mapping a list of items to a list of results.
+    - window_ms (float): Collection window in milliseconds. 0 flushes on the next loop iteration.
+    - max_batch_size (int): Largest batch handed to `batch_fn`.
+    - length_bucket (int): Items whose lengths fall in the same `length // length_bucket` bucket
+      are batched together. 0 disables bucketing.
+    - executor (InferenceExecutor): Pool that runs `batch_fn`.
+    - name (str): Service label for the batch size metric. Defaults to the executor's name.
+    """
+
+    def __init__(self, batch_fn, window_ms=None, max_batch_size=None, length_bucket=None, executor=None, name=None):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.name = name or (executor.name.lower() if executor is not None else batch_fn.__name__)
+        self.window = (BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000.0
+        self.max_batch_size = max(1, BATCH_MAX_SIZE if max_batch_size is None else max_batch_size)
+        self.length_bucket = BATCH_LENGTH_BUCKET if length_bucket is None else length_bucket
+        self._loop = None
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, item, length=0):
+        """
+        Queues `item` for the next batch and waits for its result.
+
+        Args:
+        - item: Value passed to `batch_fn` as one element of its input list.
+        - length (int): Sequence length used for bucketing, e.g. the word count.
+
+        Returns:
+        - The element of `batch_fn`'s output that corresponds to `item`.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # A new event loop (e.g. a fresh test client) cannot reuse futures from the old one.
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+
+        future = loop.create_future()
+        self._pending.append((length, item, future, deadlines.current_lane(), deadlines.current_deadline()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        live = []
+        for entry in pending:
+            future, deadline = entry[2], entry[4]
+            if future.done():
+                continue
+            if deadlines.expired(deadline):
+                future.set_exception(DeadlineExceeded(self.name))
+                continue
+            live.append(entry)
+        for group in self._group(live):
+            task = self._loop.create_task(self._run(group))
+            futures = [entry[2] for entry in group]
+            for future in futures:
+                future.add_done_callback(lambda _, futures=futures, task=task: self._abandon(futures, task))
+
+    def _abandon(self, futures, task):
+        # Nobody is waiting for this batch any more; stop it (a running call is asked to stop early)
+        if all(future.cancelled() for future in futures) and not task.done():
+            task.cancel()
+
+    def _group(self, pending):
+        """
+        Splits pending entries into batches of similar length, at most `max_batch_size` each.
+        """
+        if self.length_bucket > 0:
+            buckets = {}
+            for entry in pending:
+                buckets.setdefault(entry[0] // self.length_bucket, []).append(entry)
+            groups = [buckets[key] for key in sorted(buckets)]
+        else:
+            groups = [pending]
+
+        for group in groups:
+            for start in range(0, len(group), self.max_batch_size):
+                yield group[start:start + self.max_batch_size]
+
+    async def _run(self, group):
+        items = [entry[1] for entry in group]
+        futures = [entry[2] for entry in group]
+        # The most urgent lane of the batch, until the last deadline among its items
+        lane = "interactive" if any(entry[3] == "interactive" for entry in group) else "bulk"
+        deadline = None if any(entry[4] is None for entry in group) else max(entry[4] for entry in group)
+        BATCH_SIZE.labels(self.name).observe(len(items))
+        try:
+            if self.executor is not None:
+                results = await self.executor.run(self.batch_fn, items, lane=lane, deadline=deadline)
+            else:
+                results = await self._loop.run_in_executor(None, self.batch_fn, items)
+        except Exception as exc:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,288 @@
+"""
+benchmark.py
+============
+
+This module measures the latency and throughput of the API and UI routes.
+
+Each route is driven with a fixed number of requests at one or more concurrency levels, using a seeded mix of
+input lengths so runs are reproducible. For every (route, concurrency) pair it reports p50/p95/p99/mean/max
+latency, requests per second and error counts, and writes them to a JSON file that can be compared with the
+result of another commit.
+
+Requests run in-process against the ASGI app by default, with either the real models or the deterministic
+stubs from `stub_models.py` (`--models stub`), which need no downloads and isolate the web, serialization and
+post-processing layers. With `--url` they go over HTTP to a running instance instead.
+
+Imports:
+    - `asyncio`, `httpx` and `numpy` for driving requests and computing percentiles.
+
+Functions:
+    - `make_texts`: Builds a seeded list of texts following a length mix.
+    - `summarize`: Computes latency percentiles and throughput for one run.
+    - `run_route`: Drives one route at one concurrency level.
+    - `compare`: Lists the changes between two result files.
+
+Usage:
+    python -m src.benchmark --models stub --routes ner,text2vec,paraphrase,ui-ner --concurrency 1,8,32 \\
+        --requests 200 --lengths 16:0.6,128:0.3,384:0.1 --output bench.json [--compare baseline.json]
+
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import zlib
+import httpx
+import numpy as np
+
+# Path and whether the body is JSON (API routes) or a form (UI routes)
+ROUTES = {
+    "ner": ("/ner/", "json"),
+    "text2vec": ("/text2vec/", "json"),
+    "paraphrase": ("/paraphrase/", "json"),
+    "ui-ner": ("/nertags/", "form"),
+    "ui-vectors": ("/vectors/", "form"),
+    "ui-paraphraser": ("/paraphraser/", "form"),
+}
+
+# Plain words plus some capitalized ones, so NER has entities to find
+VOCABULARY = ("the of and to in a is that for it as was with be by on not he this are or his from at which but "
+              "have an they you were her she there been one all we their has would when if so no what up out "
+              "about into than them can only other new some could time these two may then do first any my now "
+              "such like our over man me even most made after also did many before must through back years where "
+              "much your way well down should because each just those people how too little state good very make "
+              "world still own see men work long get here between both life being under never day same another "
+              "know while last might us great old year off come since against go came right used take three").split()
+NAMES = ("Jenny Cox", "Seattle", "Washington", "Riptide", "Silo", "Mids", "Up Top", "Alice Moreno", "Acme Corp",
+         "Pacific Ocean", "Tuesday", "Dr. Patel")
+
+
+def parse_lengths(spec):
+    """
+    Parses a length mix such as "16:0.6,128:0.3,384:0.1" into `[(words, weight), ...]`.
+    """
+    mix = []
+    for part in spec.split(","):
+        words, _, weight = part.partition(":")
+        mix.append((int(words), float(weight or 1)))
+    return mix
+
+
+def make_texts(count, lengths, seed=0):
+    """
+    Builds `count` distinct texts whose word counts follow the `lengths` mix.
+
+    Args:
+    - count (int): Number of texts.
+    - lengths (list): `(words, weight)` pairs.
+    - seed (int): Seed, so the same arguments always give the same texts.
+
+    Returns:
+    - list: The texts.
+    """
+    rng = random.Random(seed)
+    sizes = rng.choices([words for words, _ in lengths], weights=[weight for _, weight in lengths], k=count)
+    texts = []
+    for size in sizes:
+        words = []
+        while len(words) < size:
+            if rng.random() < 0.08:
+                words.extend(rng.choice(NAMES).split())
+            else:
+                words.append(rng.choice(VOCABULARY))
+        texts.append(" ".join(words[:size]) + ".")
+    return texts
+
+
+def summarize(latencies, errors, seconds):
+    """
+    Computes the summary for one run.
+
+    Args:
+    - latencies (list): Seconds per successful request.
+    - errors (dict): Count per non-200 status (or exception name).
+    - seconds (float): Wall-clock time of the run.
+
+    Returns:
+    - dict: `requests`, `errors`, `rps` and p50/p95/p99/mean/max latency in milliseconds.
+    """
+    summary = {"requests": len(latencies) + sum(errors.values()), "errors": errors,
+               "rps": round(len(latencies) / seconds, 2) if seconds else 0.0}
+    if latencies:
+        millis = np.asarray(latencies) * 1000
+        p50, p95, p99 = np.percentile(millis, [50, 95, 99])
+        summary.update({"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+                        "p99_ms": round(float(p99), 2), "mean_ms": round(float(millis.mean()), 2),
+                        "max_ms": round(float(millis.max()), 2)})
+    return summary
+
+
+async def run_route(client, route, texts, concurrency):
+    """
+    Sends one request per text to `route` with `concurrency` requests in flight.
+
+    Returns:
+    - dict: The summary from `summarize`.
+    """
+    path, body = ROUTES[route]
+    queue = iter(texts)
+    latencies = []
+    errors = {}
+
+    async def worker():
+        for text in queue:
+            start = time.perf_counter()
+            try:
+                if body == "json":
+                    response = await client.post(path, json={"text": text})
+                else:
+                    response = await client.post(path, data={"text": text})
+                outcome = response.status_code
+            except Exception as exc:
+                outcome = type(exc).__name__
+            if outcome == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Lists the change in p50, p95, p99 and throughput for every (route, concurrency) present in both files.
+
+    Returns:
+    - list: Dicts with `route`, `concurrency` and, per metric, the baseline value, the new value and the
+      relative change.
+    """
+    previous = {(r["route"], r["concurrency"]): r for r in baseline["results"]}
+    changes = []
+    for result in results["results"]:
+        old = previous.get((result["route"], result["concurrency"]))
+        if old is None:
+            continue
+        change = {"route": result["route"], "concurrency": result["concurrency"]}
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            if metric in old and metric in result and old[metric]:
+                change[metric] = {"baseline": old[metric], "current": result[metric],
+                                  "change": round((result[metric] - old[metric]) / old[metric], 4)}
+        changes.append(change)
+    return changes
+
+
+def _in_process_client(models, stub_latency_ms):
+    # Importing main only declares the models; stubs must be installed before anything loads them
+    from .model_registry import registry
+    from . import stub_models
+    from . import main
+
+    if models == "stub":
+        stub_models.install(registry, stub_latency_ms)
+    main.load_models()
+    transport = httpx.ASGITransport(app=main.app)
+    return main, httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers={"X-API-KEY": main.API_KEY},
+                                   timeout=None)
+
+
+async def run(args):
+    routes = args.routes.split(",")
+    for route in routes:
+        if route not in ROUTES:
+            raise SystemExit(f"Unknown route '{route}'. Use any of: {', '.join(ROUTES)}.")
+    concurrencies = [int(level) for level in args.concurrency.split(",")]
+    lengths = parse_lengths(args.lengths)
+
+    main = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, headers={"X-API-KEY": args.api_key or ""},
+                                   verify=not args.insecure, timeout=None)
+    else:
+        main, client = _in_process_client(args.models, args.stub_latency_ms)
+        await main.services.start()
+
+    results = []
+    try:
+        for route in routes:
+            for concurrency in concurrencies:
+                # Fresh texts per run, so the embedding cache does not turn later runs into cache benchmarks
+                seed = zlib.crc32(f"{args.seed}:{route}:{concurrency}".encode())
+                warmup = make_texts(args.warmup, lengths, seed + 1)
+                if warmup:
+                    await run_route(client, route, warmup, min(concurrency, len(warmup)))
+                summary = await run_route(client, route, make_texts(args.requests, lengths, seed), concurrency)
+                summary.update({"route": route, "concurrency": concurrency})
+                results.append(summary)
+                print(f"{route:>15} c={concurrency:<4} rps={summary['rps']:<8} "
+                      f"p50={summary.get('p50_ms', '-')} p95={summary.get('p95_ms', '-')} "
+                      f"p99={summary.get('p99_ms', '-')} errors={summary['errors'] or 0}", file=sys.stderr)
+    finally:
+        await client.aclose()
+        if main is not None:
+            await main.services.close()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "target": args.url or f"in-process ({args.models} models)",
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "lengths": args.lengths,
+            "seed": args.seed,
+            "stub_latency_ms": args.stub_latency_ms,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latency and throughput of the API and UI routes.")
+    parser.add_argument("--routes", default="ner,text2vec,paraphrase",
+                        help=f"Comma-separated routes: {', '.join(ROUTES)}.")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per route and concurrency level.")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests sent first.")
+    parser.add_argument("--lengths", default="16:0.6,128:0.3,384:0.1",
+                        help="Input length mix as words:weight pairs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--models", choices=("stub", "real"), default="stub",
+                        help="In-process only: deterministic stub models or the configured real models.")
+    parser.add_argument("--stub-latency-ms", type=float, default=0, help="Time each stub forward pass sleeps.")
+    parser.add_argument("--url", help="Benchmark a running instance over HTTP instead of in-process.")
+    parser.add_argument("--api-key", help="X-API-KEY for --url.")
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS verification for --url.")
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = compare(results, json.load(f))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
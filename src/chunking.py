@@ -0,0 +1,150 @@
+"""
+chunking.py
+===========
+
+This module provides token-aware chunking so long documents can be processed instead of rejected.
+
+Text is split on model tokens (not whitespace words) using the model's fast tokenizer, with a configurable
+overlap between consecutive chunks. Every chunk keeps its character span in the original text, so results
+can be mapped back: vectors are pooled into one document vector and entities are stitched together with
+offsets relative to the whole document.
+
+Imports:
+    - `numpy` for vector pooling.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - CHUNK_LONG_TEXTS: Enables chunking instead of `WORD_LIMIT` rejection by default (default is False).
+      Requests can override it with their `chunking` field.
+    - CHUNK_MAX_TOKENS: Maximum tokens per chunk; capped at the model's own limit (default is 256).
+    - CHUNK_OVERLAP_TOKENS: Tokens shared by consecutive chunks (default is 32).
+    - CHUNK_MAX_CHUNKS: Largest number of chunks accepted for one document (default is 64).
+    - CHUNK_POOLING: How chunk vectors are combined, `mean` or `weighted` by token count (default is `mean`).
+
+Classes:
+    - `Chunk`: A piece of the input text and its character span.
+
+Functions:
+    - `chunking_requested`: Resolves a request's `chunking` field against the configured default.
+    - `chunk_text`: Splits text into overlapping token windows.
+    - `pool_vectors`: Combines chunk vectors into a single document vector.
+    - `stitch_entities`: Maps chunk-level entities back onto the document and drops overlap duplicates.
+
+"""
+
+import numpy as np
+from decouple import config
+
+CHUNK_LONG_TEXTS = config('CHUNK_LONG_TEXTS', default=False, cast=bool)
+CHUNK_MAX_TOKENS = config('CHUNK_MAX_TOKENS', default=256, cast=int)
+CHUNK_OVERLAP_TOKENS = config('CHUNK_OVERLAP_TOKENS', default=32, cast=int)
+CHUNK_MAX_CHUNKS = config('CHUNK_MAX_CHUNKS', default=64, cast=int)
+CHUNK_POOLING = config('CHUNK_POOLING', default="mean")
+
+
+class Chunk:
+    """
+    A window of the input text.
+
+    Attributes:
+    - text (str): The chunk's text, sliced from the original.
+    - start (int): Character offset of the chunk in the original text.
+    - end (int): Character offset just past the chunk.
+    - num_tokens (int): Number of model tokens in the chunk.
+    """
+
+    def __init__(self, text, start, end, num_tokens):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.num_tokens = num_tokens
+
+
+def chunking_requested(flag):
+    """
+    Returns whether a request should be chunked; `None` means "use CHUNK_LONG_TEXTS".
+    """
+    return CHUNK_LONG_TEXTS if flag is None else flag
+
+
+def chunk_text(tokenizer, text, max_tokens=None, overlap=None):
+    """
+    Splits `text` into windows of at most `max_tokens` tokens that overlap by `overlap` tokens.
+
+    Args:
+    - tokenizer: A fast (Rust-backed) Hugging Face tokenizer; it must support `return_offsets_mapping`.
+    - text (str): Input text.
+    - max_tokens (int): Tokens per chunk, excluding special tokens.
+    - overlap (int): Tokens repeated at the start of each following chunk.
+
+    Returns:
+    - list: `Chunk` objects in document order. Text that fits in one window yields a single chunk.
+    """
+    max_tokens = CHUNK_MAX_TOKENS if max_tokens is None else max_tokens
+    overlap = CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    overlap = min(overlap, max_tokens - 1)
+
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return [Chunk(text, 0, len(text), len(offsets))]
+
+    chunks = []
+    step = max_tokens - overlap
+    for first in range(0, len(offsets), step):
+        window = offsets[first:first + max_tokens]
+        start, end = window[0][0], window[-1][1]
+        chunks.append(Chunk(text[start:end], start, end, len(window)))
+        if first + max_tokens >= len(offsets):
+            break
+    return chunks
+
+
+def pool_vectors(vectors, chunks, pooling=None):
+    """
+    Combines chunk vectors into one document vector.
+
+    Args:
+    - vectors (list): One vector per chunk.
+    - chunks (list): The `Chunk` objects the vectors were computed from.
+    - pooling (str): `mean` for a plain average, `weighted` to weight chunks by token count.
+
+    Returns:
+    - list: The pooled vector.
+    """
+    pooling = CHUNK_POOLING if pooling is None else pooling
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if pooling == "weighted":
+        weights = np.asarray([chunk.num_tokens for chunk in chunks], dtype=np.float32)
+        pooled = (matrix * weights[:, None]).sum(axis=0) / weights.sum()
+    elif pooling == "mean":
+        pooled = matrix.mean(axis=0)
+    else:
+        raise ValueError(f"Unknown pooling mode '{pooling}'. Use 'mean' or 'weighted'.")
+    return pooled.tolist()
+
+
+def stitch_entities(chunks, entities_per_chunk):
+    """
+    Shifts chunk-relative entity offsets onto the whole document and removes overlap duplicates.
+
+    Tokens in an overlap region are recognized by both neighbouring chunks; the prediction with the
+    higher score is kept.
+
+    Args:
+    - chunks (list): `Chunk` objects in document order.
+    - entities_per_chunk (list): Raw pipeline entities (with `start`/`end`) for each chunk.
+
+    Returns:
+    - list: Entities ordered by document offset.
+    """
+    by_span = {}
+    for chunk, entities in zip(chunks, entities_per_chunk):
+        for entity in entities:
+            entity = dict(entity)
+            entity['start'] += chunk.start
+            entity['end'] += chunk.start
+            span = (entity['start'], entity['end'])
+            kept = by_span.get(span)
+            if kept is None or entity['score'] > kept['score']:
+                by_span[span] = entity
+    return [by_span[span] for span in sorted(by_span)]
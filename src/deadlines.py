@@ -0,0 +1,205 @@
+"""
+deadlines.py
+============
+
+This module carries a request's deadline and priority lane down to the inference executors, and lets work be
+dropped once nobody is waiting for it any more.
+
+Every request runs in one of two lanes. `interactive` work (single texts, the UI pages) is scheduled before
+`bulk` work (`/batch` endpoints, vectorization jobs), so a backfill saturating a model does not show up in
+interactive tail latency (see `executors.py`). A request may also carry a deadline: work that is still
+queued when its deadline passes is dropped with `DeadlineExceeded` (a 504), and a `generate` call that is
+running when it passes stops early.
+
+Both travel in context variables, so they reach the executors through the services, the micro-batcher and the
+result cache without being passed around explicitly. They are set from the request headers by
+`DeadlineMiddleware` and from the request body by `request_options()`; the body wins.
+
+Imports:
+    - `asyncio`, `contextvars` and `time` from the standard library.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - REQUEST_DEADLINE_MS: Deadline applied to requests that set none (default is 0, meaning no deadline).
+    - REQUEST_DEADLINE_MAX_MS: Upper bound for requested deadlines (default is 0, meaning no bound).
+    - DISCONNECT_POLL_MS: How often long-running endpoints check whether their client is still connected
+      (default is 200).
+
+Request Headers:
+    - `X-Priority`: `interactive` or `bulk`.
+    - `X-Deadline-Ms`: Milliseconds the client is willing to wait, counted from when the request arrives.
+
+Classes:
+    - `DeadlineExceeded`: Raised when a request's deadline passes before its work is done.
+    - `ClientDisconnected`: Raised when a request is abandoned because its client went away.
+    - `DeadlineMiddleware`: Reads the headers above into the request's context.
+
+Functions:
+    - `request_options`: Applies a request body's `priority` and `deadline_ms` fields.
+    - `current_lane` / `current_deadline`: The lane and deadline of the running request.
+    - `check_deadline`: Raises `DeadlineExceeded` once the deadline has passed.
+    - `cancelled`: Whether the work running on this thread should stop (its caller is gone or out of time).
+    - `cancel_on_disconnect`: Runs a coroutine and cancels it when the client disconnects.
+
+"""
+
+import asyncio
+import contextvars
+import time
+from typing import Literal
+from decouple import config
+
+REQUEST_DEADLINE_MS = config('REQUEST_DEADLINE_MS', default=0, cast=float)
+REQUEST_DEADLINE_MAX_MS = config('REQUEST_DEADLINE_MAX_MS', default=0, cast=float)
+DISCONNECT_POLL_MS = config('DISCONNECT_POLL_MS', default=200, cast=float)
+
+LANES = ("interactive", "bulk")
+
+# Type of the `priority` field of request bodies
+Priority = Literal["interactive", "bulk"]
+
+_lane = contextvars.ContextVar("inference_lane", default=None)
+_deadline = contextvars.ContextVar("inference_deadline", default=None)
+# Set by the executor on the thread running a call; see `cancelled()`
+_stop = contextvars.ContextVar("inference_stop", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request's deadline passes while its work is queued or running.
+
+    Attributes:
+    - service (str): Name of the service the work was for.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        super().__init__(f"The {service} request did not complete within its deadline.")
+
+
+class ClientDisconnected(Exception):
+    """
+    Raised by `cancel_on_disconnect` once the client has gone away and its work was cancelled.
+
+    Attributes:
+    - service (str): Name of the service the work was for.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        super().__init__(f"The client of a {service} request disconnected.")
+
+
+def _deadline_from(milliseconds):
+    if REQUEST_DEADLINE_MAX_MS > 0:
+        milliseconds = min(milliseconds, REQUEST_DEADLINE_MAX_MS)
+    return time.monotonic() + milliseconds / 1000.0
+
+
+def request_options(priority=None, deadline_ms=None, default_lane=None):
+    """
+    Applies a request body's `priority` and `deadline_ms` to the rest of the request.
+
+    Args:
+    - priority (str): `interactive` or `bulk`, or None to keep the header's lane.
+    - deadline_ms (float): Milliseconds from now, or None to keep the header's deadline.
+    - default_lane (str): Lane for requests that chose none in the body or the headers, e.g. `bulk` for
+      `/batch` endpoints.
+    """
+    if priority is not None:
+        _lane.set(priority)
+    elif _lane.get() is None and default_lane is not None:
+        _lane.set(default_lane)
+    if deadline_ms is not None:
+        _deadline.set(_deadline_from(deadline_ms))
+
+
+def current_lane():
+    return _lane.get() or "interactive"
+
+
+def current_deadline():
+    """
+    Returns the running request's deadline as a `time.monotonic()` value, or None.
+    """
+    return _deadline.get()
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def check_deadline(service, deadline=None):
+    """
+    Raises `DeadlineExceeded` if `deadline` (by default the running request's) has passed.
+    """
+    if expired(current_deadline() if deadline is None else deadline):
+        raise DeadlineExceeded(service)
+
+
+def cancelled():
+    """
+    Whether the work running on this thread should stop: its callers have all gone away or its deadline has
+    passed. Checked between decoding steps by `generate` (see `paraphraser_service.py`).
+    """
+    stop = _stop.get()
+    return (stop is not None and stop.is_set()) or expired(_deadline.get())
+
+
+def bind(context, stop, deadline):
+    """
+    Prepares `context` (a copy of the caller's) for a call the executor runs on another thread.
+    """
+    context.run(_stop.set, stop)
+    context.run(_deadline.set, deadline)
+
+
+async def cancel_on_disconnect(service, http_request, awaitable):
+    """
+    Awaits `awaitable`, cancelling it if the client disconnects first, so a client that gave up (e.g. an
+    HTTP client that timed out) does not keep a model busy. Without `http_request` it is simply awaited.
+
+    Raises:
+    - ClientDisconnected: If the client disconnected; nobody is left to read the response.
+    """
+    task = asyncio.ensure_future(awaitable)
+    if http_request is None:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait([task], timeout=DISCONNECT_POLL_MS / 1000.0)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected(service)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class DeadlineMiddleware:
+    """
+    Sets the request's lane and deadline from the `X-Priority` and `X-Deadline-Ms` headers (or
+    REQUEST_DEADLINE_MS). Malformed values are ignored.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        priority = headers.get(b"x-priority", b"").decode("latin-1").strip().lower()
+        if priority in LANES:
+            _lane.set(priority)
+        try:
+            milliseconds = float(headers.get(b"x-deadline-ms", b"") or REQUEST_DEADLINE_MS)
+        except ValueError:
+            milliseconds = REQUEST_DEADLINE_MS
+        if milliseconds > 0:
+            _deadline.set(_deadline_from(milliseconds))
+        await self.app(scope, receive, send)
@@ -0,0 +1,245 @@
+"""
+embedding_cache.py
+==================
+
+This module provides a content-addressed cache for text embeddings.
+
+Entries are keyed by a SHA-256 hash of the model name and the normalized text, so re-imports, retries and
+duplicate boilerplate paragraphs skip the SentenceTransformer forward pass. The model name is the registry name
+(see `backends.registry_name`), which includes the backend, so changing `TEXT2VEC_MODEL` or `TEXT2VEC_BACKEND`
+can never return a vector produced by another model or backend.
+
+Imports:
+    - Standard library modules for hashing, normalization, locking and sqlite storage.
+    - `numpy` for compact float32 storage of vectors.
+    - `run_in_threadpool` to keep the disk tier off the event loop.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - EMBEDDING_CACHE_SIZE: Number of vectors kept in the in-memory LRU tier (default is 10000, 0 disables it).
+    - EMBEDDING_CACHE_PATH: Path of the sqlite file used as the persistent tier (default is empty, which disables it).
+
+Classes:
+    - `EmbeddingCache`: Two-tier (memory LRU + optional sqlite) embedding cache with hit/miss counters.
+
+Functions:
+    - `normalize_text`: Normalizes text before hashing so trivially different copies share an entry.
+
+"""
+
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from decouple import config
+
+EMBEDDING_CACHE_SIZE = config('EMBEDDING_CACHE_SIZE', default=10000, cast=int)
+EMBEDDING_CACHE_PATH = config('EMBEDDING_CACHE_PATH', default="")
+
+# Keys per `IN (...)` query; sqlite's default limit on host parameters is 999
+SQLITE_MAX_PARAMETERS = 900
+
+
+def normalize_text(text):
+    """
+    Normalizes unicode and collapses whitespace.
+
+    Args:
+    - text (str): Input text.
+
+    Returns:
+    - str: Normalized text.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Caches embeddings in a bounded in-memory LRU and, optionally, a sqlite file that survives restarts.
+
+    Lookups try memory first, then disk (promoting disk hits into memory). The disk tier remembers which
+    model wrote it and is cleared when opened with a different model, so stale vectors do not take up space.
+
+    The disk tier is sqlite, so its reads and writes block. Async code uses `lookup_async()` and
+    `put_many_async()`, which keep only the memory tier on the event loop and run the disk tier on a thread;
+    writes are batched into one commit per call.
+
+    Args:
+    - model_name (str): Name of the model producing the vectors; part of every key.
+    - max_entries (int): Capacity of the memory tier.
+    - path (str): sqlite file for the disk tier, or empty to keep the cache in memory only.
+    """
+
+    def __init__(self, model_name, max_entries=None, path=None):
+        self.model_name = model_name
+        self.max_entries = EMBEDDING_CACHE_SIZE if max_entries is None else max_entries
+        self.path = EMBEDDING_CACHE_PATH if path is None else path
+        # The memory tier is used from the event loop; the disk tier has its own lock so it never holds that up
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.path:
+            self._open_disk()
+
+    def _open_disk(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB)")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if row is None or row[0] != self.model_name:
+            # Written by another model: nothing in it can be hit any more
+            self._db.execute("DELETE FROM vectors")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model', ?)", (self.model_name,))
+        self._db.commit()
+
+    def key(self, text):
+        """
+        Returns the content address of `text` for this cache's model.
+        """
+        payload = self.model_name + "\0" + normalize_text(text)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        """
+        Looks up the vector for `text`.
+
+        Returns:
+        - numpy.ndarray or None: The cached float32 vector, or None on a miss.
+        """
+        return self.lookup([text])[0]
+
+    def lookup(self, texts):
+        """
+        Looks up the vectors for `texts` in both tiers. Blocks on the disk tier; from async code use
+        `lookup_async()`.
+
+        Returns:
+        - list: The cached float32 vector of each text, or None for a miss.
+        """
+        keys = [self.key(text) for text in texts]
+        memory, remaining = self._from_memory(keys)
+        disk = self._from_disk(remaining) if remaining else {}
+        return self._results(keys, memory, disk)
+
+    async def lookup_async(self, texts):
+        """
+        Like `lookup()`, but only the memory tier is read on the event loop; the disk tier is read on a thread.
+        """
+        keys = [self.key(text) for text in texts]
+        memory, remaining = self._from_memory(keys)
+        disk = await run_in_threadpool(self._from_disk, remaining) if remaining else {}
+        return self._results(keys, memory, disk)
+
+    def put(self, text, vector):
+        """
+        Stores the vector for `text` in both tiers.
+        """
+        self.put_many([(text, vector)])
+
+    def put_many(self, items):
+        """
+        Stores `(text, vector)` pairs in both tiers, with one disk commit. Blocks on the disk tier; from async
+        code use `put_many_async()`.
+        """
+        rows = self._to_memory(items)
+        if self._db is not None:
+            self._to_disk(rows)
+
+    async def put_many_async(self, items):
+        """
+        Like `put_many()`, but the disk write runs on a thread.
+        """
+        rows = self._to_memory(items)
+        if self._db is not None:
+            await run_in_threadpool(self._to_disk, rows)
+
+    def _from_memory(self, keys):
+        found = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        remaining = [key for key in dict.fromkeys(keys) if key not in found] if self._db is not None else []
+        return found, remaining
+
+    def _from_disk(self, keys):
+        found = {}
+        with self._disk_lock:
+            for start in range(0, len(keys), SQLITE_MAX_PARAMETERS):
+                part = keys[start:start + SQLITE_MAX_PARAMETERS]
+                rows = self._db.execute(f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(part))})",
+                                        part).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        with self._lock:
+            for key, vector in found.items():
+                self._remember(key, vector)
+        return found
+
+    def _results(self, keys, memory, disk):
+        vectors = []
+        with self._lock:
+            for key in keys:
+                if key in memory:
+                    self.memory_hits += 1
+                    vectors.append(memory[key])
+                elif key in disk:
+                    self.disk_hits += 1
+                    vectors.append(disk[key])
+                else:
+                    self.misses += 1
+                    vectors.append(None)
+        return vectors
+
+    def _to_memory(self, items):
+        rows = []
+        with self._lock:
+            for text, vector in items:
+                key = self.key(text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+        return rows
+
+    def _to_disk(self, rows):
+        with self._disk_lock:
+            self._db.executemany("INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def _remember(self, key, vector):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns hit/miss counters and tier sizes, for sizing the cache.
+        """
+        disk_entries = None
+        if self._db is not None:
+            with self._disk_lock:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.max_entries,
+                "disk_entries": disk_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,293 @@
+"""
+executors.py
+============
+
+This module keeps blocking model inference off the event loop and sheds load when a service is saturated.
+
+Each service owns an `InferenceExecutor`: a thread pool (or a share of the worker-process pool) with its own
+concurrency limit, plus an admission counter that bounds how many requests may wait for that pool. When the bound is
+reached new requests fail fast with `ServiceOverloaded`, which `main.py` turns into a 503 response with a
+`Retry-After` header, instead of queueing with unbounded latency. A slow NER call therefore cannot freeze
+`/test`, the UI pages, or the other services.
+
+Work waits for a slot of the pool in two lanes (see `deadlines.py`): a free slot always goes to the
+`interactive` lane first, and to the `bulk` lane only when no interactive work is waiting; within a lane the
+earliest deadline goes first. Bulk work can be kept off some of the slots altogether, so interactive requests
+never wait behind a long bulk batch. Work whose deadline passes while it waits, or whose caller has gone away,
+leaves the queue without running. A slot is only freed when the call it runs has actually finished.
+
+Imports:
+    - `asyncio` and `concurrent.futures` for running blocking calls from async code; `heapq` for the lanes.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - INFERENCE_EXECUTOR: `thread` (default) or `process`. In process mode every service dispatches to the
+      shared, core-pinned worker pool in `worker_pool.py`; submitted functions must be picklable top-level
+      functions.
+    - INFERENCE_RETRY_AFTER: Seconds suggested to clients in the `Retry-After` header (default is 1).
+    - <SERVICE>_MAX_CONCURRENCY: Forward passes a service may run at once, e.g. NER_MAX_CONCURRENCY (default is 1).
+    - <SERVICE>_MAX_QUEUE: Requests a service may hold (waiting or running) before rejecting new ones,
+      e.g. NER_MAX_QUEUE (default is 64).
+    - <SERVICE>_BULK_MAX_CONCURRENCY: Slots bulk work may use at once (default is all of them). Setting it below
+      <SERVICE>_MAX_CONCURRENCY keeps slots free for interactive work.
+    - <SERVICE>_BULK_MAX_QUEUE: Bulk requests a service may hold, counted separately from interactive ones so a
+      bulk flood cannot get interactive requests rejected (default is <SERVICE>_MAX_QUEUE).
+
+Classes:
+    - `ServiceOverloaded`: Raised when a service's wait queue is full.
+    - `InferenceExecutor`: Per-service pool with admission control, priority lanes and deadlines.
+
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from decouple import config
+from . import worker_pool
+from . import deadlines
+from . import profiling
+from .deadlines import DeadlineExceeded
+from .metrics import QUEUE_DEPTH
+
+INFERENCE_EXECUTOR = config('INFERENCE_EXECUTOR', default="thread")
+INFERENCE_RETRY_AFTER = config('INFERENCE_RETRY_AFTER', default=1, cast=int)
+
+
+class ServiceOverloaded(Exception):
+    """
+    Raised when a request arrives while its service's wait queue is full.
+
+    Attributes:
+    - service (str): Name of the saturated service.
+    - retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, service, retry_after=None):
+        self.service = service
+        self.retry_after = INFERENCE_RETRY_AFTER if retry_after is None else retry_after
+        super().__init__(f"The {service} service is at capacity. Please retry shortly.")
+
+
+class InferenceExecutor:
+    """
+    Runs blocking inference for one service with a concurrency limit and a bounded wait queue.
+
+    Args:
+    - name (str): Service name, also the prefix of its settings (e.g. "NER" reads NER_MAX_CONCURRENCY).
+    - max_concurrency (int): Size of the pool. Defaults to `<name>_MAX_CONCURRENCY`.
+    - max_queue (int): Requests admitted at once. Defaults to `<name>_MAX_QUEUE`.
+    - kind (str): "thread" or "process". Defaults to INFERENCE_EXECUTOR.
+    - bulk_max_concurrency (int): Slots the bulk lane may use. Defaults to `<name>_BULK_MAX_CONCURRENCY`.
+    - bulk_max_queue (int): Bulk requests admitted at once. Defaults to `<name>_BULK_MAX_QUEUE`.
+    """
+
+    def __init__(self, name, max_concurrency=None, max_queue=None, kind=None, bulk_max_concurrency=None,
+                 bulk_max_queue=None):
+        self.name = name
+        self.max_concurrency = config(f'{name}_MAX_CONCURRENCY', default=1, cast=int) if max_concurrency is None else max_concurrency
+        self.max_queue = config(f'{name}_MAX_QUEUE', default=64, cast=int) if max_queue is None else max_queue
+        self.kind = INFERENCE_EXECUTOR if kind is None else kind
+        if bulk_max_concurrency is None:
+            bulk_max_concurrency = config(f'{name}_BULK_MAX_CONCURRENCY', default=self.max_concurrency, cast=int)
+        self.bulk_max_concurrency = max(1, min(bulk_max_concurrency, self.max_concurrency))
+        self.bulk_max_queue = config(f'{name}_BULK_MAX_QUEUE', default=self.max_queue, cast=int) if bulk_max_queue is None else bulk_max_queue
+        self.pending = 0
+        self.admitted = {lane: 0 for lane in deadlines.LANES}
+        self.dropped = 0
+        self._pool = None
+        self._loop = None
+        self._running = {lane: 0 for lane in deadlines.LANES}
+        self._waiting = []
+        self._order = itertools.count()
+        self._thread_pool = None
+
+    @property
+    def pool(self):
+        # Created on first use so importing a service does not spawn workers
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = worker_pool.get_pool()
+            elif self.kind == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix=f"{self.name.lower()}-inference")
+            else:
+                raise ValueError(f"Unknown INFERENCE_EXECUTOR '{self.kind}'. Use 'thread' or 'process'.")
+        return self._pool
+
+    def acquire(self, lane=None):
+        """
+        Takes a place in the wait queue of the request's lane; pair with `release()`. Prefer `admit()` where a
+        `with` block fits.
+
+        Returns:
+        - str: The lane, to hand back to `release()`.
+
+        Raises:
+        - ServiceOverloaded: If the lane's queue is full.
+        - DeadlineExceeded: If the request's deadline has already passed.
+        """
+        lane = lane or deadlines.current_lane()
+        deadlines.check_deadline(self.name.lower())
+        if self.admitted[lane] >= (self.bulk_max_queue if lane == "bulk" else self.max_queue):
+            raise ServiceOverloaded(self.name)
+        self.admitted[lane] += 1
+        self.pending += 1
+        QUEUE_DEPTH.labels(self.name.lower()).set(self.pending)
+        return lane
+
+    def release(self, lane=None):
+        self.admitted[lane or deadlines.current_lane()] -= 1
+        self.pending -= 1
+        QUEUE_DEPTH.labels(self.name.lower()).set(self.pending)
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        Reserves a place in the wait queue for the duration of a request.
+
+        Raises:
+        - ServiceOverloaded: If the lane's queue is full.
+        - DeadlineExceeded: If the request's deadline has already passed.
+        """
+        lane = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    async def run(self, fn, *args, lane=None, deadline=None):
+        """
+        Waits for a slot in the request's lane, runs `fn(*args)` on the pool and awaits its result without
+        blocking the event loop.
+
+        In thread mode, `fn` can call `deadlines.cancelled()` to find out that its caller has gone away or its
+        deadline has passed, and stop early (by raising, so a cut-short result is never returned).
+
+        Args:
+        - fn (callable): Blocking function to run.
+        - lane (str): `interactive` or `bulk`. Defaults to the running request's lane.
+        - deadline (float): `time.monotonic()` deadline. Defaults to the running request's deadline.
+
+        Raises:
+        - DeadlineExceeded: If the deadline passes before `fn` starts, or `fn` stops early because it passed.
+        """
+        loop = asyncio.get_running_loop()
+        # Starting the pool loads the models first; do that off the event loop
+        if self._pool is None:
+            await loop.run_in_executor(None, lambda: self.pool)
+        return await self._run_on(self.pool, fn, args, lane, deadline)
+
+    async def run_threaded(self, fn, *args, lane=None, deadline=None):
+        """
+        Like `run()`, but always on a thread of this process, for work that shares objects with the
+        event loop (e.g. a token streamer). In process mode it runs on the loop's default executor.
+        """
+        if self.kind != "process":
+            return await self.run(fn, *args, lane=lane, deadline=deadline)
+        return await self._run_on(None, fn, args, lane, deadline, threaded=True)
+
+    async def _run_on(self, pool, fn, args, lane, deadline, threaded=False):
+        loop = asyncio.get_running_loop()
+        lane = lane or deadlines.current_lane()
+        deadline = deadlines.current_deadline() if deadline is None else deadline
+        await self._take_slot(loop, lane, deadline)
+
+        stop = threading.Event()
+        try:
+            if threaded:
+                pool = self._threads()
+            if threaded or self.kind != "process":
+                # The call sees the caller's context, plus the stop flag and deadline of this call
+                context = contextvars.copy_context()
+                deadlines.bind(context, stop, deadline)
+                future = pool.submit(context.run, profiling.traced(fn), *args)
+            else:
+                future = pool.submit(fn, *args)
+        except BaseException:
+            self._free_slot(lane)
+            raise
+        # The slot is held until the call has really finished, even if its caller stops waiting for it
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._free_slot, lane))
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+        # A call that has finished is returned even if the deadline passed while it ran; work that stops early
+        # on `deadlines.cancelled()` raises rather than returning a partial result
+        return result
+
+    def _threads(self):
+        # Process mode only: threads for run_threaded(), so their slots are released when the work ends
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                   thread_name_prefix=f"{self.name.lower()}-threaded")
+        return self._thread_pool
+
+    def _can_start(self, lane):
+        running = self._running["interactive"] + self._running["bulk"]
+        return running < self.max_concurrency and (lane != "bulk" or self._running["bulk"] < self.bulk_max_concurrency)
+
+    async def _take_slot(self, loop, lane, deadline):
+        # Slots are tracked per event loop; a new loop (e.g. a fresh test client) starts from scratch
+        if self._loop is not loop:
+            self._loop = loop
+            self._running = {name: 0 for name in deadlines.LANES}
+            self._waiting = []
+
+        # Free slots go to waiting interactive work first, then to bulk work
+        ahead = [entry for entry in self._waiting if not entry[-1].done() and (lane == "bulk" or entry[0] == 0)]
+        if not ahead and self._can_start(lane):
+            self._running[lane] += 1
+            return
+
+        waiter = loop.create_future()
+        rank = 0 if lane == "interactive" else 1
+        heapq.heappush(self._waiting, (rank, math.inf if deadline is None else deadline, next(self._order), lane, waiter))
+        try:
+            if deadline is None:
+                await waiter
+            else:
+                await asyncio.wait_for(waiter, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            # Expired while queued: dropped without running
+            self.dropped += 1
+            raise DeadlineExceeded(self.name.lower()) from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the caller went away; hand the slot on
+                self._free_slot(lane)
+            else:
+                self.dropped += 1
+            raise
+
+    def _free_slot(self, lane):
+        # Calls started on a previous event loop may finish after the counts were reset
+        self._running[lane] = max(0, self._running[lane] - 1)
+        while self._waiting:
+            rank, _, _, waiting_lane, waiter = self._waiting[0]
+            if waiter.done():
+                # Cancelled or expired while waiting
+                heapq.heappop(self._waiting)
+                continue
+            if not self._can_start(waiting_lane):
+                return
+            heapq.heappop(self._waiting)
+            self._running[waiting_lane] += 1
+            waiter.set_result(None)
+
+    def shutdown(self):
+        if self._pool is not None:
+            # The shared worker pool is owned by worker_pool.py
+            if self.kind != "process":
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
@@ -16,6 +16,14 @@ Configuration:
     - PORT: Port where the application runs (default is 8019).
     - ENV: Specifies the current environment ('development' or 'production').
     - API_KEY: The API key, which is fetched based on the environment.
+    - UI_SERVICE_MODE: How the UI routes reach the services: 'local' (in-process, default) or 'remote'.
+    - SERVICES_URL: API location used by the remote mode (default is '{SCHEME}://{HOST}:{PORT}').
+    - UI_REQUEST_TIMEOUT: Seconds a UI page waits for a service (default is 60). UI calls run in the interactive
+      lane with this as their deadline, so work for a page that timed out is dropped (see `deadlines.py`).
+    - MODEL_LOADING: When models load: 'background' (default; the app starts serving at once and models load
+      in a background thread), 'eager' (before the app accepts requests) or 'lazy' (each model on first use).
+    - NER_ENABLED, TEXT2VEC_ENABLED, PARAPHRASE_ENABLED: Turn individual services off; a disabled service
+      neither loads its models nor mounts its routes.
 
 FastAPI Setup:
     - An instance of the FastAPI application is created.
@@ -26,25 +34,71 @@ Services:
         * ner_service: Handles Named Entity Recognition tasks.
         * text2vec_service: Converts text to vectors.
         * paraphraser_service: Provides paraphrasing functionalities.
+        * vector_index: Named in-process vector collections and `/text2vec/search` (exact or IVF).
+        * vector_jobs: Runs bulk vectorization jobs into memory-mapped `.npy` files (with VECTOR_JOBS_DIR set).
+        * weaviate_service: Serves the text2vec model through Weaviate's text2vec-transformers API (opt-in).
+        * analyze_service: POST `/analyze` runs NER, vectorization and paraphrase over the same text(s) in one
+          call, concurrently on their executors, and reports the time each took.
+    - Tokenizers and models are shared through `model_registry`; GET `/models` lists what is loaded.
+    - POST `/models/load`: Loads and warms up one of a service's allowed models ahead of use, optionally pinning
+      it so the memory budget never evicts it. Requests selecting a model outside the allow-list get a 400.
+
+Metrics:
+    - GET `/metrics`: Prometheus metrics: request counts and latency per route, time per service stage, input
+      token counts, queue depth, batch sizes, model load times and error counts (see `metrics.py`).
+
+Profiling:
+    - GET `/debug/profile?seconds=N&route=/ner/`: Samples the app for N seconds, with the PyTorch profiler on the
+      model calls of matching requests, and returns collapsed stacks for a flamegraph and a Chrome trace
+      (see `profiling.py`). Nothing is sampled outside such a window.
+
+Health:
+    - GET `/health/live`: The process is up and serving requests.
+    - GET `/health/ready`: 200 once every model of the enabled services has loaded (and, in process mode, the
+      worker pool has started), 503 before that. Either way the body reports each model's load state.
+      Unpinned on-demand models (see `model_registry.py`) do not count.
 """
 
 import os
-import json
-import httpx
+import logging
+import threading
+from typing import Optional
 from fastapi import FastAPI, Depends, HTTPException, Request, Form
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
 from decouple import config
-from .ner_service import ner_router
-from .text2vec_service import text2vec_router
-from .paraphraser_service import paraphraser_router
+from .ner_service import ner_router, NER_ENABLED
+from .text2vec_service import text2vec_router, TEXT2VEC_ENABLED
+from .paraphraser_service import paraphraser_router, PARAPHRASE_ENABLED
+from .vector_index import vector_index, vector_index_router
+from .vector_jobs import vector_jobs, vector_jobs_router, VECTOR_JOBS_ENABLED
+from .weaviate_service import weaviate_router, WEAVIATE_API_ENABLED, WEAVIATE_API_PREFIX
+from .analyze_service import analyze_router
+from .profiling import profiling_router, ProfilingMiddleware, PROFILE_ENABLED
+from pydantic import BaseModel
+from .model_registry import registry, ModelNotAllowed
+from .vector_formats import DimensionsTooLarge
+from .executors import ServiceOverloaded, INFERENCE_EXECUTOR
+from .deadlines import DeadlineMiddleware, DeadlineExceeded, ClientDisconnected
+from . import worker_pool, ner_service, text2vec_service, paraphraser_service
+from .service_client import create_services
+from .metrics import MetricsMiddleware, count_error, render as render_metrics
 
 SCHEME = config('SCHEME', default='https')
 HOST = config('HOST', default='localhost')
 PORT = config('PORT', default=8019, cast=int)
 
+# 'local' calls the services in-process; 'remote' calls SERVICES_URL over a shared HTTP client
+UI_SERVICE_MODE = config('UI_SERVICE_MODE', default='local')
+SERVICES_URL = config('SERVICES_URL', default='') or f"{SCHEME}://{HOST}:{PORT}"
+UI_REQUEST_TIMEOUT = config('UI_REQUEST_TIMEOUT', default=60, cast=float)
+
+# 'background' loads models in a thread after startup, 'eager' before serving, 'lazy' on first use
+MODEL_LOADING = config('MODEL_LOADING', default='background')
+
 ENV = config('ENVIRONMENT', default='development')
 
 verifySSL = True if ENV == 'production' else False
@@ -55,7 +109,14 @@ else:
     # Fetch production API key or handle it differently
     API_KEY = config('PROD_API_KEY')
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
+services = create_services(UI_SERVICE_MODE, SERVICES_URL, API_KEY, verifySSL, UI_REQUEST_TIMEOUT)
 
 templates = Jinja2Templates(directory="web/templates")
 
@@ -63,14 +124,99 @@ base_directory = os.path.dirname(os.path.abspath(__file__))
 static_directory = os.path.join(base_directory, "..", "web", "static")
 app.mount("/static", StaticFiles(directory=static_directory), name="static")
 
+def load_models():
+    failures = registry.load_declared()
+    # In process mode, fork the pinned inference workers once every model is loaded, so they share the weights
+    if INFERENCE_EXECUTOR == "process":
+        worker_pool.start()
+    return failures
+
+@app.on_event("startup")
+def start_model_loading():
+    if MODEL_LOADING == "eager":
+        failures = load_models()
+        if failures:
+            raise RuntimeError(f"Failed to load models: {failures}")
+    elif MODEL_LOADING == "background":
+        threading.Thread(target=load_models, name="model-loader", daemon=True).start()
+    elif MODEL_LOADING != "lazy":
+        raise ValueError(f"Unknown MODEL_LOADING '{MODEL_LOADING}'. Use 'background', 'eager' or 'lazy'.")
+
+@app.on_event("startup")
+async def start_services():
+    await services.start()
+
+@app.on_event("startup")
+async def load_vector_collections():
+    # Collections saved under VECTOR_INDEX_DIR by the last shutdown (or on request)
+    if TEXT2VEC_ENABLED:
+        await run_in_threadpool(vector_index.load_all)
+
+@app.on_event("startup")
+async def start_vector_jobs():
+    # Resumes jobs interrupted by the last shutdown or crash
+    if VECTOR_JOBS_ENABLED and TEXT2VEC_ENABLED:
+        await vector_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_vector_jobs():
+    await vector_jobs.stop()
+
+@app.on_event("shutdown")
+def save_vector_collections():
+    vector_index.save_all()
+
+@app.on_event("shutdown")
+def stop_inference_workers():
+    worker_pool.shutdown()
+
+@app.on_event("shutdown")
+async def stop_services():
+    await services.close()
+
+def service_label(request):
+    # Metrics label for the service a request was meant for, from the first path segment
+    segment = request.url.path.strip("/").split("/")[0]
+    return segment if segment in ("ner", "text2vec", "paraphrase", "analyze") else "app"
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-  print(exc)
+  count_error(service_label(request), "validation")
   return PlainTextResponse(str(exc), status_code=400)
 
+@app.exception_handler(ServiceOverloaded)
+async def overloaded_exception_handler(request, exc):
+  # Fast rejection when a service's wait queue is full, instead of unbounded latency
+  count_error(exc.service.lower(), "overloaded")
+  return JSONResponse(content={"error": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_exception_handler(request, exc):
+  # The work was dropped from the queue (or stopped) once the client's deadline had passed
+  count_error(exc.service, "deadline_exceeded")
+  return JSONResponse(content={"error": str(exc)}, status_code=504)
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_exception_handler(request, exc):
+  # Nobody reads this response; 499 marks it in the access log and metrics
+  count_error(exc.service, "client_disconnected")
+  return JSONResponse(content={"error": str(exc)}, status_code=499)
+
+@app.exception_handler(ModelNotAllowed)
+async def model_not_allowed_exception_handler(request, exc):
+  count_error(exc.service, "model_not_allowed")
+  return JSONResponse(content={"error": str(exc)}, status_code=400)
+
+@app.exception_handler(DimensionsTooLarge)
+async def dimensions_too_large_exception_handler(request, exc):
+  count_error(service_label(request), "validation")
+  return JSONResponse(content={"error": str(exc)}, status_code=400)
+
 @app.exception_handler(Exception) 
 async def general_exception_handler(request, exc):
-  print(exc)
+  # Counted like every other error; the traceback goes to the log, since a 500 means a bug
+  logger.error("Unhandled error on %s %s", request.method, request.url.path, exc_info=exc)
+  count_error(service_label(request), type(exc).__name__)
   return PlainTextResponse('Internal server error', status_code=500)
 @app.get("/test")
 def test_endpoint():
@@ -84,6 +230,61 @@ def verify_api_key(request: Request):
         raise HTTPException(status_code=403, detail="Invalid API Key")
     return provided_api_key
 
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    models = registry.status()
+    # On-demand models load when a request selects them (and may be evicted again), so they do not count
+    required = [model for model in models if model["pinned"]]
+    if MODEL_LOADING == "lazy":
+        # Models load on first use, so only a failed load makes the app unready
+        ready = all(model["state"] != "failed" for model in required)
+    else:
+        ready = all(model["state"] == "ready" for model in required)
+        if INFERENCE_EXECUTOR == "process":
+            ready = ready and worker_pool.is_running()
+    content = {
+        "ready": ready,
+        "services": {"ner": NER_ENABLED, "text2vec": TEXT2VEC_ENABLED, "paraphrase": PARAPHRASE_ENABLED},
+        "models": models,
+    }
+    return JSONResponse(content=content, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text format; see metrics.py for what is recorded
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+@app.get("/models", dependencies=[Depends(verify_api_key)])
+def list_models():
+    # Reports which tokenizers/models are loaded, how long they took and their estimated memory use
+    return registry.describe()
+
+class ModelLoadRequest(BaseModel):
+    service: str
+    model: Optional[str] = None
+    pin: bool = False
+
+@app.post("/models/load", dependencies=[Depends(verify_api_key)])
+async def load_model(request: ModelLoadRequest):
+    # Loads and warms up a model ahead of the requests that will select it; pinned models are never evicted
+    resolvers = {"ner": ner_service.resolve_model, "text2vec": text2vec_service.resolve_model,
+                 "paraphrase": paraphraser_service.resolve_model}
+    if request.service not in resolvers:
+        return JSONResponse(content={"error": f"Unknown service '{request.service}'. Use one of: {', '.join(resolvers)}."}, status_code=400)
+    model = resolvers[request.service](request.model)
+    group = f"{request.service}:{model}"
+    try:
+        await run_in_threadpool(registry.load_group, group, request.pin)
+    except KeyError:
+        return JSONResponse(content={"error": f"The {request.service} service is disabled."}, status_code=400)
+    return {"group": group, "pinned": request.pin or group in registry.pinned_groups,
+            "models": [model for model in registry.status() if model["group"] == group]}
+
 @app.get("/styles.css")
 async def read_css():
     with open("web/static/styles.css", "r") as f:
@@ -109,31 +310,18 @@ def get_paraphrase_page(request: Request):
 @app.post("/nertags/", response_model=None)
 async def post_ner_tags(request: Request, text: str = Form(...)):
 
-  headers = {
-    "X-API-KEY": API_KEY  
-  }
-
-  url = f"{SCHEME}://{HOST}:{PORT}/ner/"
-    
-  async with httpx.AsyncClient(verify=verifySSL) as client:
+  response = await services.ner(text)
 
-    response = await client.post(url, json={"text": text}, headers=headers)
+  # Check if the response was successful
+  if "error" in response:
+    error_message = response["error"]
+    return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
 
-    # Check if the response was successful
-    if response.status_code == 200:
-        tags = response.json()["entities"]
-    else:
-        # Handle error response here. For now, let's just log the error.
-        error_message = response.json()["error"]
-        print(f"Error: {error_message}")
-        return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
-    
-    tags = response.json()["entities"]
-    print (tags)
-    parsed_tags = [eval(tag) for tag in tags]
+  # Structured entities: word, entity_group, score and start/end offsets
+  tags = response["entities"]
 
-    # Rendering the nertags.html template, passing the vector as context
-    return templates.TemplateResponse("nertags.html", {"request": request, "tags": parsed_tags, "entered_text": text})
+  # Rendering the nertags.html template, passing the tags as context
+  return templates.TemplateResponse("nertags.html", {"request": request, "tags": tags, "entered_text": text})
   
 @app.post("/vectors/", response_model=None)
 async def post_vectors(request: Request):
@@ -141,23 +329,14 @@ async def post_vectors(request: Request):
     form_data = await request.form()
     text = form_data.get("text")
     
-    headers = {
-        "X-API-KEY": API_KEY
-    }
-    
     # Forwarding the text to the text2vec service to obtain the vector
-    async with httpx.AsyncClient(verify=verifySSL) as client:
-        url = f"{SCHEME}://{HOST}:{PORT}/text2vec/"
-        response = await client.post(url, json={"text": text}, headers=headers)
-        
-        # Check if the response was successful
-        if response.status_code == 200:
-            vector = response.json()["vector"]
-        else:
-            # Handle error response here.
-            error_message = response.json()["error"]
-            print(f"Error: {error_message}")
-            return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
+    response = await services.vectorize(text)
+
+    # Check if the response was successful
+    if "error" in response:
+        error_message = response["error"]
+        return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
+    vector = response["vector"]
 
     # Rendering the vectors.html template, passing the vector as context
     return templates.TemplateResponse("vectors.html", {"request": request, "vector": vector, "entered_text": text})
@@ -169,40 +348,48 @@ async def post_paraphraser(request: Request):
     multipleResponses = form_data.get("multipleResponses") == "on"
     numResponses = int(form_data.get("numResponses", 1))
     
-    headers = {
-        "X-API-KEY": API_KEY
-    }
-    
-    async with httpx.AsyncClient(verify=verifySSL) as client:
-
-        # Determine the appropriate endpoint based on user's choice
-        if multipleResponses:
-            url = f"{SCHEME}://{HOST}:{PORT}/paraphrase/multi/"
-            response = await client.post(url, json={"text": text, "return_sequences": numResponses}, headers=headers)
-            # Check if the response was successful
-            if response.status_code == 200:
-                paraphrases = response.json()["paraphrases"]
-            else:
-                # Handle error response here.
-                error_message = response.json()["error"]
-                print(f"Error: {error_message}")
-                return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
-        else:
-            url = f"{SCHEME}://{HOST}:{PORT}/paraphrase/"
-            response = await client.post(url, json={"text": text}, headers=headers)
-            # Check if the response was successful
-            if response.status_code == 200:
-                paraphrases = [response.json()["paraphrased_text"]]
-            else:
-                # Handle error response here.
-                error_message = response.json()["error"]
-                print(f"Error: {error_message}")
-                return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
-
-        # Rendering the paraphraser.html template, passing the vector as context
-        return templates.TemplateResponse("paraphraser.html", {"request": request, "paraphrases": paraphrases, "entered_text": text})
+    # Determine the appropriate service call based on user's choice
+    if multipleResponses:
+        response = await services.paraphrase_multi(text, numResponses)
+    else:
+        response = await services.paraphrase(text)
+
+    # Check if the response was successful
+    if "error" in response:
+        error_message = response["error"]
+        return templates.TemplateResponse("error_template.html", {"request": request, "error_message": error_message})
+
+    if multipleResponses:
+        paraphrases = response["paraphrases"]
+    else:
+        paraphrases = [response["paraphrased_text"]]
+
+    # Rendering the paraphraser.html template, passing the vector as context
+    return templates.TemplateResponse("paraphraser.html", {"request": request, "paraphrases": paraphrases, "entered_text": text})
+
+@app.post("/paraphraser/stream", response_model=None)
+async def post_paraphraser_stream(request: Request, text: str = Form(...)):
+    # Server-Sent Events for the paraphraser page, which renders the text as it arrives
+    return await services.paraphrase_stream(text, request)
 
 # Including the routers with the API key verification
-app.include_router(ner_router, prefix="/ner", dependencies=[Depends(verify_api_key)])
-app.include_router(text2vec_router, prefix="/text2vec", dependencies=[Depends(verify_api_key)])
-app.include_router(paraphraser_router, prefix="/paraphrase", dependencies=[Depends(verify_api_key)])
+if NER_ENABLED:
+    app.include_router(ner_router, prefix="/ner", dependencies=[Depends(verify_api_key)])
+if TEXT2VEC_ENABLED:
+    app.include_router(text2vec_router, prefix="/text2vec", dependencies=[Depends(verify_api_key)])
+    app.include_router(vector_index_router, prefix="/text2vec", dependencies=[Depends(verify_api_key)])
+    if VECTOR_JOBS_ENABLED:
+        app.include_router(vector_jobs_router, prefix="/text2vec/jobs", dependencies=[Depends(verify_api_key)])
+if PARAPHRASE_ENABLED:
+    app.include_router(paraphraser_router, prefix="/paraphrase", dependencies=[Depends(verify_api_key)])
+
+# Runs any of the enabled services above in one call; operations of a disabled service are rejected
+app.include_router(analyze_router, prefix="/analyze", dependencies=[Depends(verify_api_key)])
+
+# On-demand profiles of the running app (see `profiling.py`)
+if PROFILE_ENABLED:
+    app.include_router(profiling_router, prefix="/debug", dependencies=[Depends(verify_api_key)])
+
+# Weaviate's text2vec-transformers API; Weaviate cannot send an API key, so this is opt-in
+if WEAVIATE_API_ENABLED and TEXT2VEC_ENABLED:
+    app.include_router(weaviate_router, prefix=WEAVIATE_API_PREFIX)
@@ -0,0 +1,263 @@
+"""
+metrics.py
+==========
+
+This module provides the Prometheus metrics exposed on `/metrics`.
+
+Every request is timed per route, and inside the services each stage of the work is timed separately so the
+bottleneck of a service can be read straight off the dashboards:
+
+    - `validate`: Word-limit, chunk-limit and batch-size checks.
+    - `tokenize`: Tokenization (also records the number of input tokens).
+    - `forward`: The model forward pass (`generate` for the paraphraser).
+    - `decode`: Pipeline post-processing and token decoding.
+    - `merge`: NER span merging (`merge_entity_spans`).
+    - `serialize`: Formatting results for the response (entity dicts/strings, vector encodings).
+    - `search`: Nearest-neighbour search over a vector collection (see `vector_index.py`).
+
+Stages nest: the time of an inner stage (e.g. `tokenize` inside a SentenceTransformer `encode`) is subtracted
+from the outer one (`forward`), so each stage reports only its own time. A stage must not span an `await`,
+since the stack of open stages is kept per thread.
+
+In process mode (INFERENCE_EXECUTOR=process) the stages inside worker processes are only visible when
+PROMETHEUS_MULTIPROC_DIR points at an empty directory before the app starts, as `prometheus_client` requires.
+
+Imports:
+    - `prometheus_client` for the metric types and the text exposition format.
+
+Metrics:
+    - `riptide_requests_total` / `riptide_request_seconds`: Requests and latency per route and status.
+    - `riptide_stage_seconds`: Time per service and stage.
+    - `riptide_input_tokens`: Tokens per input text, per service.
+    - `riptide_queue_depth`: Requests admitted to a service (waiting or running).
+    - `riptide_batch_size`: Items per micro-batch, per service.
+    - `riptide_errors_total`: Errors per service and type.
+    - `riptide_result_cache_total`: Result cache lookups per service and outcome (`hit`, `miss`, `coalesced`).
+    - `riptide_model_load_seconds`, `riptide_model_ready`, `riptide_model_memory_bytes`: Per model, from the
+      model registry at scrape time.
+    - `riptide_model_evictions_total`: Model groups evicted to stay within MODEL_MEMORY_BUDGET_MB.
+
+Functions:
+    - `stage`: Context manager that times one stage.
+    - `observe_tokens` / `observe_token_counts` / `observe_features`: Record input token counts.
+    - `count_error`: Increments the error counter.
+    - `instrument_pipeline`: Times the stages of a `transformers` pipeline.
+    - `instrument_tokenize`: Times a SentenceTransformer's tokenization.
+    - `render`: Produces the `/metrics` response body.
+
+Classes:
+    - `MetricsMiddleware`: ASGI middleware that counts and times requests.
+
+"""
+
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest)
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from .model_registry import registry as model_registry
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 384, 512, 1024, 2048, 4096)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+REQUESTS = Counter("riptide_requests_total", "HTTP requests.", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("riptide_request_seconds", "HTTP request latency.", ["method", "route"],
+                            buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("riptide_stage_seconds", "Time spent in each stage of a service, excluding nested stages.",
+                          ["service", "stage"], buckets=LATENCY_BUCKETS)
+INPUT_TOKENS = Histogram("riptide_input_tokens", "Tokens per input text.", ["service"], buckets=TOKEN_BUCKETS)
+QUEUE_DEPTH = Gauge("riptide_queue_depth", "Requests admitted to a service, waiting or running.", ["service"],
+                    multiprocess_mode="livesum")
+BATCH_SIZE = Histogram("riptide_batch_size", "Items per micro-batch.", ["service"], buckets=BATCH_BUCKETS)
+ERRORS = Counter("riptide_errors_total", "Errors by service and type.", ["service", "type"])
+RESULT_CACHE = Counter("riptide_result_cache_total", "Result cache lookups by outcome; coalesced requests waited "
+                       "for an identical computation in flight.", ["service", "outcome"])
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(service, name):
+    """
+    Times the enclosed block as stage `name` of `service`, excluding the time of stages nested inside it.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    # Each open stage accumulates the time of its nested stages
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        STAGE_SECONDS.labels(service, name).observe(max(elapsed - nested, 0.0))
+        if stack:
+            stack[-1] += elapsed
+
+
+def observe_tokens(service, input_ids):
+    """
+    Records the token count of each unpadded row of `input_ids`; for padded batches use `observe_token_counts`.
+    """
+    for row in input_ids:
+        INPUT_TOKENS.labels(service).observe(len(row))
+
+
+def observe_token_counts(service, counts):
+    """
+    Records already computed token counts, e.g. the sums of an attention mask.
+    """
+    for count in counts:
+        INPUT_TOKENS.labels(service).observe(int(count))
+
+
+def count_error(service, error_type):
+    ERRORS.labels(service, error_type).inc()
+
+
+def _attention_counts(features):
+    mask = features.get("attention_mask") if hasattr(features, "get") else None
+    if mask is None:
+        return None
+    return [int(total) for total in mask.sum(-1).reshape(-1).tolist()] if hasattr(mask, "sum") else [sum(row) for row in mask]
+
+
+def observe_features(service, features):
+    """
+    Records the token counts of a padded tokenizer output, from its attention mask.
+    """
+    counts = _attention_counts(features)
+    if counts:
+        observe_token_counts(service, counts)
+
+
+def _timed_chunks(service, chunks):
+    # Chunking pipelines tokenize lazily, one chunk per step
+    while True:
+        with stage(service, "tokenize"):
+            try:
+                features = next(chunks)
+            except StopIteration:
+                return
+        observe_features(service, features)
+        yield features
+
+
+def instrument_pipeline(pipe, service):
+    """
+    Wraps the preprocess and postprocess steps of a `transformers` pipeline instance so they are recorded as
+    the `tokenize` and `decode` stages of `service`. Time the call itself as `forward`; these stages nest in it.
+
+    Returns:
+    - The same pipeline.
+    """
+    preprocess, postprocess = pipe.preprocess, pipe.postprocess
+
+    def timed_preprocess(*args, **kwargs):
+        with stage(service, "tokenize"):
+            features = preprocess(*args, **kwargs)
+        if inspect.isgenerator(features):
+            return _timed_chunks(service, features)
+        observe_features(service, features)
+        return features
+
+    def timed_postprocess(*args, **kwargs):
+        with stage(service, "decode"):
+            return postprocess(*args, **kwargs)
+
+    pipe.preprocess, pipe.postprocess = timed_preprocess, timed_postprocess
+    return pipe
+
+
+def instrument_tokenize(model, service):
+    """
+    Wraps `model.tokenize` (SentenceTransformer) so tokenization is its own stage and token counts are recorded.
+
+    Returns:
+    - The same model.
+    """
+    tokenize = model.tokenize
+
+    def timed_tokenize(texts):
+        with stage(service, "tokenize"):
+            features = tokenize(texts)
+        observe_features(service, features)
+        return features
+
+    model.tokenize = timed_tokenize
+    return model
+
+
+class _ModelCollector:
+    # Reads the model registry at scrape time, so load progress shows up while models are still loading
+    def collect(self):
+        load_seconds = GaugeMetricFamily("riptide_model_load_seconds", "Time spent loading a model (so far, while loading).",
+                                         labels=["role", "name"])
+        ready = GaugeMetricFamily("riptide_model_ready", "1 once a model has loaded.", labels=["role", "name"])
+        memory = GaugeMetricFamily("riptide_model_memory_bytes", "Estimated memory held by a model.", labels=["role", "name"])
+        for model in model_registry.status():
+            load_seconds.add_metric([model["role"], model["name"]], model["seconds"])
+            ready.add_metric([model["role"], model["name"]], 1.0 if model["state"] == "ready" else 0.0)
+        described = model_registry.describe()
+        for model in described["models"]:
+            memory.add_metric([model["role"], model["name"]], model["memory_bytes"])
+        evictions = CounterMetricFamily("riptide_model_evictions", "Model groups evicted to stay within the memory budget.",
+                                        value=described["evictions"])
+        yield load_seconds
+        yield ready
+        yield memory
+        yield evictions
+
+
+REGISTRY.register(_ModelCollector())
+
+
+def render():
+    """
+    Returns the `/metrics` body and its content type, merging worker processes in multiprocess mode.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        scrape = CollectorRegistry()
+        multiprocess.MultiProcessCollector(scrape)
+        scrape.register(_ModelCollector())
+        return generate_latest(scrape), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Counts and times every HTTP request by method, route template (e.g. `/ner/batch`) and status.
+
+    Requests that match no route are labelled `unmatched`, so scanners cannot blow up label cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], path).observe(time.perf_counter() - start)
+            REQUESTS.labels(scope["method"], path, str(status["code"])).inc()
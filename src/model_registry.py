@@ -0,0 +1,425 @@
+"""
+model_registry.py
+=================
+
+This module provides a process-wide registry for the tokenizers and models used by the services.
+
+Every service used to create its own tokenizer and model, and the paraphraser did so on every request.
+The registry loads each (role, model name) pair exactly once, hands the same instance to every caller,
+and keeps enough bookkeeping to report what is loaded and how much memory it holds.
+
+Services declare their models (with the loader to use) when they are imported, without loading them. The
+models are then loaded at startup, in the background or on first use (see MODEL_LOADING in `main.py`), and
+`status()` reports the progress of each one for the readiness endpoint.
+
+Besides its configured default, a service may declare extra models that requests can select (e.g. NER_MODELS).
+Those are declared `on_demand`: they are skipped at startup, loaded on first use, and together form an LRU pool.
+When the loaded models exceed MODEL_MEMORY_BUDGET_MB, the least recently used on-demand models are evicted
+until the total fits again. Entries are evicted by `group` (e.g. "ner:<model>", covering its tokenizer, model
+and pipeline), since evicting only part of a group frees nothing. Default models and the groups listed in
+MODEL_PINNED are pinned: they load at startup and are never evicted. An evicted model loads again on its next
+use; requests already holding it keep it alive until they finish.
+
+Every model can be warmed up after loading (a small inference declared by its service), so the first real
+request does not pay for one-time initialization.
+
+Imports:
+    - Standard library modules for locking and timing.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - MODEL_MEMORY_BUDGET_MB: Memory the loaded models may use before on-demand models are evicted (default is 0,
+      meaning no limit). The budget is checked after each load, so it can be exceeded by one model while loading.
+      In process mode every worker keeps its own pool.
+    - MODEL_PINNED: Comma-separated groups (`service:model`) to load at startup and never evict.
+    - MODEL_WARMUP: Run each model's warm-up after it loads (default is True).
+
+Classes:
+    - `ModelNotAllowed`: Raised when a request selects a model that is not in the service's allow-list.
+    - `ModelRegistry`: Thread-safe, load-once store of tokenizers, models and pipelines, with load progress
+      and an LRU memory budget for on-demand models.
+
+Functions:
+    - `select_model`: Resolves a request's `model` field against a service's allow-list.
+    - `estimate_memory_bytes`: Best-effort estimate of the memory held by a model object (fp32, int8 or ONNX).
+
+Module Attributes:
+    - `registry`: The shared `ModelRegistry` instance used by all services.
+
+"""
+
+import os
+import threading
+import time
+from decouple import config, Csv
+
+MODEL_MEMORY_BUDGET_MB = config('MODEL_MEMORY_BUDGET_MB', default=0, cast=float)
+MODEL_PINNED = config('MODEL_PINNED', default="", cast=Csv())
+MODEL_WARMUP = config('MODEL_WARMUP', default=True, cast=bool)
+
+
+class ModelNotAllowed(ValueError):
+    """
+    Raised when a request asks for a model its service does not offer.
+
+    Attributes:
+    - service (str): The service, e.g. "ner".
+    - model (str): The requested model.
+    - allowed (list): The models the service offers.
+    """
+
+    def __init__(self, service, model, allowed):
+        self.service = service
+        self.model = model
+        self.allowed = list(allowed)
+        super().__init__(f"Model '{model}' is not available for {service}. Use one of: {', '.join(self.allowed)}.")
+
+
+def select_model(service, requested, allowed):
+    """
+    Returns the model a request should use: `requested`, or the service's default (the first allowed model)
+    when it is None.
+
+    Raises:
+    - ModelNotAllowed: If `requested` is not in `allowed`.
+    """
+    if requested is None:
+        return allowed[0]
+    if requested not in allowed:
+        raise ModelNotAllowed(service, requested, allowed)
+    return requested
+
+
+def estimate_memory_bytes(obj):
+    """
+    Estimates the memory held by the weights of a model, on any backend (see `backends.py`).
+
+    Pipelines are unwrapped to their underlying model. PyTorch models are measured through their state dict,
+    which (unlike `parameters()`) includes the packed weights of int8-quantized layers; ONNX Runtime models,
+    on their own or as the encoder inside a SentenceTransformer, by the size of their `.onnx` files, which the
+    session holds in memory. Objects that are neither (tokenizers, for example) are reported as 0 since their
+    footprint is negligible next to the weights.
+
+    Args:
+    - obj: Loaded tokenizer, model or pipeline.
+
+    Returns:
+    - int: Approximate size in bytes.
+    """
+    module = obj if getattr(obj, "model_save_dir", None) is not None else getattr(obj, "model", obj)
+    total = 0
+    submodules = list(module.modules()) if callable(getattr(module, "modules", None)) else [module]
+    for submodule in submodules:
+        if getattr(submodule, "model_save_dir", None) is not None:
+            total += _onnx_bytes(submodule.model_save_dir)
+
+    if callable(getattr(module, "state_dict", None)):
+        tensors = list(module.state_dict(keep_vars=True).values())
+    elif hasattr(module, "parameters"):
+        tensors = list(module.parameters())
+        if hasattr(module, "buffers"):
+            tensors += list(module.buffers())
+    else:
+        return total
+
+    seen = set()
+    while tensors:
+        tensor = tensors.pop()
+        if isinstance(tensor, (tuple, list)):
+            # Quantized layers store (weight, bias) pairs
+            tensors.extend(tensor)
+            continue
+        # Tied weights show up more than once; count the storage only once.
+        if not hasattr(tensor, "numel") or id(tensor) in seen:
+            continue
+        seen.add(id(tensor))
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _onnx_bytes(directory):
+    try:
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+                   if name.endswith((".onnx", ".onnx_data")))
+    except OSError:
+        return 0
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loader = None
+        self.value = None
+        self.loaded = False
+        # pending -> loading -> ready, or failed (retried on the next use)
+        self.state = "pending"
+        self.started = None
+        self.error = None
+        self.load_seconds = 0.0
+        self.memory_bytes = 0
+        self.group = None
+        self.on_demand = False
+        self.pinned = False
+        self.warmup = None
+        self.last_used = 0.0
+
+
+class ModelRegistry:
+    """
+    Loads each tokenizer/model once and shares it across requests and threads.
+
+    Entries are keyed by `(role, name)`, e.g. `("paraphrase.model", "t5-small")`, so two services
+    that use the same checkpoint for different purposes do not collide. Loading takes a per-entry
+    lock, so concurrent first requests block on a single load instead of all loading in parallel,
+    while lookups of already-loaded entries do not contend with loads of other models.
+    """
+
+    def __init__(self, memory_budget_bytes=None, pinned_groups=None):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.memory_budget_bytes = MODEL_MEMORY_BUDGET_MB * 1024 * 1024 if memory_budget_bytes is None else memory_budget_bytes
+        self.pinned_groups = set(MODEL_PINNED if pinned_groups is None else pinned_groups)
+        self.evictions = 0
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+            return entry
+
+    def declare(self, role, name, loader, group=None, on_demand=None, warmup=None):
+        """
+        Records how to load `(role, name)` without loading it, so it can be loaded ahead of use by
+        `load_declared()` and shows up in `status()` before it is loaded.
+
+        Args:
+        - role (str), name (str): The entry, as for `get()`.
+        - loader (callable): Zero-argument callable that builds the object.
+        - group (str): Entries evicted and pinned together, e.g. "ner:<model>". Defaults to "role:name".
+        - on_demand (bool): Skip the entry in `load_declared()` and let the pool evict it (unless its group
+          is pinned).
+        - warmup (callable): Called with the loaded object before it is handed out.
+
+        Arguments left as None keep what an earlier declaration set, so a loader can be swapped on its own.
+        """
+        entry = self._entry((role, name))
+        entry.loader = loader
+        if group is not None or entry.group is None:
+            entry.group = group or f"{role}:{name}"
+        if on_demand is not None:
+            entry.on_demand = on_demand
+        if warmup is not None:
+            entry.warmup = warmup
+        entry.pinned = entry.pinned or not entry.on_demand or entry.group in self.pinned_groups
+
+    def get(self, role, name, loader=None):
+        """
+        Returns the object registered under `(role, name)`, loading it with `loader` on first use.
+
+        Args:
+        - role (str): What the object is used for, e.g. "ner.model".
+        - name (str): Model identifier, e.g. the Hugging Face checkpoint name.
+        - loader (callable): Zero-argument callable that builds the object. Defaults to the declared loader.
+
+        Returns:
+        - The shared tokenizer, model or pipeline.
+        """
+        entry = self._entry((role, name))
+        entry.last_used = time.monotonic()
+        # Lock-free fast path; `evict()` may clear the entry at any moment, so only trust a non-None snapshot
+        value = entry.value
+        if value is not None and entry.loaded:
+            return value
+
+        with entry.lock:
+            if not entry.loaded:
+                loader = loader or entry.loader
+                if loader is None:
+                    raise KeyError(f"No loader declared for {role} '{name}'.")
+                entry.state = "loading"
+                entry.started = time.perf_counter()
+                try:
+                    value = loader()
+                    # Inference only; make sure dropout and friends are off (ONNX Runtime models have no eval()).
+                    if callable(getattr(value, "eval", None)):
+                        value.eval()
+                    if entry.warmup is not None and MODEL_WARMUP:
+                        entry.warmup(value)
+                except Exception as exc:
+                    entry.state = "failed"
+                    entry.error = str(exc)
+                    raise
+                entry.load_seconds = time.perf_counter() - entry.started
+                entry.memory_bytes = estimate_memory_bytes(value)
+                entry.value = value
+                entry.loaded = True
+                entry.state = "ready"
+                entry.error = None
+            value = entry.value
+        self._enforce_budget(entry.group)
+        return value
+
+    def _group_entries(self, group):
+        with self._lock:
+            return [(key, entry) for key, entry in self._entries.items() if entry.group == group]
+
+    def groups(self):
+        """
+        Returns the names of the declared groups.
+        """
+        with self._lock:
+            return sorted({entry.group for entry in self._entries.values() if entry.group})
+
+    def load_group(self, group, pin=False):
+        """
+        Loads (and warms up) every entry of `group`, optionally pinning it so it is never evicted.
+
+        Raises:
+        - KeyError: If no entry belongs to `group`.
+        """
+        entries = self._group_entries(group)
+        if not entries:
+            raise KeyError(f"No models declared for '{group}'.")
+        if pin:
+            self.pinned_groups.add(group)
+            for _, entry in entries:
+                entry.pinned = True
+        for (role, name), _ in entries:
+            self.get(role, name)
+
+    def evict(self, group):
+        """
+        Drops the registry's references to the loaded entries of `group`; they load again on next use.
+        Entries that are loading right now are left alone.
+
+        Returns:
+        - bool: Whether anything was evicted.
+        """
+        evicted = False
+        for _, entry in self._group_entries(group):
+            if entry.pinned or not entry.loaded or not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                # `loaded` first, so a concurrent get() never sees loaded=True with no value
+                entry.loaded = False
+                entry.value = None
+                entry.state = "pending"
+                entry.memory_bytes = 0
+                evicted = True
+            finally:
+                entry.lock.release()
+        if evicted:
+            self.evictions += 1
+        return evicted
+
+    def _enforce_budget(self, keep):
+        # Evict the least recently used unpinned groups until the loaded models fit the budget again
+        if self.memory_budget_bytes <= 0:
+            return
+        while self.describe()["total_memory_bytes"] > self.memory_budget_bytes:
+            with self._lock:
+                last_used = {}
+                for entry in self._entries.values():
+                    if entry.loaded and not entry.pinned and entry.group != keep:
+                        last_used[entry.group] = max(last_used.get(entry.group, 0.0), entry.last_used)
+            if not last_used or not self.evict(min(last_used, key=last_used.get)):
+                return
+
+    def load_declared(self):
+        """
+        Loads every declared entry that is not loaded yet, in declaration order.
+
+        A failing load is recorded in `status()` and does not stop the others.
+
+        Returns:
+        - list: `(role, name, error)` for each entry that failed to load.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items()
+                    if entry.loader is not None and (entry.pinned or not entry.on_demand)]
+
+        failures = []
+        for role, name in keys:
+            try:
+                self.get(role, name)
+            except Exception as exc:
+                failures.append((role, name, str(exc)))
+        return failures
+
+    def is_loaded(self, role, name):
+        """
+        Returns True if `(role, name)` has finished loading.
+        """
+        with self._lock:
+            entry = self._entries.get((role, name))
+        return entry is not None and entry.loaded
+
+    def status(self):
+        """
+        Reports the load state of every declared or loaded entry.
+
+        Returns:
+        - list: Dicts with `role`, `name`, `group`, `state` (pending, loading, ready or failed), `seconds` (time
+          spent loading so far, or the total once ready), `on_demand`, `pinned` and `error` for failed loads.
+        """
+        with self._lock:
+            items = list(self._entries.items())
+
+        now = time.perf_counter()
+        statuses = []
+        for (role, name), entry in items:
+            if entry.state == "ready":
+                seconds = entry.load_seconds
+            elif entry.state == "loading":
+                seconds = now - entry.started
+            else:
+                seconds = 0.0
+            status = {"role": role, "name": name, "group": entry.group, "state": entry.state,
+                      "seconds": round(seconds, 3), "on_demand": entry.on_demand, "pinned": entry.pinned}
+            if entry.error:
+                status["error"] = entry.error
+            statuses.append(status)
+        return statuses
+
+    def describe(self):
+        """
+        Lists the loaded entries with their load time and estimated memory use.
+
+        Returns:
+        - dict: `models` (list of per-entry dicts), `total_memory_bytes`, `memory_budget_bytes` and the number
+          of `evictions` so far.
+        """
+        with self._lock:
+            items = list(self._entries.items())
+
+        models = []
+        total = 0
+        counted = set()
+        for (role, name), entry in items:
+            if not entry.loaded:
+                continue
+            models.append({
+                "role": role,
+                "name": name,
+                "load_seconds": round(entry.load_seconds, 3),
+                "memory_bytes": entry.memory_bytes,
+                "group": entry.group,
+                "pinned": entry.pinned,
+            })
+            # A pipeline holds the same weights as its registered model; count them once
+            module = getattr(entry.value, "model", entry.value)
+            if id(module) not in counted:
+                counted.add(id(module))
+                total += entry.memory_bytes
+        return {
+            "models": models,
+            "total_memory_bytes": total,
+            "memory_budget_bytes": int(self.memory_budget_bytes),
+            "evictions": self.evictions,
+        }
+
+
+# Shared instance used by every service module.
+registry = ModelRegistry()
@@ -11,132 +11,350 @@ Imports:
 Configuration:
     - NER_TOKENIZER: Tokenizer configuration for the NER model (default is "dbmdz/bert-large-cased-finetuned-conll03-english").
     - NER_MODEL: Model configuration for NER (default is "dbmdz/bert-large-cased-finetuned-conll03-english").
+    - NER_BACKEND: Inference backend, `torch`, `torch-int8` or `onnx` (default is "torch"; see `backends.py`).
+    - NER_MODELS: Comma-separated extra models requests may select with their `model` field (default is none).
+      They load on first use with their own tokenizer and may be evicted again (see `model_registry.py`).
+    - NER_ENABLED: Whether this service is served at all (default is True).
     - WORD_LIMIT: Limit for the number of words in the NER input (default is 400).
+    - NER_MAX_CONCURRENCY / NER_MAX_QUEUE: Size of the inference pool and of the wait queue in front of it
+      (see `executors.py`).
+
+Model Loading:
+    - The tokenizer, the model and the `transformers` NER pipeline around them are declared with the shared model
+      registry at import and loaded at startup, in the background or on first use (see MODEL_LOADING in `main.py`).
+      Each NER_MODELS entry is declared the same way, as an on-demand group "ner:<model>", and every pipeline is
+      warmed up with a short text once it loads.
 
 Functions:
-    - `merge_capitalized_sequences`: Merges sequences of capitalized words in the text. Useful for handling entities that span multiple tokens.
+    - `merge_entity_spans`: Merges token entities into entity spans (word pieces, same-type neighbours and trailing
+      capitalized words) in one linear pass over character offsets.
+    - `format_entities`: Formats merged spans as structured dicts or legacy strings.
+    - `recognize_many`: Runs the NER pipeline over a list of texts in one batched call. Concurrent requests are
+      micro-batched through it (see `batching.py`).
+    - `recognize_texts`: Raw entities for a list of texts, from the result cache or one batched pipeline call.
+
+Result Cache:
+    - NER output depends only on the model and the text, so results are cached (RESULT_CACHE_SIZE /
+      RESULT_CACHE_TTL) and identical requests in flight share one computation (see `result_cache.py`).
 
 API Endpoints:
-    (Further details about the API endpoints provided by this service module should be documented here.)
+    - POST `/`: Takes an `NERRequest` and returns the recognized entities. With `structured` set, each entity is
+      an object with `word`, `entity_group`, `score` and `start`/`end` character offsets; otherwise entities are
+      the legacy pretty strings.
+      With `chunking` (or CHUNK_LONG_TEXTS) enabled, long texts are split on tokens, run as one batch and the
+      entities stitched back with document offsets instead of being rejected (see `chunking.py`).
+    - POST `/batch`: Takes an `NERBatchRequest` with a list of texts and returns one result per text, in order.
+      Each result holds either `entities` or an `error` (e.g. when that text exceeds `WORD_LIMIT`).
+    - Both accept an optional `model` naming one of the allowed models; any other model is rejected with a 400.
+    - Both accept `priority` (`interactive`, the default for `/`, or `bulk`, the default for `/batch`) and
+      `deadline_ms`; work still queued when the deadline passes is dropped with a 504 (see `deadlines.py`).
+    - GET `/cache`: Reports result cache hit/miss/coalesced counters and size.
 
 """
 
 import re
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
-from decouple import config
+from fastapi.concurrency import run_in_threadpool
+from decouple import config, Csv
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+from typing import List, Optional
+from functools import partial
+from transformers import AutoTokenizer, pipeline
+from .model_registry import registry, select_model
+from .backends import load_token_classifier, registry_name
+from .batching import MicroBatcher, BATCH_MAX_TEXTS
+from .executors import InferenceExecutor
+from .chunking import (chunking_requested, chunk_text, stitch_entities, CHUNK_MAX_TOKENS, CHUNK_MAX_CHUNKS,
+                       CHUNK_OVERLAP_TOKENS)
+from .result_cache import ResultCache
+from .deadlines import request_options, Priority
+from .metrics import stage, count_error, instrument_pipeline
 
 NER_TOKENIZER = config('NER_TOKENIZER', default="dbmdz/bert-large-cased-finetuned-conll03-english")
 NER_MODEL = config('NER_MODEL', default="dbmdz/bert-large-cased-finetuned-conll03-english")
+NER_BACKEND = config('NER_BACKEND', default="torch")
+NER_MODELS = config('NER_MODELS', default="", cast=Csv())
+NER_ENABLED = config('NER_ENABLED', default=True, cast=bool)
 WORD_LIMIT = config('WORD_LIMIT', default=400, cast=int)
 
-def merge_capitalized_sequences(text, entities):
+# A capitalized word directly after an entity, e.g. "Cox" in "Jenny Cox"
+CAPITALIZED_CONTINUATION = re.compile(r'\s+[A-Z][a-z]+\b')
+
+def entity_group(label):
+    """
+    Strips the IOB prefix from a token label, e.g. "I-PER" -> "PER".
     """
-    Merges sequences of capitalized words in the text.
-    
+    return label[2:] if label[:2] in ("B-", "I-") else label
+
+def merge_entity_spans(text, entities):
+    """
+    Merges token-level entities into entity spans in a single pass over the tokens.
+
+    A token joins the current span when it is a word-piece continuation ("##s") or has the same entity group
+    and only whitespace separates it from the span (unless it is tagged "B-", which always starts a new
+    entity). When a span is closed it is extended over directly following capitalized words, so "Jenny Cox"
+    stays one entity even if "Cox" was tagged differently; tokens swallowed that way are skipped.
+
+    Each token is visited once and the capitalized-word extension only moves forward, so the cost is linear
+    in the number of tokens.
+
     Args:
     - text (str): Original input text.
-    - entities (list): List of recognized entities.
-    
+    - entities (list): Token entities from the pipeline, in text order, with `start`/`end` character offsets
+      (the pipeline provides these for fast tokenizers).
+
     Returns:
-    - list: List of merged entities.
+    - list: Spans as dicts with `word`, `entity` (label of the first token), `entity_group`, `score`
+      (mean over the span's tokens), `start` and `end`.
     """
+    spans = []
+    current = None
 
-    # Find sequences of capitalized words
-    capitalized_sequences = re.findall(r'\b([A-Z][a-z]+(?:\s[A-Z][a-z]+)*)\b', text)
+    def close(span):
+        match = CAPITALIZED_CONTINUATION.match(text, span['end'])
+        while match:
+            span['end'] = match.end()
+            match = CAPITALIZED_CONTINUATION.match(text, span['end'])
+        span['word'] = " ".join(text[span['start']:span['end']].split())
+        span['score'] = span.pop('score_sum') / span.pop('tokens')
+        spans.append(span)
 
-    merged_entities = entities.copy()
+    for entity in entities:
+        start, end = int(entity['start']), int(entity['end'])
+        group = entity_group(entity['entity'])
+        score = float(entity['score'])
+
+        if current is not None:
+            gap = text[current['end']:start]
+            continuation = entity['word'].startswith("##") or (
+                group == current['entity_group'] and not entity['entity'].startswith("B-") and (gap == "" or gap.isspace()))
+            if continuation:
+                current['end'] = max(current['end'], end)
+                current['score_sum'] += score
+                current['tokens'] += 1
+                continue
+            close(current)
+            current = None
 
-    for sequence in capitalized_sequences:
-        sequence_tokens = sequence.split()
-        
-        # If the sequence is just one word or is the start of the text, skip it
-        if len(sequence_tokens) == 1 or text.startswith(sequence):
+        # Already covered by the capitalized extension of the previous span
+        if spans and start < spans[-1]['end']:
             continue
 
-        # Find entities that match the start of the sequence
-        matching_entities = [e for e in merged_entities if e['word'] == sequence_tokens[0]]
+        current = {'entity': entity['entity'], 'entity_group': group, 'start': start, 'end': end,
+                   'score_sum': score, 'tokens': 1}
 
-        # If the first word of the sequence is recognized as an entity
-        if matching_entities:
-            # Take the first matching entity (assuming it's the most relevant)
-            entity = matching_entities[0]
+    if current is not None:
+        close(current)
+    return spans
 
-            # Update the word in the entity to the full sequence
-            entity_index = merged_entities.index(entity)
-            merged_entities[entity_index]['word'] = sequence
+# Create a router instance
+ner_router = APIRouter()
+
+MODEL_NAME = registry_name(NER_MODEL, NER_BACKEND)
+
+# The configured model comes first and is the default; requests may select any of them by name
+ALLOWED_MODELS = list(dict.fromkeys([NER_MODEL, *NER_MODELS]))
+
+def tokenizer_name(model):
+    # Extra models bring their own tokenizer
+    return NER_TOKENIZER if model == NER_MODEL else model
+
+def get_tokenizer(model=NER_MODEL):
+    return registry.get("ner.tokenizer", tokenizer_name(model))
+
+def get_model(model=NER_MODEL):
+    return registry.get("ner.model", registry_name(model, NER_BACKEND))
 
-            # Remove subsequent entities that are part of the sequence
-            for token in sequence_tokens[1:]:
-                token_entities = [e for e in merged_entities if e['word'] == token or e['word'] == "##" + token]
-                for te in token_entities:
-                    merged_entities.remove(te)
+def get_pipeline(model=NER_MODEL):
+    return registry.get("ner.pipeline", registry_name(model, NER_BACKEND))
 
-    return merged_entities
+def declare_model(model):
+    # Tokenizer, model and pipeline are one group: they are loaded, pinned and evicted together
+    group = f"ner:{model}"
+    on_demand = model != NER_MODEL
+    name = registry_name(model, NER_BACKEND)
+    registry.declare("ner.tokenizer", tokenizer_name(model),
+                     lambda: AutoTokenizer.from_pretrained(tokenizer_name(model)), group=group, on_demand=on_demand)
+    registry.declare("ner.model", name, lambda: load_token_classifier(model, NER_BACKEND),
+                     group=group, on_demand=on_demand)
+    registry.declare("ner.pipeline", name,
+                     lambda: instrument_pipeline(pipeline("ner", model=get_model(model), tokenizer=get_tokenizer(model)), "ner"),
+                     group=group, on_demand=on_demand, warmup=lambda pipe: pipe(["Warm up."]))
 
-def merge_adjacent_entities(entities):
+# Declare the tokenizer, model and pipeline with the shared registry; they load at startup or on first use
+if NER_ENABLED:
+    for allowed_model in ALLOWED_MODELS:
+        declare_model(allowed_model)
+
+def resolve_model(model):
+    """
+    Returns the model a request selected, or the default one; raises `ModelNotAllowed` for any other model.
+    """
+    return select_model("ner", model, ALLOWED_MODELS)
+
+def chunk_document(text, model=NER_MODEL):
+    # Chunks must fit in the model's window, leaving room for [CLS] and [SEP]
+    tokenizer = get_tokenizer(model)
+    with stage("ner", "tokenize"):
+        return chunk_text(tokenizer, text, min(CHUNK_MAX_TOKENS, tokenizer.model_max_length - 2))
+
+def recognize_many(texts, model=NER_MODEL):
     """
-    Merges adjacent entities based on the same entity type, token continuation, and '##s' pattern.
-    
+    Runs the NER pipeline over a list of texts in one batched call.
+
     Args:
-    - entities (list): List of recognized entities.
-    
+    - texts (list): Input texts.
+    - model (str): One of ALLOWED_MODELS.
+
     Returns:
-    - list: List of merged entities.
+    - list: One list of raw entities per input text, in input order.
     """
-    if not entities:
-        return []
-
-    merged_entities = [entities[0]]
-
-    for entity in entities[1:]:
-        prev_entity = merged_entities[-1]
-        
-        # Merge entities if the current entity starts with "##"
-        if entity['word'].startswith("##"):
-            prev_entity['word'] += entity['word'].replace("##", "")
-            prev_entity['score'] = (prev_entity['score'] + entity['score']) / 2  # average score
-        # Merge entities of the same type
-        elif entity['entity'] == prev_entity['entity']:
-            prev_entity['word'] += " " + entity['word'].replace("##", "")
-            prev_entity['score'] = (prev_entity['score'] + entity['score']) / 2  # average score
-        else:
-            merged_entities.append(entity)
-
-    return merged_entities
+    # Tokenization and decoding are timed as their own stages inside this one (see metrics.py)
+    with stage("ner", "forward"):
+        return get_pipeline(model)(texts, batch_size=len(texts))
 
-# Create a router instance
-ner_router = APIRouter()
+# Inference runs on a dedicated pool with its own concurrency limit and wait queue
+ner_executor = InferenceExecutor("NER")
+
+# Concurrent requests for the same model are gathered and run through its pipeline together
+ner_batchers = {model: MicroBatcher(partial(recognize_many, model=model), executor=ner_executor)
+                for model in ALLOWED_MODELS}
+ner_batcher = ner_batchers[NER_MODEL]
 
-# Load tokenizer and model
-tokenizer = AutoTokenizer.from_pretrained(NER_TOKENIZER)
-model = AutoModelForTokenClassification.from_pretrained(NER_MODEL)
+# Raw entities by (model, text); identical requests in flight share one pipeline call
+ner_results = ResultCache("ner")
 
-# Create NER pipeline
-nlp_ner = pipeline("ner", model=model, tokenizer=tokenizer)
+def result_key(model, *parts):
+    return ner_results.key(registry_name(model, NER_BACKEND), *parts)
+
+async def recognize(text, length, model=NER_MODEL):
+    # One text, micro-batched with concurrent requests
+    async with ner_executor.admit():
+        return await ner_batchers[model].submit(text, length)
+
+async def recognize_chunks(chunks, model=NER_MODEL):
+    # The chunks of one long document, run as one batch and stitched back together
+    async with ner_executor.admit():
+        entities_per_chunk = await ner_executor.run(recognize_many, [chunk.text for chunk in chunks], model)
+    return stitch_entities(chunks, entities_per_chunk)
+
+async def recognize_texts(texts, model=NER_MODEL):
+    """
+    Returns the raw entities of each text, in order. Cached texts are served as they are; the rest (each
+    distinct text once) go through the pipeline in one call.
+    """
+    keys = [result_key(model, text) for text in texts]
+    found = {key: ner_results.get(key) for key in set(keys)}
+    missing = {key: text for key, text in zip(keys, texts) if found[key] is None}
+    if missing:
+        async with ner_executor.admit():
+            entities_per_text = await ner_executor.run(recognize_many, list(missing.values()), model)
+        for key, entities in zip(missing, entities_per_text):
+            ner_results.put(key, entities)
+            found[key] = entities
+    return [found[key] for key in keys]
+
+def format_entities(text, entities, structured=False):
+    """
+    Merges raw pipeline output into entity spans and formats them for the response.
+
+    Args:
+    - text (str): Original input text.
+    - entities (list): Raw entities returned by the pipeline for `text`.
+    - structured (bool): Return dicts with offsets instead of the legacy pretty strings.
+
+    Returns:
+    - list: Entity dicts (`word`, `entity_group`, `score`, `start`, `end`) when `structured`,
+      otherwise formatted entity strings.
+    """
+    with stage("ner", "merge"):
+        spans = merge_entity_spans(text, entities)
+
+    with stage("ner", "serialize"):
+        if structured:
+            return [{'word': span['word'], 'entity_group': span['entity_group'], 'score': round(span['score'], 4),
+                     'start': span['start'], 'end': span['end']} for span in spans]
+
+        # Legacy format: pretty strings
+        formatted_entities = []
+        for span in spans:
+            formatted_entity = f"{{'word': '{span['word']}', 'score': {span['score']:.4f}, 'entity': '{span['entity']}'}}"
+            formatted_entities.append(formatted_entity)
+        return formatted_entities
 
 class NERRequest(BaseModel):
     text: str
+    chunking: Optional[bool] = None
+    structured: bool = False
+    model: Optional[str] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
 
 class NERResponse(BaseModel):
     entities: list
 
+class NERBatchRequest(BaseModel):
+    texts: List[str]
+    structured: bool = False
+    model: Optional[str] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
+
+class NERBatchResponse(BaseModel):
+    results: list
+
 @ner_router.post("/", response_model=NERResponse) 
 async def named_entity_recognition(request: NERRequest):
-    words = request.text.split()
-    if len(words) > WORD_LIMIT:
+    with stage("ner", "validate"):
+        words = request.text.split()
+        model = resolve_model(request.model)
+        request_options(request.priority, request.deadline_ms)
+    if chunking_requested(request.chunking):
+        # Long documents are split on tokens, run as one batch and stitched back together
+        async with ner_executor.admit():
+            chunks = await run_in_threadpool(chunk_document, request.text, model)
+        if len(chunks) > CHUNK_MAX_CHUNKS:
+            count_error("ner", "too_many_chunks")
+            return JSONResponse(content={"error": f"Input text exceeds {CHUNK_MAX_CHUNKS} chunks. Please provide shorter text."}, status_code=400)
+        if len(chunks) > 1:
+            key = result_key(model, "chunked", CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, request.text)
+            entities = await ner_results.get_or_compute(key, lambda: recognize_chunks(chunks, model))
+            return {"entities": format_entities(request.text, entities, request.structured)}
+    elif len(words) > WORD_LIMIT:
+        count_error("ner", "input_too_long")
         return JSONResponse(content={"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
 
-    entities = nlp_ner(request.text)
-    entities = merge_adjacent_entities(entities)
-    entities = merge_capitalized_sequences(request.text, entities)
+    entities = await ner_results.get_or_compute(result_key(model, request.text),
+                                                lambda: recognize(request.text, len(words), model))
+    return {"entities": format_entities(request.text, entities, request.structured)}
 
-    # Convert numpy types to standard types and format as pretty strings
-    formatted_entities = []
-    for entity in entities:
-        formatted_entity = f"{{'word': '{entity['word']}', 'score': {float(entity['score']):.4f}, 'entity': '{entity['entity']}'}}"
-        formatted_entities.append(formatted_entity)
+@ner_router.post("/batch", response_model=NERBatchResponse)
+async def named_entity_recognition_batch(request: NERBatchRequest):
+    if len(request.texts) > BATCH_MAX_TEXTS:
+        count_error("ner", "batch_too_large")
+        return JSONResponse(content={"error": f"Batch exceeds {BATCH_MAX_TEXTS} texts. Please split it into smaller batches."}, status_code=400)
+
+    # Oversized texts get their own error; everything else goes through the pipeline in one call
+    results = [None] * len(request.texts)
+    accepted = []
+    with stage("ner", "validate"):
+        model = resolve_model(request.model)
+        request_options(request.priority, request.deadline_ms, default_lane="bulk")
+        for index, text in enumerate(request.texts):
+            if len(text.split()) > WORD_LIMIT:
+                count_error("ner", "input_too_long")
+                results[index] = {"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}
+            else:
+                accepted.append(index)
+
+    if accepted:
+        texts = [request.texts[index] for index in accepted]
+        for index, text, entities in zip(accepted, texts, await recognize_texts(texts, model)):
+            results[index] = {"entities": format_entities(text, entities, request.structured)}
+
+    return {"results": results}
 
-    return {"entities": formatted_entities}
+@ner_router.get("/cache")
+def ner_cache_stats():
+    return ner_results.stats()
@@ -9,7 +9,36 @@ Imports:
 
 Configuration:
     - Paraphrasing model behavior configurations like temperature, top_k, top_p, repetition penalty, and model size.
+    - PARAPHRASE_BACKEND: Inference backend, `torch`, `torch-int8` or `onnx` (default is "torch"; see `backends.py`).
+    - PARAPHRASE_MODELS: Comma-separated extra T5 models requests may select with their `model` field (default is
+      none). They load on first use and may be evicted again (see `model_registry.py`).
+    - PARAPHRASE_ENABLED: Whether this service is served at all (default is true).
     - WORD_LIMIT: Specifies the limit for the number of words in the paraphrasing input (default is 400).
+    - PARAPHRASE_SPLIT_SENTENCES: Paraphrase sentence by sentence by default (default is false; see below).
+    - PARAPHRASE_LENGTH_RATIO / PARAPHRASE_LENGTH_MARGIN: Output tokens a sentence may generate in that mode:
+      its input tokens times the ratio, plus the margin (defaults are 1.5 and 8).
+    - PARAPHRASE_MAX_CONCURRENCY / PARAPHRASE_MAX_QUEUE: Size of the inference pool and of the wait queue in front
+      of it (see `executors.py`).
+
+Model Loading:
+    - The T5 tokenizer and model are declared with the shared model registry and loaded once, at startup, in the
+      background or on first use (see MODEL_LOADING in `main.py`), instead of on every request.
+    - Each PARAPHRASE_MODELS entry is declared as an on-demand group "paraphrase:<model>". Every model is warmed
+      up with a short generate once it loads.
+
+Sentence Mode:
+    - By default a text is paraphrased as one sequence of up to WORD_LIMIT output tokens, so long texts take as
+      long as the whole text and t5-small loses quality. With `split_sentences` (or PARAPHRASE_SPLIT_SENTENCES),
+      texts are split into sentences with nltk's Punkt tokenizer and every sentence of the request (or of the
+      micro-batch) goes through one padded `generate` call. Each sentence ends at its own output budget, and
+      generation stops once every sentence has ended, so latency follows the longest sentence rather than the
+      whole text. The paraphrased sentences are joined back in order with the original whitespace between them.
+      `/stream` always paraphrases the whole text.
+
+Result Cache:
+    - `/` and `/batch` decode greedily, so their output depends only on the model, the generation settings and
+      the text. Those results are cached (RESULT_CACHE_SIZE / RESULT_CACHE_TTL) and identical requests in flight
+      share one `generate` call (see `result_cache.py`). `/multi/` samples and is never cached.
 
 Router:
     - An instance of the FastAPI APIRouter is created to manage routes specific to this service.
@@ -18,27 +47,64 @@ Models:
     - ParaphraseRequest: Represents the structure of an input request for paraphrasing.
     - ParaphraseResponse: Represents the structure of the output after paraphrasing.
     - ParaphraseMultipleRequest: Used for requests where multiple paraphrase outputs are desired.
+    - ParaphraseBatchRequest / ParaphraseBatchResponse: A list of texts and the per-text results.
 
 API Endpoints:
     - POST `/`: Takes a `ParaphraseRequest` and returns a `ParaphraseResponse` with the paraphrased text.
+      Concurrent requests are micro-batched (see `batching.py`) into a single padded `model.generate` call.
+    - POST `/batch`: Paraphrases a list of texts in one `model.generate` call and returns one result per text, in order.
+      Each result holds either `paraphrased_text` or an `error` (e.g. when that text exceeds `WORD_LIMIT`).
+    - GET `/cache`: Reports result cache hit/miss/coalesced counters and size.
+    - `/`, `/batch`, `/multi/` and `/stream` accept an optional `model` naming one of the allowed models; any other
+      model is rejected with a 400.
+    - They also accept `priority` (`bulk` is the default for `/batch`, `interactive` for the rest) and
+      `deadline_ms` (see `deadlines.py`). A `generate` call stops early once its deadline passes or every client
+      waiting for it has disconnected.
+    - POST `/stream`: Takes a `ParaphraseRequest` and streams the paraphrase as Server-Sent Events while it is
+      generated: one `data:` event per decoded piece (a JSON string), then `event: done`, or `event: error` (a JSON
+      string) if generation fails or its deadline passes first (a deadline that has already passed when the
+      request arrives gets a 504). Generation stops when the client disconnects.
     (Further details about other API endpoints provided by this service module should be documented here.)
 
 """
 
 import os
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+import json
+import math
+import asyncio
+import threading
+from functools import partial
+from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from transformers import T5ForConditionalGeneration, T5Tokenizer
-from typing import Optional
+from nltk.tokenize.punkt import PunktSentenceTokenizer
+from transformers import T5Tokenizer, TextIteratorStreamer, StoppingCriteria, LogitsProcessor
+from typing import List, Optional
+from .model_registry import registry, select_model
+from .backends import load_seq2seq, registry_name
+from .batching import MicroBatcher, BATCH_MAX_TEXTS
+from .executors import InferenceExecutor
+from .metrics import stage, count_error, observe_tokens, observe_features
+from .result_cache import ResultCache
+from .deadlines import request_options, cancel_on_disconnect, cancelled, current_deadline, Priority, DeadlineExceeded
 
 # Reading environment variables or setting default values
 PARAPHRASE_TEMPERATURE = float(os.environ.get("PARAPHRASE_TEMPERATURE", 0.9))
 PARAPHRASE_MODEL_SIZE = os.environ.get("PARAPHRASE_MODEL_SIZE", "t5-small")
+PARAPHRASE_BACKEND = os.environ.get("PARAPHRASE_BACKEND", "torch")
+PARAPHRASE_MODELS = [model.strip() for model in os.environ.get("PARAPHRASE_MODELS", "").split(",") if model.strip()]
+PARAPHRASE_ENABLED = os.environ.get("PARAPHRASE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
 PARAPHRASE_TOP_P = float(os.environ.get("PARAPHRASE_TOP_P", 0.9))
 PARAPHRASE_TOP_K = int(os.environ.get("PARAPHRASE_TOP_K", 35))
 PARAPHRASE_REPETITION_PENALTY = float(os.environ.get("PARAPHRASE_REPETITION_PENALTY", 1.2))
 WORD_LIMIT = int(os.environ.get("WORD_LIMIT", 400))
+PARAPHRASE_SPLIT_SENTENCES = os.environ.get("PARAPHRASE_SPLIT_SENTENCES", "false").lower() in ("1", "true", "yes", "on")
+PARAPHRASE_LENGTH_RATIO = float(os.environ.get("PARAPHRASE_LENGTH_RATIO", 1.5))
+PARAPHRASE_LENGTH_MARGIN = int(os.environ.get("PARAPHRASE_LENGTH_MARGIN", 8))
+
+# How often /stream checks for a disconnected client while it waits for the next piece
+STREAM_POLL_SECONDS = 0.5
 
 # Create a router instance
 paraphraser_router = APIRouter()
@@ -46,6 +112,10 @@ paraphraser_router = APIRouter()
 # Define the request and response models
 class ParaphraseRequest(BaseModel):
     text: str
+    model: Optional[str] = None
+    split_sentences: Optional[bool] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
 
 class ParaphraseResponse(BaseModel):
     paraphrased_text: str
@@ -53,50 +123,450 @@ class ParaphraseResponse(BaseModel):
 class ParaphraseMultipleRequest(BaseModel):
     text: str
     return_sequences: Optional[int] = 5
+    model: Optional[str] = None
+    split_sentences: Optional[bool] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
+
+class ParaphraseBatchRequest(BaseModel):
+    texts: List[str]
+    model: Optional[str] = None
+    split_sentences: Optional[bool] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
+
+class ParaphraseBatchResponse(BaseModel):
+    results: list
     
 @paraphraser_router.post("/", response_model=ParaphraseResponse)
-async def paraphrase_text(request: ParaphraseRequest):
-    words = request.text.split()
+async def paraphrase_text(request: ParaphraseRequest, http_request: Request = None):
+    with stage("paraphrase", "validate"):
+        words = request.text.split()
+        model = resolve_model(request.model)
+        split = sentence_mode(request.split_sentences)
+        request_options(request.priority, request.deadline_ms)
     if len(words) > WORD_LIMIT:
+        count_error("paraphrase", "input_too_long")
         return JSONResponse(content={"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
-    paraphrased_text = paraphrase(request.text)
+    # A client that gives up (e.g. times out) cancels its generate() instead of leaving it running
+    compute = paraphrase_results.get_or_compute(greedy_key(request.text, model, split),
+                                                lambda: paraphrase_greedy(request.text, len(words), model, split))
+    paraphrased_text = await cancel_on_disconnect("paraphrase", http_request, compute)
     return {"paraphrased_text": paraphrased_text}
 
-def paraphrase(text):
-  tokenizer = T5Tokenizer.from_pretrained(PARAPHRASE_MODEL_SIZE)
-  model = T5ForConditionalGeneration.from_pretrained(PARAPHRASE_MODEL_SIZE)
-  input_ids = tokenizer.encode("paraphrase: " + text, return_tensors="pt")
-  output = model.generate(input_ids, 
-                        max_length=WORD_LIMIT, 
-                        temperature=PARAPHRASE_TEMPERATURE, 
-                        top_p=PARAPHRASE_TOP_P, 
-                        top_k=PARAPHRASE_TOP_K, 
-                        repetition_penalty=PARAPHRASE_REPETITION_PENALTY)
-  paraphrased_text = tokenizer.decode(output[0], skip_special_tokens=True)
+# The configured model comes first and is the default; requests may select any of them by name
+ALLOWED_MODELS = list(dict.fromkeys([PARAPHRASE_MODEL_SIZE, *PARAPHRASE_MODELS]))
+
+def resolve_model(model):
+  # The model a request selected, or the default one; any other model raises ModelNotAllowed
+  return select_model("paraphrase", model, ALLOWED_MODELS)
+
+def sentence_mode(requested=None):
+  # A request's `split_sentences`, or PARAPHRASE_SPLIT_SENTENCES when it sets none
+  return PARAPHRASE_SPLIT_SENTENCES if requested is None else requested
+
+def get_tokenizer(model=PARAPHRASE_MODEL_SIZE):
+  return registry.get("paraphrase.tokenizer", model)
+
+def get_model(model=PARAPHRASE_MODEL_SIZE):
+  return registry.get("paraphrase.model", registry_name(model, PARAPHRASE_BACKEND))
+
+def warm_up(model, loaded):
+  # A few decoding steps, so the first request does not pay for one-time initialization
+  inputs = get_tokenizer(model)(["paraphrase: Warm up."], return_tensors="pt")
+  loaded.generate(inputs.input_ids, max_length=8)
+
+def declare_model(model):
+  # Tokenizer and model are one group: they are loaded, pinned and evicted together
+  group = f"paraphrase:{model}"
+  on_demand = model != PARAPHRASE_MODEL_SIZE
+  registry.declare("paraphrase.tokenizer", model, lambda: T5Tokenizer.from_pretrained(model),
+                   group=group, on_demand=on_demand)
+  registry.declare("paraphrase.model", registry_name(model, PARAPHRASE_BACKEND),
+                   lambda: load_seq2seq(model, PARAPHRASE_BACKEND), group=group, on_demand=on_demand,
+                   warmup=partial(warm_up, model))
+
+# T5 is declared with the shared registry and loaded at startup, in the background or on first use
+if PARAPHRASE_ENABLED:
+  for allowed_model in ALLOWED_MODELS:
+    declare_model(allowed_model)
+
+@paraphraser_router.post("/batch", response_model=ParaphraseBatchResponse)
+async def paraphrase_text_batch(request: ParaphraseBatchRequest, http_request: Request = None):
+    if len(request.texts) > BATCH_MAX_TEXTS:
+        count_error("paraphrase", "batch_too_large")
+        return JSONResponse(content={"error": f"Batch exceeds {BATCH_MAX_TEXTS} texts. Please split it into smaller batches."}, status_code=400)
+
+    # Oversized texts get their own error; everything else is generated in one call
+    results = [None] * len(request.texts)
+    accepted = []
+    with stage("paraphrase", "validate"):
+        model = resolve_model(request.model)
+        split = sentence_mode(request.split_sentences)
+        request_options(request.priority, request.deadline_ms, default_lane="bulk")
+        for index, text in enumerate(request.texts):
+            if len(text.split()) > WORD_LIMIT:
+                count_error("paraphrase", "input_too_long")
+                results[index] = {"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}
+            else:
+                accepted.append(index)
+
+    if accepted:
+        paraphrased = await paraphrase_texts([request.texts[index] for index in accepted], model, http_request, split)
+        for index, paraphrased_text in zip(accepted, paraphrased):
+            results[index] = {"paraphrased_text": paraphrased_text}
+
+    return {"results": results}
+
+async def paraphrase_texts(texts, model=PARAPHRASE_MODEL_SIZE, http_request=None, split_sentences=None):
+  # Greedy paraphrases in order: cached texts are served as they are, the rest (each distinct text once) are
+  # generated together. The generate() call is cancelled if `http_request`'s client disconnects
+  split = sentence_mode(split_sentences)
+  keys = [greedy_key(text, model, split) for text in texts]
+  found = {key: paraphrase_results.get(key) for key in set(keys)}
+  missing = {key: text for key, text in zip(keys, texts) if found[key] is None}
+  if missing:
+    async with paraphrase_executor.admit():
+      generation = paraphrase_executor.run(paraphrase_many, list(missing.values()), model, split)
+      paraphrased = await cancel_on_disconnect("paraphrase", http_request, generation)
+    for key, paraphrased_text in zip(missing, paraphrased):
+      paraphrase_results.put(key, paraphrased_text)
+      found[key] = paraphrased_text
+  return [found[key] for key in keys]
+
+@paraphraser_router.get("/cache")
+def paraphrase_cache_stats():
+    return paraphrase_results.stats()
+
+def paraphrase(text, model_name=PARAPHRASE_MODEL_SIZE):
+  tokenizer = get_tokenizer(model_name)
+  model = get_model(model_name)
+  with stage("paraphrase", "tokenize"):
+    input_ids = tokenizer.encode("paraphrase: " + text, return_tensors="pt")
+  observe_tokens("paraphrase", input_ids)
+  with stage("paraphrase", "forward"):
+    output = model.generate(input_ids, 
+                          max_length=WORD_LIMIT, 
+                          temperature=PARAPHRASE_TEMPERATURE, 
+                          top_p=PARAPHRASE_TOP_P, 
+                          top_k=PARAPHRASE_TOP_K, 
+                          repetition_penalty=PARAPHRASE_REPETITION_PENALTY,
+                          stopping_criteria=stopping_criteria())
+  with stage("paraphrase", "decode"):
+    paraphrased_text = tokenizer.decode(output[0], skip_special_tokens=True)
   return paraphrased_text
 
+def paraphrase_many(texts, model_name=PARAPHRASE_MODEL_SIZE, split_sentences=None):
+  # Same generation settings as paraphrase(), but one padded generate() call for the whole list
+  if sentence_mode(split_sentences):
+    return [variants[0] for variants in paraphrase_sentences(texts, model_name)]
+  tokenizer = get_tokenizer(model_name)
+  model = get_model(model_name)
+  with stage("paraphrase", "tokenize"):
+    inputs = tokenizer(["paraphrase: " + text for text in texts], return_tensors="pt", padding=True)
+  observe_features("paraphrase", inputs)
+  with stage("paraphrase", "forward"):
+    outputs = model.generate(inputs.input_ids,
+                             attention_mask=inputs.attention_mask,
+                             max_length=WORD_LIMIT, 
+                             temperature=PARAPHRASE_TEMPERATURE, 
+                             top_p=PARAPHRASE_TOP_P, 
+                             top_k=PARAPHRASE_TOP_K, 
+                             repetition_penalty=PARAPHRASE_REPETITION_PENALTY,
+                             stopping_criteria=stopping_criteria())
+  with stage("paraphrase", "decode"):
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+class StopWhenSet(StoppingCriteria):
+  # Lets another thread end generate() early, e.g. when the client disconnects
+  def __init__(self, event):
+    self.event = event
+
+  def __call__(self, input_ids, scores, **kwargs):
+    return self.event.is_set()
+
+class StopWhenCancelled(StoppingCriteria):
+  # Ends generate() once its callers have all gone away or its deadline has passed (see deadlines.py). It raises
+  # instead of stopping, as the output so far is cut short and must not be returned as a paraphrase
+  def __init__(self):
+    pass
+
+  def __call__(self, input_ids, scores, **kwargs):
+    if cancelled():
+      raise DeadlineExceeded("paraphrase")
+    return False
+
+class EndAtBudget(LogitsProcessor):
+  # Forces EOS on each row once it has generated its own budget of tokens, so the short sentences of a batch
+  # finish as soon as they should instead of running on as long as the longest one
+  def __init__(self, budgets, eos_token_id):
+    self.budgets = budgets
+    self.eos_token_id = eos_token_id
+
+  def __call__(self, input_ids, scores):
+    # The decoder input starts with the decoder start token; everything after it was generated
+    generated = input_ids.shape[-1] - 1
+    for row, budget in enumerate(self.budgets):
+      if generated >= budget:
+        scores[row, :] = -float("inf")
+        scores[row, self.eos_token_id] = 0
+    return scores
+
+_sentence_tokenizer = None
+
+def split_sentences(text):
+  """
+  Splits `text` into sentences with nltk's Punkt tokenizer.
+
+  Uses the pretrained English model when its data is installed (`python -m nltk.downloader punkt`), and
+  otherwise an untrained Punkt tokenizer, which needs no data but knows fewer abbreviations.
+
+  Returns:
+  - tuple: The sentences, and the text before, between and after them (one more than there are sentences),
+    so `separators[0] + sentences[0] + separators[1] + ...` rebuilds `text`.
+  """
+  global _sentence_tokenizer
+  if _sentence_tokenizer is None:
+    import nltk
+    try:
+      _sentence_tokenizer = nltk.data.load("tokenizers/punkt/english.pickle")
+    except LookupError:
+      _sentence_tokenizer = PunktSentenceTokenizer()
+  sentences, separators, end = [], [], 0
+  for start, stop in _sentence_tokenizer.span_tokenize(text):
+    separators.append(text[end:start])
+    sentences.append(text[start:stop])
+    end = stop
+  separators.append(text[end:])
+  return sentences, separators
+
+def token_counts(inputs):
+  # Unpadded length of each row of a padded tokenizer output
+  mask = inputs.attention_mask
+  return [int(count) for count in mask.sum(-1).tolist()] if hasattr(mask, "sum") else [sum(row) for row in mask]
+
+def sentence_budgets(counts):
+  # Output tokens each sentence may generate: proportional to its input, and never more than the document cap
+  return [min(WORD_LIMIT, math.ceil(count * PARAPHRASE_LENGTH_RATIO) + PARAPHRASE_LENGTH_MARGIN) for count in counts]
+
+def paraphrase_sentences(texts, model_name=PARAPHRASE_MODEL_SIZE, return_sequences=1, sample=False):
+  """
+  Paraphrases texts sentence by sentence: the sentences of all texts go through one padded `generate` call, each
+  with its own output budget (see `sentence_budgets`), and are put back together in order.
+
+  Args:
+  - texts (list): Input texts.
+  - model_name (str): One of ALLOWED_MODELS.
+  - return_sequences (int): Paraphrases per text; variant `k` of a text is made of variant `k` of each sentence.
+  - sample (bool): Sample (as `/multi/` does) instead of decoding greedily.
+
+  Returns:
+  - list: For each text, a list of `return_sequences` paraphrases.
+  """
+  tokenizer = get_tokenizer(model_name)
+  model = get_model(model_name)
+  split = [split_sentences(text) for text in texts]
+  sentences = [sentence for text_sentences, _ in split for sentence in text_sentences]
+  decoded = []
+  if sentences:
+    with stage("paraphrase", "tokenize"):
+      inputs = tokenizer(["paraphrase: " + sentence for sentence in sentences], return_tensors="pt", padding=True)
+    observe_features("paraphrase", inputs)
+    budgets = sentence_budgets(token_counts(inputs))
+    # Rows come back grouped by sentence, `return_sequences` per sentence
+    row_budgets = [budget for budget in budgets for _ in range(return_sequences)]
+    with stage("paraphrase", "forward"):
+      # Greedy decoding stops once every row has ended, at the latest when its budget forces EOS
+      outputs = model.generate(inputs.input_ids,
+                               attention_mask=inputs.attention_mask,
+                               max_new_tokens=max(budgets),
+                               logits_processor=[EndAtBudget(row_budgets, tokenizer.eos_token_id)],
+                               do_sample=sample,
+                               temperature=PARAPHRASE_TEMPERATURE,
+                               top_p=PARAPHRASE_TOP_P,
+                               top_k=PARAPHRASE_TOP_K,
+                               repetition_penalty=PARAPHRASE_REPETITION_PENALTY,
+                               num_return_sequences=return_sequences,
+                               stopping_criteria=stopping_criteria())
+    with stage("paraphrase", "decode"):
+      decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+  results = []
+  row = 0
+  for text_sentences, separators in split:
+    rows = decoded[row:row + len(text_sentences) * return_sequences]
+    row += len(rows)
+    variants = []
+    for variant in range(return_sequences):
+      pieces = [separators[0]]
+      for index in range(len(text_sentences)):
+        pieces += [rows[index * return_sequences + variant], separators[index + 1]]
+      variants.append("".join(pieces).strip())
+    results.append(variants)
+  return results
+
+def stopping_criteria(*criteria):
+  # generate() takes any list of criteria; a plain list keeps the stub models (stub_models.py) torch-free
+  return [*criteria, StopWhenCancelled()]
+
+def paraphrase_streaming(text, streamer, stop, model_name=PARAPHRASE_MODEL_SIZE):
+  # Same generation settings as paraphrase(); decoded text is pushed to `streamer` as it is produced
+  tokenizer = get_tokenizer(model_name)
+  model = get_model(model_name)
+  with stage("paraphrase", "tokenize"):
+    input_ids = tokenizer.encode("paraphrase: " + text, return_tensors="pt")
+  observe_tokens("paraphrase", input_ids)
+  try:
+    # Includes decoding, which the streamer does as tokens are produced
+    with stage("paraphrase", "forward"):
+      model.generate(input_ids,
+                     streamer=streamer,
+                     stopping_criteria=stopping_criteria(StopWhenSet(stop)),
+                     max_length=WORD_LIMIT, 
+                     temperature=PARAPHRASE_TEMPERATURE, 
+                     top_p=PARAPHRASE_TOP_P, 
+                     top_k=PARAPHRASE_TOP_K, 
+                     repetition_penalty=PARAPHRASE_REPETITION_PENALTY)
+  finally:
+    # Make sure the consumer is released even if generate() fails
+    streamer.end()
+
+@paraphraser_router.post("/stream")
+async def paraphrase_text_stream(request: ParaphraseRequest, http_request: Request = None):
+    with stage("paraphrase", "validate"):
+        words = request.text.split()
+        model = resolve_model(request.model)
+        request_options(request.priority, request.deadline_ms)
+    if len(words) > WORD_LIMIT:
+        count_error("paraphrase", "input_too_long")
+        return JSONResponse(content={"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
+
+    # Loading the tokenizer can load the model (lazy or on-demand mode); keep that off the event loop
+    tokenizer = await run_in_threadpool(get_tokenizer, model)
+    # Held for the whole stream. Taken here so a full queue or a passed deadline still gets its 503/504, and
+    # released by the response however it ends, even if its body never starts (the client left before the
+    # first byte)
+    lane = paraphrase_executor.acquire()
+    deadline = current_deadline()
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop = threading.Event()
+        # Started with the body, so a response that is never sent never generates
+        generation = asyncio.ensure_future(paraphrase_executor.run_threaded(
+            paraphrase_streaming, request.text, streamer, stop, model, lane=lane, deadline=deadline))
+        # If generation fails or is cancelled before paraphrase_streaming() runs (a load error, a deadline passing
+        # in the queue), nothing ends the streamer; release its consumer either way. A second stop signal is harmless.
+        generation.add_done_callback(lambda _: streamer.text_queue.put(streamer.stop_signal))
+        tokens = iter(streamer)
+        try:
+            while True:
+                piece = loop.run_in_executor(None, next, tokens, None)
+                # Check for a disconnected client while waiting for a piece too, not only between pieces
+                while not piece.done():
+                    await asyncio.wait({piece}, timeout=STREAM_POLL_SECONDS)
+                    if http_request is not None and await http_request.is_disconnected():
+                        return
+                piece = piece.result()
+                if piece is None:
+                    break
+                if piece:
+                    yield f"data: {json.dumps(piece)}\n\n"
+            await generation
+            yield "event: done\ndata: {}\n\n"
+        except DeadlineExceeded as exc:
+            # Dropped from the queue, or stopped, once the deadline passed; the 200 has already been sent
+            count_error("paraphrase", "deadline_exceeded")
+            yield f"event: error\ndata: {json.dumps(str(exc))}\n\n"
+        except Exception as exc:
+            count_error("paraphrase", type(exc).__name__)
+            yield f"event: error\ndata: {json.dumps(str(exc))}\n\n"
+        finally:
+            stop.set()
+            generation.cancel()
+
+    return ReleasingStreamingResponse(events(), lambda: paraphrase_executor.release(lane),
+                                      media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that calls `release` once it has been sent, failed or abandoned, whether or not its
+    body was ever iterated.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Stops the generator if it was started and left mid-stream (its finally cancels the generation)
+            await self.body_iterator.aclose()
+            self.release()
+
+# Inference runs on a dedicated pool with its own concurrency limit and wait queue
+paraphrase_executor = InferenceExecutor("PARAPHRASE")
+
+# Concurrent single-paraphrase requests for the same model are gathered and generated together
+paraphrase_batchers = {(model, split): MicroBatcher(partial(paraphrase_many, model_name=model, split_sentences=split),
+                                                    executor=paraphrase_executor)
+                       for model in ALLOWED_MODELS for split in (False, True)}
+paraphrase_batcher = paraphrase_batchers[(PARAPHRASE_MODEL_SIZE, PARAPHRASE_SPLIT_SENTENCES)]
+
+# Greedy paraphrases by (model, generation settings, text); identical requests in flight share one generate()
+paraphrase_results = ResultCache("paraphrase")
+
+def greedy_key(text, model=PARAPHRASE_MODEL_SIZE, split_sentences=None):
+  # Every setting passed to generate() is part of the key, so changing one never serves an old paraphrase
+  split = sentence_mode(split_sentences)
+  lengths = (PARAPHRASE_LENGTH_RATIO, PARAPHRASE_LENGTH_MARGIN) if split else ()
+  return paraphrase_results.key(registry_name(model, PARAPHRASE_BACKEND), WORD_LIMIT,
+                                PARAPHRASE_TEMPERATURE, PARAPHRASE_TOP_P, PARAPHRASE_TOP_K,
+                                PARAPHRASE_REPETITION_PENALTY, split, *lengths, text)
+
+async def paraphrase_greedy(text, length, model=PARAPHRASE_MODEL_SIZE, split_sentences=None):
+  # One text, micro-batched with concurrent requests
+  async with paraphrase_executor.admit():
+    return await paraphrase_batchers[(model, sentence_mode(split_sentences))].submit(text, length)
+
 @paraphraser_router.post("/multi/")
-def paraphrases(request: ParaphraseMultipleRequest):
-  return {"paraphrases": paraphrases(request.text, 
-                                     request.return_sequences)}
+async def paraphrase_text_multi(request: ParaphraseMultipleRequest, http_request: Request = None):
+  model = resolve_model(request.model)
+  request_options(request.priority, request.deadline_ms)
+  async with paraphrase_executor.admit():
+    generation = paraphrase_executor.run(paraphrases, request.text, request.return_sequences, model,
+                                         sentence_mode(request.split_sentences))
+    return {"paraphrases": await cancel_on_disconnect("paraphrase", http_request, generation)}
 
 def paraphrases(text,
-               return_sequences):
-  tokenizer = T5Tokenizer.from_pretrained(PARAPHRASE_MODEL_SIZE)
-  model = T5ForConditionalGeneration.from_pretrained(PARAPHRASE_MODEL_SIZE)
-  input_ids = tokenizer.encode("paraphrase: " + text, return_tensors="pt") 
-  outputs = model.generate(
-      input_ids,
-      do_sample=True, 
-      max_length=WORD_LIMIT, 
-      temperature=PARAPHRASE_TEMPERATURE, 
-      top_p=PARAPHRASE_TOP_P, 
-      top_k=PARAPHRASE_TOP_K, 
-      repetition_penalty=PARAPHRASE_REPETITION_PENALTY,
-      num_return_sequences=return_sequences
-  )
+               return_sequences,
+               model_name=PARAPHRASE_MODEL_SIZE,
+               split_sentences=None):
+  if sentence_mode(split_sentences):
+    return paraphrase_sentences([text], model_name, return_sequences, sample=True)[0]
+  tokenizer = get_tokenizer(model_name)
+  model = get_model(model_name)
+  with stage("paraphrase", "tokenize"):
+    input_ids = tokenizer.encode("paraphrase: " + text, return_tensors="pt") 
+  observe_tokens("paraphrase", input_ids)
+  with stage("paraphrase", "forward"):
+    outputs = model.generate(
+        input_ids,
+        do_sample=True, 
+        max_length=WORD_LIMIT, 
+        temperature=PARAPHRASE_TEMPERATURE, 
+        top_p=PARAPHRASE_TOP_P, 
+        top_k=PARAPHRASE_TOP_K, 
+        repetition_penalty=PARAPHRASE_REPETITION_PENALTY,
+        num_return_sequences=return_sequences,
+        stopping_criteria=stopping_criteria()
+    )
   arrayOfParaphrases = []
-  for output in outputs:
-      paraphrrase = tokenizer.decode(output, skip_special_tokens=True)
-      arrayOfParaphrases.append(paraphrrase)
+  with stage("paraphrase", "decode"):
+    for output in outputs:
+        paraphrrase = tokenizer.decode(output, skip_special_tokens=True)
+        arrayOfParaphrases.append(paraphrrase)
   return arrayOfParaphrases
\ No newline at end of file
@@ -0,0 +1,397 @@
+"""
+profiling.py
+============
+
+This module takes on-demand profiles of the running app, to find out where the time of a latency spike goes:
+tokenization, model forward passes, Python post-processing or the web framework.
+
+A profile covers a window of `seconds` and, optionally, only the requests whose path starts with `route`:
+
+    - Python stack sampling: a background thread records the stack of every thread each PROFILE_SAMPLE_INTERVAL_MS.
+      With a route, the event loop thread is only sampled while a matching request is in flight, and inference
+      threads only while they run a call for one. Idle threads (waiting on a lock, a queue or the selector) are
+      not recorded.
+    - PyTorch profiler: inference calls made for matching requests run under `torch.profiler`, which records
+      every model op with its time on the CPU. One call is profiled at a time; calls that overlap it run as
+      usual and only show up in the samples.
+    - Request spans: when each matching request started and finished.
+
+The result is a zip with `profile.folded` (collapsed stacks, one `frame;frame;... count` line per stack, for
+flamegraph.pl, speedscope or inferno), `trace.json` (a Chrome trace for chrome://tracing or Perfetto, with the
+samples, the model ops and the requests on one timeline) and `summary.json` (the hottest functions and ops).
+
+Nothing runs while no profile is being taken: the sampler thread only exists during the window, and the
+middleware and the executors check a single module variable before doing anything else.
+
+In process mode (INFERENCE_EXECUTOR=process) the model runs in the worker processes, which are neither sampled
+nor traced; the profile then covers the web front end only.
+
+Imports:
+    - `sys._current_frames()` and `threading` for the sampler.
+    - `torch.profiler` (imported when a profile starts; skipped if torch is not installed).
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - PROFILE_ENABLED: Mount `/debug/profile` (default is True).
+    - PROFILE_MAX_SECONDS: Longest profile that can be requested (default is 60).
+    - PROFILE_SAMPLE_INTERVAL_MS: Default time between stack samples (default is 5).
+
+Classes:
+    - `ProfileBusy`: Raised when a profile is requested while another one is running.
+    - `ProfileSession`: Collects the samples, op events and request spans of one profile.
+    - `ProfilingMiddleware`: Marks and times the requests a running profile covers.
+
+Functions:
+    - `traced`: Wraps an inference call so it is profiled while a profile covering its request is running.
+
+API Endpoints (mounted under `/debug`):
+    - GET `/profile?seconds=N&route=/ner/`: Profiles for N seconds and returns the zip. `interval_ms` changes
+      the sampling interval; `format` (`zip`, `folded`, `chrome` or `summary`) returns one file only.
+
+"""
+
+import asyncio
+import contextvars
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter
+from functools import partial
+from typing import Literal, Optional
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from decouple import config
+
+PROFILE_ENABLED = config('PROFILE_ENABLED', default=True, cast=bool)
+PROFILE_MAX_SECONDS = config('PROFILE_MAX_SECONDS', default=60, cast=float)
+PROFILE_SAMPLE_INTERVAL_MS = config('PROFILE_SAMPLE_INTERVAL_MS', default=5, cast=float)
+
+# Innermost frames of a thread with nothing to do
+IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get")}
+
+# Entries of the summary's top lists
+TOP_ENTRIES = 25
+
+# The running profile, if any; checked by the middleware and the executors
+_session = None
+_session_lock = threading.Lock()
+
+# Whether the current request is covered by the running profile
+_covered = contextvars.ContextVar("profile_covered", default=False)
+
+
+class ProfileBusy(Exception):
+    """
+    Raised when a profile is requested while another one is running.
+    """
+
+    def __init__(self):
+        super().__init__("A profile is already being taken; try again when it has finished.")
+
+
+def _now_us():
+    return time.time() * 1e6
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    # Outermost frame first; None for an idle thread
+    if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class ProfileSession:
+    """
+    Collects the stack samples, model op events and request spans of one profile.
+
+    Args:
+    - seconds (float): Length of the window.
+    - route (str): Only cover requests whose path starts with this, e.g. "/ner/". None covers everything.
+    - interval_ms (float): Time between stack samples. Defaults to PROFILE_SAMPLE_INTERVAL_MS.
+    """
+
+    def __init__(self, seconds, route=None, interval_ms=None):
+        self.seconds = seconds
+        self.route = route or None
+        self.interval = (PROFILE_SAMPLE_INTERVAL_MS if interval_ms is None else interval_ms) / 1000.0
+        self.started = _now_us()
+        self.in_flight = 0
+        self.requests = []
+        self.samples = 0
+        self.stacks = Counter()
+        self.timelines = {}
+        self.thread_names = {}
+        self.op_events = []
+        self.op_totals = Counter()
+        self.op_counts = Counter()
+        self._busy_threads = set()
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._torch_lock = threading.Lock()
+        try:
+            import torch.profiler
+            self._torch = torch.profiler
+        except ImportError:
+            self._torch = None
+
+    def covers(self, path):
+        return self.route is None or path.startswith(self.route)
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _sample(self):
+        sampler = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = _now_us()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == sampler:
+                    continue
+                if self.route is not None:
+                    if ident == self._loop_thread:
+                        if not self.in_flight:
+                            continue
+                    elif ident not in self._busy_threads:
+                        continue
+                stack = _stack(frame)
+                if stack is None:
+                    continue
+                name = names.get(ident, str(ident))
+                self.thread_names[ident] = name
+                self.stacks[(name,) + stack] += 1
+                self.timelines.setdefault(ident, []).append((now, stack))
+                self.samples += 1
+
+    def request_span(self, method, path, start, end):
+        self.requests.append({"name": f"{method} {path}", "ph": "X", "ts": start, "dur": end - start,
+                              "pid": os.getpid(), "tid": 0, "cat": "request"})
+
+    def run_call(self, fn, *args):
+        """
+        Runs an inference call, marking its thread for the sampler and recording its model ops when the call
+        is made for a covered request.
+        """
+        if not _covered.get():
+            return fn(*args)
+        ident = threading.get_ident()
+        self._busy_threads.add(ident)
+        try:
+            if self._torch is None or not self._torch_lock.acquire(blocking=False):
+                return fn(*args)
+            try:
+                start = _now_us()
+                with self._torch.profile(activities=[self._torch.ProfilerActivity.CPU]) as profile:
+                    result = fn(*args)
+            finally:
+                self._torch_lock.release()
+            self._add_ops(profile.events(), start)
+            return result
+        finally:
+            self._busy_threads.discard(ident)
+
+    def _add_ops(self, events, start):
+        if not events:
+            return
+        # The profiler's clock has its own origin; line the call's first op up with when the call started
+        origin = min(event.time_range.start for event in events)
+        for event in events:
+            self.op_totals[event.name] += event.self_cpu_time_total
+            self.op_counts[event.name] += 1
+            self.op_events.append({"name": event.name, "ph": "X", "ts": start + event.time_range.start - origin,
+                                   "dur": event.time_range.elapsed_us(), "pid": os.getpid(),
+                                   "tid": f"torch {event.thread}", "cat": "torch"})
+
+    def folded(self):
+        """
+        Returns the samples as collapsed stacks (`thread;outer;...;inner count` per line).
+        """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def chrome_trace(self):
+        """
+        Returns a Chrome trace (JSON object format) of the samples, model ops and request spans.
+        """
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "requests"}}]
+        for ident, timeline in self.timelines.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": ident,
+                           "args": {"name": self.thread_names.get(ident, str(ident))}})
+            events.extend(self._sampled_spans(pid, ident, timeline))
+        for name in sorted({event["tid"] for event in self.op_events}):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": name, "args": {"name": name}})
+        events.extend(self.requests)
+        events.extend(self.op_events)
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"route": self.route, "seconds": self.seconds, "interval_ms": self.interval * 1000}}
+
+    def _sampled_spans(self, pid, ident, timeline):
+        # Consecutive samples sharing a frame become one span of that frame; a gap in the samples closes all
+        interval_us = self.interval * 1e6
+        spans = []
+        open_frames = []
+        last = None
+
+        def close(depth, end):
+            while len(open_frames) > depth:
+                label, begin = open_frames.pop()
+                spans.append({"name": label, "ph": "X", "ts": begin, "dur": max(end - begin, 1.0), "pid": pid,
+                              "tid": ident, "cat": "python"})
+
+        for now, stack in timeline:
+            if last is not None and now - last > 2 * interval_us:
+                close(0, last + interval_us)
+            depth = 0
+            while depth < len(open_frames) and depth < len(stack) and open_frames[depth][0] == stack[depth]:
+                depth += 1
+            close(depth, now)
+            open_frames.extend((label, now) for label in stack[depth:])
+            last = now
+        if last is not None:
+            close(0, last + interval_us)
+        return spans
+
+    def summary(self):
+        """
+        Returns the profile's counts and its hottest functions (by samples in which they were the innermost
+        frame) and model ops (by self CPU time).
+        """
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack[-1]] += count
+        return {
+            "route": self.route,
+            "seconds": self.seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "requests": len(self.requests),
+            "torch_profiler": self._torch is not None,
+            "top_functions": [{"function": name, "samples": count, "share": round(count / self.samples, 4)}
+                              for name, count in leaves.most_common(TOP_ENTRIES)],
+            "top_ops": [{"op": name, "self_cpu_ms": round(total / 1000, 3), "calls": self.op_counts[name]}
+                        for name, total in self.op_totals.most_common(TOP_ENTRIES)],
+        }
+
+    def archive(self):
+        """
+        Returns a zip of `profile.folded`, `trace.json` and `summary.json`.
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("profile.folded", self.folded())
+            archive.writestr("trace.json", json.dumps(self.chrome_trace()))
+            archive.writestr("summary.json", json.dumps(self.summary(), indent=2))
+        return buffer.getvalue()
+
+
+def begin(seconds, route=None, interval_ms=None):
+    """
+    Starts a profile.
+
+    Raises:
+    - ProfileBusy: If another profile is running.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            raise ProfileBusy()
+        session = ProfileSession(seconds, route, interval_ms)
+        session.start()
+        _session = session
+    return session
+
+
+def end(session):
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+    session.stop()
+
+
+def traced(fn):
+    """
+    Returns `fn`, or while a profile is running, a wrapper that profiles it for covered requests. Must be called
+    in the request's context and the wrapper run in a copy of it.
+    """
+    session = _session
+    if session is None:
+        return fn
+    return partial(session.run_call, fn)
+
+
+class ProfilingMiddleware:
+    """
+    While a profile is running, marks the requests it covers (so their inference calls are traced) and records
+    their spans. Otherwise it passes requests straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        session = _session
+        if session is None or scope["type"] != "http" or not session.covers(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        token = _covered.set(True)
+        session.in_flight += 1
+        start = _now_us()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.in_flight -= 1
+            session.request_span(scope.get("method", ""), scope["path"], start, _now_us())
+            _covered.reset(token)
+
+
+# Create a router instance
+profiling_router = APIRouter()
+
+@profiling_router.get("/profile")
+async def profile(seconds: float = 10, route: Optional[str] = None, interval_ms: Optional[float] = None,
+                  format: Literal["zip", "folded", "chrome", "summary"] = "zip"):
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return JSONResponse(content={"error": f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}."}, status_code=400)
+    if interval_ms is not None and interval_ms < 1:
+        return JSONResponse(content={"error": "interval_ms must be at least 1."}, status_code=400)
+    try:
+        session = begin(seconds, route, interval_ms)
+    except ProfileBusy as exc:
+        return JSONResponse(content={"error": str(exc)}, status_code=409)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        end(session)
+
+    if format == "summary":
+        return session.summary()
+    if format == "folded":
+        return Response(content=await run_in_threadpool(session.folded), media_type="text/plain")
+    if format == "chrome":
+        trace = await run_in_threadpool(lambda: json.dumps(session.chrome_trace()))
+        return Response(content=trace, media_type="application/json",
+                        headers={"Content-Disposition": 'attachment; filename="trace.json"'})
+    return Response(content=await run_in_threadpool(session.archive), media_type="application/zip",
+                    headers={"Content-Disposition": 'attachment; filename="profile.zip"'})
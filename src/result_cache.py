@@ -0,0 +1,165 @@
+"""
+result_cache.py
+===============
+
+This module provides request coalescing and a result cache for services whose output is a pure function of
+their input, such as NER and the greedy (non-sampling) paraphrase path.
+
+Many callers send identical texts at the same time (templated notifications, retries). Two mechanisms keep
+them from each paying for their own forward pass:
+
+    - Single flight: while a result is being computed, identical requests wait for that computation instead
+      of starting another one. The computation runs as its own task, so it completes for the remaining
+      callers even if the caller that started it goes away; once every caller has gone, it is cancelled.
+    - Cache: finished results are kept in a bounded LRU with a time-to-live.
+
+The key is a SHA-256 hash of everything the result depends on: the model name, every generation setting and
+the exact text (no normalization, since entity offsets refer to the exact characters). Changing the model or
+a setting therefore never returns an old result. Failed computations are not cached.
+
+Imports:
+    - Standard library modules for hashing, timing and the LRU.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - RESULT_CACHE_SIZE: Results kept per service (default is 10000; 0 disables caching but keeps coalescing).
+    - RESULT_CACHE_TTL: Seconds a result stays valid (default is 3600; 0 keeps results until evicted).
+
+Every lookup counts as exactly one of `hit` (served from the cache), `coalesced` (waited for an identical
+computation) or `miss` (started a computation).
+
+Classes:
+    - `ResultCache`: Single-flight LRU/TTL cache for one service.
+
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from decouple import config
+from .metrics import RESULT_CACHE
+
+RESULT_CACHE_SIZE = config('RESULT_CACHE_SIZE', default=10000, cast=int)
+RESULT_CACHE_TTL = config('RESULT_CACHE_TTL', default=3600, cast=float)
+
+
+class ResultCache:
+    """
+    Caches and coalesces the results of one service. Used from the event loop only.
+
+    Cached values are shared between requests and must not be modified by callers.
+
+    Args:
+    - service (str): Service name, for stats and metrics.
+    - max_entries (int): Capacity. Defaults to RESULT_CACHE_SIZE.
+    - ttl_seconds (float): Lifetime of an entry. Defaults to RESULT_CACHE_TTL.
+    """
+
+    def __init__(self, service, max_entries=None, ttl_seconds=None):
+        self.service = service
+        self.max_entries = RESULT_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl_seconds = RESULT_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._waiters = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(*parts):
+        """
+        Returns the cache key for `parts`: the model, the settings and the input the result depends on.
+        """
+        payload = json.dumps(parts, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached result for `key`, or None on a miss (or if it has expired).
+        """
+        value = self._lookup(key)
+        self._count("miss" if value is None else "hit")
+        return value
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute):
+        """
+        Returns the result for `key` from the cache, from an identical computation already running, or by
+        awaiting `compute()` (a zero-argument coroutine function) and caching what it returns.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            self._count("hit")
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count("coalesced")
+        else:
+            self._count("miss")
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # Shielded, so one caller being cancelled does not cancel the others' result
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            self._waiters[key] = self._waiters.get(key, 1) - 1
+            if self._waiters[key] <= 0 and not task.done():
+                # The last caller went away; nobody needs the result
+                task.cancel()
+            raise
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        self._waiters.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def _count(self, outcome):
+        if outcome == "hit":
+            self.hits += 1
+        elif outcome == "miss":
+            self.misses += 1
+        else:
+            self.coalesced += 1
+        RESULT_CACHE.labels(self.service, outcome).inc()
+
+    def stats(self):
+        """
+        Returns hit/miss/coalesced counters and the number of entries, for sizing the cache.
+        """
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "capacity": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,191 @@
+"""
+service_client.py
+=================
+
+This module provides the interface the UI routes in `main.py` use to reach the NER, text2vec and paraphrase services.
+
+The UI used to open a new `httpx.AsyncClient` per form submission and make an HTTPS request back to its own
+process, paying for TLS setup, JSON serialization and a second API-key check every time. By default the UI
+now calls the service handlers in-process. When the UI and the models run on different hosts, a remote mode
+sends the calls over one shared, pooled HTTP client created at startup.
+
+Both implementations return the same shapes as the HTTP API: the response body as a dict, with an `error`
+key when the service rejected the request. NER results are requested in the structured (offset-based) format.
+
+UI calls run in the interactive lane with the UI's timeout as their deadline (see `deadlines.py`), so work for
+a page that has stopped waiting is dropped instead of holding up other requests.
+
+Imports:
+    - `json` and `httpx` for the remote mode.
+    - The request models and handlers of each service module for the local mode.
+
+Classes:
+    - `LocalServices`: Calls the service handlers directly.
+    - `RemoteServices`: Calls a remote instance of the API over a shared `httpx.AsyncClient`.
+
+Functions:
+    - `create_services`: Builds the implementation selected by UI_SERVICE_MODE.
+
+"""
+
+import json
+import httpx
+from fastapi.responses import JSONResponse, StreamingResponse
+from .executors import ServiceOverloaded
+from .deadlines import DeadlineExceeded, request_options
+from .metrics import count_error
+from . import ner_service, text2vec_service, paraphraser_service
+
+
+class LocalServices:
+    """
+    Calls the service route handlers in-process, with the same validation, batching and backpressure as the API.
+
+    Args:
+    - timeout (float): Seconds the UI waits for a service; the deadline of every call.
+    """
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def _call(self, handler, request, enabled=True):
+        # Disabled services never load their models, so the UI must not call into them
+        if not enabled:
+            return {"error": "This service is disabled."}
+        request_options("interactive", self.timeout * 1000)
+        try:
+            response = await handler(request)
+        except ServiceOverloaded as exc:
+            count_error(exc.service.lower(), "overloaded")
+            return {"error": str(exc)}
+        except DeadlineExceeded as exc:
+            count_error(exc.service, "deadline_exceeded")
+            return {"error": str(exc)}
+        if isinstance(response, JSONResponse):
+            return json.loads(response.body)
+        return response
+
+    async def ner(self, text):
+        return await self._call(ner_service.named_entity_recognition, ner_service.NERRequest(text=text, structured=True),
+                                ner_service.NER_ENABLED)
+
+    async def vectorize(self, text):
+        return await self._call(text2vec_service.vectorize_text, text2vec_service.TextVectorRequest(text=text),
+                                text2vec_service.TEXT2VEC_ENABLED)
+
+    async def paraphrase(self, text):
+        return await self._call(paraphraser_service.paraphrase_text, paraphraser_service.ParaphraseRequest(text=text),
+                                paraphraser_service.PARAPHRASE_ENABLED)
+
+    async def paraphrase_multi(self, text, return_sequences):
+        request = paraphraser_service.ParaphraseMultipleRequest(text=text, return_sequences=return_sequences)
+        return await self._call(paraphraser_service.paraphrase_text_multi, request, paraphraser_service.PARAPHRASE_ENABLED)
+
+    async def paraphrase_stream(self, text, http_request):
+        # Returns the service's own StreamingResponse (or its error response) to pass straight through
+        request = paraphraser_service.ParaphraseRequest(text=text)
+        if not paraphraser_service.PARAPHRASE_ENABLED:
+            return JSONResponse(content={"error": "This service is disabled."}, status_code=404)
+        request_options("interactive", self.timeout * 1000)
+        try:
+            return await paraphraser_service.paraphrase_text_stream(request, http_request)
+        except ServiceOverloaded as exc:
+            count_error(exc.service.lower(), "overloaded")
+            return JSONResponse(content={"error": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+
+class RemoteServices:
+    """
+    Calls the API on another host through one pooled `httpx.AsyncClient`, created by `start()`.
+
+    Args:
+    - base_url (str): Scheme, host and port of the API, e.g. "https://models.internal:8019".
+    - api_key (str): Value sent in the `X-API-KEY` header.
+    - verify (bool): Whether to verify the server's TLS certificate.
+    - timeout (float): Seconds to wait for a response; also sent as the request's deadline.
+    """
+
+    def __init__(self, base_url, api_key, verify=True, timeout=60.0):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.verify = verify
+        self.timeout = timeout
+        self.client = None
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(base_url=self.base_url,
+                                            headers={"X-API-KEY": self.api_key, "X-Priority": "interactive",
+                                                     "X-Deadline-Ms": str(int(self.timeout * 1000))},
+                                            verify=self.verify,
+                                            timeout=httpx.Timeout(self.timeout),
+                                            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _post(self, path, payload):
+        # Started lazily as well, for callers that skip the startup event (e.g. tests)
+        await self.start()
+        response = await self.client.post(path, json=payload)
+        return response.json()
+
+    async def ner(self, text):
+        return await self._post("/ner/", {"text": text, "structured": True})
+
+    async def vectorize(self, text):
+        return await self._post("/text2vec/", {"text": text})
+
+    async def paraphrase(self, text):
+        return await self._post("/paraphrase/", {"text": text})
+
+    async def paraphrase_multi(self, text, return_sequences):
+        return await self._post("/paraphrase/multi/", {"text": text, "return_sequences": return_sequences})
+
+    async def paraphrase_stream(self, text, http_request):
+        # Relays the remote event stream; closing it (e.g. on client disconnect) stops the remote generation too
+        await self.start()
+        request = self.client.build_request("POST", "/paraphrase/stream", json={"text": text})
+        response = await self.client.send(request, stream=True)
+        if response.status_code != 200:
+            body = await response.aread()
+            await response.aclose()
+            return JSONResponse(content=json.loads(body), status_code=response.status_code)
+
+        async def relay():
+            try:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+            finally:
+                await response.aclose()
+
+        return StreamingResponse(relay(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def create_services(mode, base_url, api_key, verify=True, timeout=60.0):
+    """
+    Builds the service interface used by the UI routes.
+
+    Args:
+    - mode (str): "local" to call the services in-process, "remote" to call `base_url` over HTTP.
+    - base_url (str): API location for the remote mode.
+    - api_key (str): API key for the remote mode.
+    - verify (bool): TLS verification for the remote mode.
+    - timeout (float): Seconds the UI waits for a service.
+
+    Returns:
+    - LocalServices or RemoteServices
+    """
+    if mode == "local":
+        return LocalServices(timeout)
+    if mode == "remote":
+        return RemoteServices(base_url, api_key, verify, timeout)
+    raise ValueError(f"Unknown UI_SERVICE_MODE '{mode}'. Use 'local' or 'remote'.")
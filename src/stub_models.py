@@ -0,0 +1,214 @@
+"""
+stub_models.py
+==============
+
+This module provides deterministic, lightweight stand-ins for the NER, text2vec and paraphrase models.
+
+The stubs load instantly, need no downloads and return the same output for the same input, so the web,
+serialization, batching and post-processing layers can be benchmarked (see `benchmark.py`) or exercised
+offline. They mimic the interfaces the services use, not the models' quality:
+
+    - NER: every capitalized word is an entity; a run of capitalized words is one entity.
+    - text2vec: a unit vector seeded from a hash of the text.
+    - paraphrase: the input words with neighbouring pairs swapped.
+
+Each stub can sleep for a fixed time per forward pass to stand in for model cost.
+
+Imports:
+    - `hashlib`, `re` and `numpy` for deterministic outputs.
+
+Classes:
+    - `StubTokenizer`: Whitespace tokenizer with offsets, encode/decode and padding.
+    - `StubTokenClassifier`: Callable with the `transformers` NER pipeline interface.
+    - `StubSentenceTransformer`: Object with the SentenceTransformer `encode` interface.
+    - `StubSeq2Seq`: Object with a `generate` method for the paraphraser.
+
+Functions:
+    - `install`: Replaces the loaders of every declared, not yet loaded model with stubs.
+
+"""
+
+import hashlib
+import re
+import threading
+import time
+import numpy as np
+
+ENTITY_TYPES = ("PER", "ORG", "LOC", "MISC")
+WORD = re.compile(r'\S+')
+
+
+def _digest(text):
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+class _Encoding(dict):
+    # Tokenizer output that also supports attribute access, like transformers' BatchEncoding
+    __getattr__ = dict.__getitem__
+
+
+class StubTokenizer:
+    """
+    Splits on whitespace and maps each distinct word to an id, growing the vocabulary as it goes.
+    """
+
+    model_max_length = 512
+    pad_token_id = 0
+    # No end-of-sequence token; the stub models ignore generation settings that use one
+    eos_token_id = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._words = ["<pad>"]
+
+    def _id(self, word):
+        with self._lock:
+            if word not in self._ids:
+                self._ids[word] = len(self._words)
+                self._words.append(word)
+            return self._ids[word]
+
+    def encode(self, text, return_tensors=None):
+        return [[self._id(word) for word in text.split()]]
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, return_tensors=None, padding=False):
+        if isinstance(text, str):
+            encoding = _Encoding(input_ids=self.encode(text)[0])
+            if return_offsets_mapping:
+                encoding["offset_mapping"] = [match.span() for match in WORD.finditer(text)]
+            return encoding
+
+        rows = [self.encode(item)[0] for item in text]
+        width = max((len(row) for row in rows), default=0)
+        return _Encoding(input_ids=[row + [self.pad_token_id] * (width - len(row)) for row in rows],
+                         attention_mask=[[1] * len(row) + [0] * (width - len(row)) for row in rows])
+
+    def decode(self, ids, skip_special_tokens=False):
+        return " ".join(self._words[i] for i in ids if i != self.pad_token_id)
+
+    def batch_decode(self, rows, skip_special_tokens=False):
+        return [self.decode(row, skip_special_tokens) for row in rows]
+
+
+class _StubModel:
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+
+    def eval(self):
+        return self
+
+    def _forward(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+
+class StubTokenClassifier(_StubModel):
+    """
+    Tags capitalized words: the first of a run gets `B-<type>`, the rest `I-<type>`, with the type picked
+    from a hash of the first word.
+    """
+
+    def __call__(self, texts, batch_size=None):
+        self._forward()
+        if isinstance(texts, str):
+            return self._tag(texts)
+        return [self._tag(text) for text in texts]
+
+    def _tag(self, text):
+        entities = []
+        previous_end = None
+        group = None
+        for index, match in enumerate(WORD.finditer(text)):
+            word = match.group().strip(".,;:!?\"'()")
+            if not word[:1].isupper():
+                previous_end = None
+                continue
+            start = match.start() + match.group().index(word)
+            continues = previous_end is not None and text[previous_end:start].isspace()
+            if not continues:
+                group = ENTITY_TYPES[_digest(word) % len(ENTITY_TYPES)]
+            entities.append({"entity": ("I-" if continues else "B-") + group, "score": 0.9 + (_digest(word) % 100) / 1000,
+                             "index": index, "word": word, "start": start, "end": start + len(word)})
+            previous_end = start + len(word)
+        return entities
+
+
+class StubSentenceTransformer(_StubModel):
+    """
+    Returns a unit vector of `dimensions` components seeded from each text.
+    """
+
+    max_seq_length = 256
+
+    def __init__(self, dimensions=384, latency_ms=0):
+        super().__init__(latency_ms)
+        self.dimensions = dimensions
+        self.tokenizer = StubTokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimensions
+
+    def encode(self, texts, batch_size=None):
+        self._forward()
+        vectors = np.stack([np.random.default_rng(_digest(text)).standard_normal(self.dimensions) for text in texts])
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class StubSeq2Seq(_StubModel):
+    """
+    "Paraphrases" by dropping the task prefix and swapping neighbouring words; extra sequences are rotations.
+    """
+
+    def generate(self, input_ids, attention_mask=None, num_return_sequences=1, streamer=None, **kwargs):
+        self._forward()
+        outputs = []
+        for row in input_ids:
+            words = [token for token in row if token != StubTokenizer.pad_token_id][1:]
+            swapped = []
+            for i in range(0, len(words) - 1, 2):
+                swapped += [words[i + 1], words[i]]
+            swapped += words[len(swapped):]
+            for shift in range(num_return_sequences):
+                outputs.append(swapped[shift:] + swapped[:shift] if swapped else [])
+        return outputs
+
+
+def _stubs(latency_ms):
+    ner_tokenizer = StubTokenizer()
+    paraphrase_tokenizer = StubTokenizer()
+    ner_pipeline = StubTokenClassifier(latency_ms)
+    return {
+        "ner.tokenizer": lambda: ner_tokenizer,
+        "ner.model": lambda: ner_pipeline,
+        "ner.pipeline": lambda: ner_pipeline,
+        "text2vec.model": lambda: StubSentenceTransformer(latency_ms=latency_ms),
+        "paraphrase.tokenizer": lambda: paraphrase_tokenizer,
+        "paraphrase.model": lambda: StubSeq2Seq(latency_ms),
+    }
+
+
+def install(registry, latency_ms=0):
+    """
+    Swaps the declared loaders of `registry` for stubs. Must run before the models load.
+
+    Args:
+    - registry (ModelRegistry): Registry the services declared their models with.
+    - latency_ms (float): Time each stub forward pass sleeps.
+
+    Returns:
+    - list: `(role, name)` of the entries now backed by stubs.
+
+    Raises:
+    - RuntimeError: If one of the models has already been loaded.
+    """
+    stubs = _stubs(latency_ms)
+    replaced = []
+    for model in registry.status():
+        if model["role"] not in stubs:
+            continue
+        if model["state"] == "ready":
+            raise RuntimeError(f"{model['role']} '{model['name']}' is already loaded; install stubs before loading models.")
+        registry.declare(model["role"], model["name"], stubs[model["role"]])
+        replaced.append((model["role"], model["name"]))
+    return replaced
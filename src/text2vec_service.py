@@ -11,10 +11,21 @@ Imports:
 
 Configuration:
     - TEXT2VEC_MODEL: Specifies the transformer model used for text-to-vector conversion.
+    - TEXT2VEC_BACKEND: Inference backend, `torch`, `torch-int8` or `onnx` (default is "torch"; see `backends.py`).
+    - TEXT2VEC_MODELS: Comma-separated extra models requests may select with their `model` field (default is none).
+      They load on first use and may be evicted again (see `model_registry.py`).
+    - TEXT2VEC_ENABLED: Whether this service is served at all (default is True).
     - WORD_LIMIT: Specifies the limit for the number of words in the vectorization input (default is 400).
+    - TEXT2VEC_MAX_CONCURRENCY / TEXT2VEC_MAX_QUEUE: Size of the inference pool and of the wait queue in front
+      of it (see `executors.py`).
+    - EMBEDDING_CACHE_SIZE / EMBEDDING_CACHE_PATH: Size of the in-memory embedding cache and optional sqlite file
+      for the persistent tier (see `embedding_cache.py`).
 
 Model Loading:
-    - The Sentence Transformer model, as specified in the `TEXT2VEC_MODEL` configuration, is loaded.
+    - The Sentence Transformer model, as specified in the `TEXT2VEC_MODEL` configuration, is declared with the shared
+      model registry and loaded at startup, in the background or on first use (see MODEL_LOADING in `main.py`).
+      Each TEXT2VEC_MODELS entry is declared as an on-demand group "text2vec:<model>" with an in-memory embedding
+      cache of its own. Every model is warmed up with one short encode once it loads.
 
 Router:
     - An instance of the FastAPI APIRouter is created to manage routes specific to this service.
@@ -22,46 +33,267 @@ Router:
 Models:
     - TextVectorRequest: Represents the structure of an input request for vectorization.
     - TextVectorResponse: Represents the structure of the output vector.
+    - TextVectorBatchRequest / TextVectorBatchResponse: A list of texts and the per-text results.
 
 API Endpoints:
     - POST `/`: Converts the provided text in the `TextVectorRequest` to a vector and returns it as a `TextVectorResponse`.
+      Concurrent requests are micro-batched (see `batching.py`) into a single `model.encode` call.
+      With `chunking` (or CHUNK_LONG_TEXTS) enabled, long texts are split on tokens, encoded as one batch and
+      pooled into a single document vector instead of being rejected (see `chunking.py`).
+    - POST `/batch`: Vectorizes a list of texts in one `model.encode` call and returns one result per text, in order.
+      Each result holds either `vector` or an `error` (e.g. when that text exceeds `WORD_LIMIT`).
+    - Both accept an optional `model` naming one of the allowed models; any other model is rejected with a 400.
+    - Both accept `priority` (`interactive`, the default for `/`, or `bulk`, the default for `/batch`) and
+      `deadline_ms`; work still queued when the deadline passes is dropped with a 504 (see `deadlines.py`).
+    - GET `/cache`: Reports embedding cache hit/miss counters and tier sizes.
+
+Output Formats:
+    - Both POST endpoints accept `format` (`json`, `float32`, `float16`, `int8` or `npy`), `dimensions` (truncate
+      to the first N components; at least 1 and at most the model's dimension, or the request gets a 400) and `normalize` (L2-normalize after truncation). Without `format`, an `Accept:
+      application/x-npy` header selects `npy`. See `vector_formats.py` for the encodings.
 
 """
 
 
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-from decouple import config
+import numpy as np
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from functools import partial
+from decouple import config, Csv
+from .model_registry import registry, select_model
+from .backends import load_sentence_transformer, registry_name
+from .batching import MicroBatcher, BATCH_MAX_TEXTS
+from .embedding_cache import EmbeddingCache
+from .executors import InferenceExecutor
+from .chunking import chunking_requested, chunk_text, pool_vectors, CHUNK_MAX_TOKENS, CHUNK_MAX_CHUNKS
+from .vector_formats import resolve_format, prepare_vectors, encode_vector, npy_bytes, NPY_MEDIA_TYPE
+from .metrics import stage, count_error, instrument_tokenize
+from .deadlines import request_options, Priority
 
 TEXT2VEC_MODEL = config('TEXT2VEC_MODEL', default="sentence-transformers/multi-qa-MiniLM-L6-cos-v1")
+TEXT2VEC_BACKEND = config('TEXT2VEC_BACKEND', default="torch")
+TEXT2VEC_MODELS = config('TEXT2VEC_MODELS', default="", cast=Csv())
+TEXT2VEC_ENABLED = config('TEXT2VEC_ENABLED', default=True, cast=bool)
 WORD_LIMIT = config('WORD_LIMIT', default=400, cast=int)
 
-# Load the sentence transformer model
+# The configured model comes first and is the default; requests may select any of them by name
 model_name = TEXT2VEC_MODEL
-model = SentenceTransformer(model_name)
+ALLOWED_MODELS = list(dict.fromkeys([TEXT2VEC_MODEL, *TEXT2VEC_MODELS]))
+
+def declare_model(model):
+    registry.declare("text2vec.model", registry_name(model, TEXT2VEC_BACKEND),
+                     lambda: instrument_tokenize(load_sentence_transformer(model, TEXT2VEC_BACKEND), "text2vec"),
+                     group=f"text2vec:{model}", on_demand=model != TEXT2VEC_MODEL,
+                     warmup=lambda loaded: loaded.encode(["Warm up."]))
+
+# Declare the sentence transformer models with the shared registry; they load at startup or on first use
+if TEXT2VEC_ENABLED:
+    for allowed_model in ALLOWED_MODELS:
+        declare_model(allowed_model)
+
+def get_model(model=TEXT2VEC_MODEL):
+    return registry.get("text2vec.model", registry_name(model, TEXT2VEC_BACKEND))
+
+def resolve_model(model):
+    """
+    Returns the model a request selected, or the default one; raises `ModelNotAllowed` for any other model.
+    """
+    return select_model("text2vec", model, ALLOWED_MODELS)
+
+# Vectors are cached by (model, backend, normalized text); see embedding_cache.py. The backend is part of the
+# name, so switching TEXT2VEC_BACKEND never serves vectors computed by another backend. Only the default model
+# gets the persistent tier, since it clears itself whenever another model opens it
+embedding_cache = EmbeddingCache(registry_name(model_name, TEXT2VEC_BACKEND))
+embedding_caches = {model: embedding_cache if model == TEXT2VEC_MODEL
+                    else EmbeddingCache(registry_name(model, TEXT2VEC_BACKEND), path="")
+                    for model in ALLOWED_MODELS}
 
 # Create a router instance
 text2vec_router = APIRouter()
 
+VectorFormat = Literal["json", "float32", "float16", "int8", "npy"]
+
 # Models for your request and response
 class TextVectorRequest(BaseModel):
     text: str
+    chunking: Optional[bool] = None
+    model: Optional[str] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
+    format: Optional[VectorFormat] = None
+    dimensions: Optional[int] = Field(None, gt=0)
+    normalize: bool = False
 
 class TextVectorResponse(BaseModel):
-    vector: list
+    vector: Optional[list] = None
+    vector_b64: Optional[str] = None
+    dtype: Optional[str] = None
+    dim: Optional[int] = None
+    scale: Optional[float] = None
+
+class TextVectorBatchRequest(BaseModel):
+    texts: List[str]
+    model: Optional[str] = None
+    priority: Optional[Priority] = None
+    deadline_ms: Optional[float] = None
+    format: Optional[VectorFormat] = None
+    dimensions: Optional[int] = Field(None, gt=0)
+    normalize: bool = False
 
-@text2vec_router.post("/", response_model=TextVectorResponse)
-async def vectorize_text(request: TextVectorRequest):
-    words = request.text.split()
-    if len(words) > WORD_LIMIT:
-        return JSONResponse(content={"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
+class TextVectorBatchResponse(BaseModel):
+    results: list
+
+@text2vec_router.post("/", response_model=TextVectorResponse, response_model_exclude_none=True)
+async def vectorize_text(request: TextVectorRequest, http_request: Request = None):
+    with stage("text2vec", "validate"):
+        words = request.text.split()
+        model = resolve_model(request.model)
+        request_options(request.priority, request.deadline_ms)
     text = request.text
-    vector = vectorize(text)
-    return {"vector": vector}
+    vector = None
+    async with text2vec_executor.admit():
+        if chunking_requested(request.chunking):
+            # Long documents are split on tokens, encoded as one batch and pooled into a single vector
+            chunks = await run_in_threadpool(chunk_document, text, model)
+            if len(chunks) > CHUNK_MAX_CHUNKS:
+                count_error("text2vec", "too_many_chunks")
+                return JSONResponse(content={"error": f"Input text exceeds {CHUNK_MAX_CHUNKS} chunks. Please provide shorter text."}, status_code=400)
+            if len(chunks) > 1:
+                vector = await vectorize_chunks(chunks, model)
+        elif len(words) > WORD_LIMIT:
+            count_error("text2vec", "input_too_long")
+            return JSONResponse(content={"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
+        if vector is None:
+            vector = await vectorize_async(text, len(words), model)
+
+    # Truncate/normalize and encode in the requested (or negotiated) format
+    fmt = resolve_format(request.format, http_request.headers.get("accept") if http_request else None)
+    with stage("text2vec", "serialize"):
+        prepared = prepare_vectors([vector], request.dimensions, request.normalize)[0]
+        if fmt == "npy":
+            return Response(content=npy_bytes(prepared), media_type=NPY_MEDIA_TYPE)
+        return encode_vector(prepared, fmt)
+
+@text2vec_router.post("/batch", response_model=TextVectorBatchResponse)
+async def vectorize_text_batch(request: TextVectorBatchRequest, http_request: Request = None):
+    if len(request.texts) > BATCH_MAX_TEXTS:
+        count_error("text2vec", "batch_too_large")
+        return JSONResponse(content={"error": f"Batch exceeds {BATCH_MAX_TEXTS} texts. Please split it into smaller batches."}, status_code=400)
+
+    # Oversized texts get their own error; everything else is encoded in one call
+    results = [None] * len(request.texts)
+    accepted = []
+    with stage("text2vec", "validate"):
+        model = resolve_model(request.model)
+        request_options(request.priority, request.deadline_ms, default_lane="bulk")
+        for index, text in enumerate(request.texts):
+            if len(text.split()) > WORD_LIMIT:
+                count_error("text2vec", "input_too_long")
+                results[index] = {"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}
+            else:
+                accepted.append(index)
+
+    fmt = resolve_format(request.format, http_request.headers.get("accept") if http_request else None)
+    if fmt == "npy" and len(accepted) < len(request.texts):
+        # A single matrix has no place for per-item errors
+        count_error("text2vec", "npy_partial_batch")
+        return JSONResponse(content={"error": "Some texts were rejected; the npy format requires every text to succeed.", "results": results}, status_code=400)
+
+    if accepted:
+        async with text2vec_executor.admit():
+            vectors = await vectorize_many_async([request.texts[index] for index in accepted], model)
+        with stage("text2vec", "serialize"):
+            prepared = prepare_vectors(vectors, request.dimensions, request.normalize)
+            if fmt == "npy":
+                return Response(content=npy_bytes(prepared), media_type=NPY_MEDIA_TYPE)
+            for index, vector in zip(accepted, prepared):
+                results[index] = encode_vector(vector, fmt)
+
+    return {"results": results}
 
-def vectorize(text: str):
-    # Get the embeddings using the sentence transformer model
-    vector = model.encode([text])[0].tolist()
+@text2vec_router.get("/cache")
+def embedding_cache_stats():
+    return embedding_cache.stats()
+
+def vectorize(text: str, model: str = TEXT2VEC_MODEL):
+    # Get the embeddings using the sentence transformer model (or the cache)
+    return vectorize_many([text], model)[0]
+
+def vectorize_many(texts: list, model: str = TEXT2VEC_MODEL):
+    # Serve what we can from the cache and encode the rest in one forward pass; results are in input order.
+    # Blocks on the cache's disk tier: for callers off the event loop
+    cache = embedding_caches[model]
+    vectors, missing = split_cached(texts, cache.lookup(texts))
+    if not missing:
+        return vectors
+    encoded = encode_texts(missing, model)
+    cache.put_many(zip(missing, encoded))
+    return merge_encoded(texts, vectors, missing, encoded)
+
+async def vectorize_async(text: str, length: int = 0, model: str = TEXT2VEC_MODEL):
+    # One text, from the cache or micro-batched with concurrent requests into a single forward pass
+    cache = embedding_caches[model]
+    cached = (await cache.lookup_async([text]))[0]
+    if cached is not None:
+        return cached.tolist()
+    vector = await text2vec_batchers[model].submit(text, length)
+    await cache.put_many_async([(text, vector)])
     return vector
+
+async def vectorize_chunks(chunks: list, model: str = TEXT2VEC_MODEL):
+    # Encode the chunks of a long document as one batch and pool them into a single vector
+    vectors = await vectorize_many_async([chunk.text for chunk in chunks], model)
+    return pool_vectors(vectors, chunks)
+
+async def vectorize_many_async(texts: list, model: str = TEXT2VEC_MODEL):
+    # Same as vectorize_many(), but the forward pass runs on the text2vec executor
+    vectors, missing = await lookup_cached(texts, model)
+    if not missing:
+        return vectors
+    return await fill_missing(texts, vectors, missing, await text2vec_executor.run(encode_texts, missing, model), model)
+
+async def lookup_cached(texts: list, model: str = TEXT2VEC_MODEL):
+    # Cached vectors (None for misses) and the distinct texts that still need encoding; the cache's disk tier
+    # is read on a thread
+    return split_cached(texts, await embedding_caches[model].lookup_async(texts))
+
+async def fill_missing(texts: list, vectors: list, missing: list, encoded: list, model: str = TEXT2VEC_MODEL):
+    # Cache freshly encoded vectors (one disk commit, on a thread) and slot them into the cache misses
+    await embedding_caches[model].put_many_async(zip(missing, encoded))
+    return merge_encoded(texts, vectors, missing, encoded)
+
+def split_cached(texts: list, cached: list):
+    vectors = [None if vector is None else vector.tolist() for vector in cached]
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    return vectors, missing
+
+def merge_encoded(texts: list, vectors: list, missing: list, encoded: list):
+    encoded = dict(zip(missing, encoded))
+    return [encoded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+def encode_texts(texts: list, model: str = TEXT2VEC_MODEL):
+    # Run the model over a list of texts in one forward pass; tokenization is timed as its own stage inside it
+    return [vector.tolist() for vector in encode_matrix(texts, model=model)]
+
+def encode_matrix(texts: list, batch_size: int = None, model: str = TEXT2VEC_MODEL):
+    # Same as encode_texts(), but returns a float32 matrix; `batch_size` splits large inputs into several passes
+    with stage("text2vec", "forward"):
+        vectors = get_model(model).encode(texts, batch_size=batch_size or len(texts))
+    return np.asarray(vectors, dtype=np.float32)
+
+def chunk_document(text: str, model: str = TEXT2VEC_MODEL):
+    # Chunks must fit in the model's window, leaving room for its special tokens
+    transformer = get_model(model)
+    with stage("text2vec", "tokenize"):
+        return chunk_text(transformer.tokenizer, text, min(CHUNK_MAX_TOKENS, transformer.max_seq_length - 2))
+
+# Inference runs on a dedicated pool with its own concurrency limit and wait queue
+text2vec_executor = InferenceExecutor("TEXT2VEC")
+
+# Concurrent cache misses for the same model are gathered and encoded together
+text2vec_batchers = {model: MicroBatcher(partial(encode_texts, model=model), executor=text2vec_executor)
+                     for model in ALLOWED_MODELS}
+text2vec_batcher = text2vec_batchers[TEXT2VEC_MODEL]
@@ -0,0 +1,126 @@
+"""
+vector_formats.py
+=================
+
+This module provides compact encodings for the vectors returned by the text2vec service.
+
+A 768-dimension vector serialized as JSON floats is about 15 KB of text, and parsing it dominates CPU time
+in bulk pipelines. Clients can instead ask for one of these formats:
+
+    - `json`: A list of floats (the default, unchanged behavior).
+    - `float32`: Base64 of the little-endian float32 bytes.
+    - `float16`: Base64 of the little-endian float16 bytes.
+    - `int8`: Base64 of int8 values plus a `scale`; the vector is approximately `values * scale`.
+    - `npy`: A raw `application/x-npy` body (a 2-D array for batches).
+
+Vectors can also be truncated to their first `dimensions` components and L2-normalized (after truncation).
+`dimensions` must be positive (the request models check that) and no larger than the model's dimension.
+
+Imports:
+    - `base64`, `io` and `numpy` for the encodings.
+
+Classes:
+    - `DimensionsTooLarge`: Raised when `dimensions` exceeds the dimension of the vectors.
+
+Functions:
+    - `resolve_format`: Picks the format from the request field or the `Accept` header.
+    - `prepare_vectors`: Applies truncation and normalization.
+    - `encode_vector`: Encodes one vector as a JSON-ready dict.
+    - `npy_bytes`: Serializes an array in `.npy` format.
+
+"""
+
+import base64
+import io
+import numpy as np
+
+VECTOR_FORMATS = ("json", "float32", "float16", "int8", "npy")
+NPY_MEDIA_TYPE = "application/x-npy"
+
+
+class DimensionsTooLarge(ValueError):
+    """
+    Raised when a request asks for more dimensions than its vectors have.
+
+    Attributes:
+    - dimensions (int): The requested dimensions.
+    - available (int): The dimension of the model's vectors.
+    """
+
+    def __init__(self, dimensions, available):
+        self.dimensions = dimensions
+        self.available = available
+        super().__init__(f"dimensions must be at most {available}, the dimension of the model's vectors.")
+
+
+def resolve_format(requested, accept=None):
+    """
+    Returns the output format: the explicit request field wins, then the `Accept` header, then `json`.
+    """
+    if requested:
+        return requested
+    if accept and NPY_MEDIA_TYPE in accept:
+        return "npy"
+    return "json"
+
+
+def prepare_vectors(vectors, dimensions=None, normalize=False):
+    """
+    Truncates and optionally L2-normalizes a batch of vectors.
+
+    Args:
+    - vectors (list or numpy.ndarray): One vector per row.
+    - dimensions (int): Keep only the first `dimensions` components.
+    - normalize (bool): Scale each row to unit length (zero rows are left as is).
+
+    Returns:
+    - numpy.ndarray: float32 matrix.
+
+    Raises:
+    - DimensionsTooLarge: If `dimensions` exceeds the vectors' dimension.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if dimensions is not None:
+        if dimensions > matrix.shape[1]:
+            raise DimensionsTooLarge(dimensions, matrix.shape[1])
+        matrix = matrix[:, :dimensions]
+    if normalize:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+    return matrix
+
+
+def encode_vector(vector, fmt):
+    """
+    Encodes one vector for a JSON response.
+
+    Args:
+    - vector (numpy.ndarray): 1-D float32 vector.
+    - fmt (str): One of `json`, `float32`, `float16` or `int8`.
+
+    Returns:
+    - dict: `{"vector": [...]}` for json, otherwise `vector_b64`, `dtype`, `dim` and (for int8) `scale`.
+    """
+    if fmt == "json":
+        return {"vector": vector.tolist()}
+    if fmt == "float32":
+        data = vector.astype("<f4").tobytes()
+        return {"vector_b64": base64.b64encode(data).decode("ascii"), "dtype": "float32", "dim": len(vector)}
+    if fmt == "float16":
+        data = vector.astype("<f2").tobytes()
+        return {"vector_b64": base64.b64encode(data).decode("ascii"), "dtype": "float16", "dim": len(vector)}
+    if fmt == "int8":
+        peak = float(np.abs(vector).max()) if len(vector) else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        data = np.clip(np.round(vector / scale), -127, 127).astype(np.int8).tobytes()
+        return {"vector_b64": base64.b64encode(data).decode("ascii"), "dtype": "int8", "dim": len(vector), "scale": scale}
+    raise ValueError(f"Unknown vector format '{fmt}'. Use one of: {', '.join(VECTOR_FORMATS)}.")
+
+
+def npy_bytes(array):
+    """
+    Serializes `array` as float32 in `.npy` format.
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array, dtype="<f4"), allow_pickle=False)
+    return buffer.getvalue()
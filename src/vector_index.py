@@ -0,0 +1,637 @@
+"""
+vector_index.py
+===============
+
+This module provides named, in-process vector collections and similarity search over them, so small and medium
+collections can be queried without running a separate vector database.
+
+Each collection keeps its vectors in one contiguous float32 matrix (grown by doubling, like a list), its item
+IDs and per-item metadata. Search is one of:
+
+    - `exact`: A single matrix-vector product over the whole collection followed by a partial sort. It returns
+      the true nearest items and is the fastest option up to tens of thousands of vectors.
+    - `ivf`: An inverted-file index. The vectors are clustered with k-means into `nlist` cells, and a query only
+      scores the items in its `nprobe` nearest cells, which trades a little recall for much less work on large
+      collections. Items added after training are kept in an unindexed tail that is always scanned, and the
+      cell lists are rebuilt once the tail grows past a tenth of the collection; the clustering itself is
+      retrained when the collection has grown fourfold since the last training.
+
+Collections with `index: "auto"` (the default) use `exact` below VECTOR_INDEX_IVF_MIN_SIZE items and `ivf` from
+there on.
+
+With `cosine` similarity (the default) vectors are L2-normalized when added, so the score is a dot product.
+
+Imports:
+    - `numpy` for storage, search and k-means.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - VECTOR_INDEX_DIR: Directory collections are saved to on shutdown (and on request) and loaded from at
+      startup. Empty (the default) keeps them in memory only.
+    - VECTOR_INDEX_IVF_MIN_SIZE: Size from which `auto` collections switch to the IVF index (default is 20000).
+    - VECTOR_INDEX_NPROBE: Cells an IVF query scans unless the collection or request says otherwise (default is 16).
+    - VECTOR_INDEX_MAX_K: Largest `k` a search may ask for (default is 100).
+
+Classes:
+    - `VectorCollection`: One named collection and its index.
+    - `VectorIndex`: The set of collections, with persistence.
+
+Functions:
+    - `top_k`: Indices of the `k` highest scores, best first.
+    - `train_ivf`: k-means clustering for the IVF index.
+
+API Endpoints (mounted under `/text2vec`):
+    - PUT `/collections/{name}`: Creates a collection (`metric`, `index`, `nlist`, `nprobe`).
+    - GET `/collections` / GET `/collections/{name}`: List collections or describe one.
+    - DELETE `/collections/{name}`: Drops a collection, also from disk.
+    - POST `/collections/{name}/items`: Adds or replaces items given by `text` (embedded with the text2vec model)
+      or `vector`, with optional `metadata`.
+    - POST `/collections/{name}/remove`: Removes items by ID.
+    - POST `/collections/{name}/build`: (Re)trains the IVF index now instead of on the next search.
+    - POST `/collections/{name}/save`: Writes the collection to VECTOR_INDEX_DIR.
+    - POST `/search`: Embeds `text` (or takes `vector`) and returns the `k` nearest items of `collection`.
+
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import numpy as np
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+from decouple import config
+from .backends import registry_name
+from .batching import BATCH_MAX_TEXTS
+from .metrics import stage, count_error
+from . import text2vec_service
+
+VECTOR_INDEX_DIR = config('VECTOR_INDEX_DIR', default="")
+VECTOR_INDEX_IVF_MIN_SIZE = config('VECTOR_INDEX_IVF_MIN_SIZE', default=20000, cast=int)
+VECTOR_INDEX_NPROBE = config('VECTOR_INDEX_NPROBE', default=16, cast=int)
+VECTOR_INDEX_MAX_K = config('VECTOR_INDEX_MAX_K', default=100, cast=int)
+
+METRICS = ("cosine", "dot")
+INDEX_TYPES = ("auto", "exact", "ivf")
+COLLECTION_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Rows scored at once when assigning vectors to cells, to bound the size of the score matrix
+ASSIGN_CHUNK_ROWS = 16384
+
+
+def top_k(scores, k):
+    """
+    Returns the indices of the `k` highest `scores`, best first, without sorting the whole array.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def _nearest_cells(vectors, centroids):
+    # argmin of the L2 distance, without the |x|^2 term that is the same for every cell
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    cells = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        block = vectors[start:start + ASSIGN_CHUNK_ROWS]
+        cells[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return cells
+
+
+def train_ivf(vectors, nlist, iterations=10, sample_per_cell=32, seed=0):
+    """
+    Clusters `vectors` into `nlist` cells with k-means on a sample of the rows.
+
+    Args:
+    - vectors (np.ndarray): float32 matrix, one row per item.
+    - nlist (int): Number of cells.
+    - iterations (int): k-means iterations.
+    - sample_per_cell (int): Rows sampled per cell for training; the rest are only assigned afterwards.
+    - seed (int): Seed, so the same vectors always give the same index.
+
+    Returns:
+    - np.ndarray: The `(nlist, dim)` centroids.
+    """
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    sample_size = min(len(vectors), nlist * sample_per_cell)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        cells = _nearest_cells(sample, centroids)
+        counts = np.bincount(cells, minlength=nlist)
+        order = np.argsort(cells, kind="stable")
+        filled = np.flatnonzero(counts)
+        sums = np.add.reduceat(sample[order], np.concatenate(([0], np.cumsum(counts)[:-1]))[filled], axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        # Empty cells restart from random sample rows instead of going to waste
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty))]
+    return centroids
+
+
+class VectorCollection:
+    """
+    A named set of vectors with IDs and metadata, searchable exactly or through an IVF index.
+
+    All methods are thread-safe; they are called from the thread pool so the event loop stays free.
+
+    Args:
+    - name (str): Collection name.
+    - dim (int): Vector size; taken from the first vectors added when None.
+    - metric (str): `cosine` (vectors are normalized) or `dot`.
+    - index (str): `auto`, `exact` or `ivf`.
+    - nlist (int): IVF cells; defaults to the square root of the size at training time.
+    - nprobe (int): IVF cells scanned per query. Defaults to VECTOR_INDEX_NPROBE.
+    - model (str): Model the text items were embedded with.
+    """
+
+    def __init__(self, name, dim=None, metric="cosine", index="auto", nlist=None, nprobe=None, model=None):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Use one of: {', '.join(METRICS)}.")
+        if index not in INDEX_TYPES:
+            raise ValueError(f"Unknown index '{index}'. Use one of: {', '.join(INDEX_TYPES)}.")
+        self.name = name
+        self.dim = dim
+        self.metric = metric
+        self.index = index
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.model = model
+        self.lock = threading.RLock()
+        self.size = 0
+        self.ids = []
+        self.metadata = []
+        self.rows = {}
+        self._vectors = np.empty((0, dim or 0), dtype=np.float32)
+        # IVF state: cell of every row, and the rows grouped by cell up to `_indexed`
+        self.centroids = None
+        self._cells = np.empty(0, dtype=np.int32)
+        self._order = None
+        self._offsets = None
+        self._indexed = 0
+        self._trained_size = 0
+        self._dirty = False
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.size]
+
+    def uses_ivf(self):
+        return self.index == "ivf" or (self.index == "auto" and self.size >= VECTOR_INDEX_IVF_MIN_SIZE)
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            raise ValueError(f"Collection '{self.name}' holds {self.dim}-dimensional vectors, not {vectors.shape[1]}.")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+    def _reserve(self, rows):
+        if rows <= len(self._vectors):
+            return
+        capacity = max(rows, 2 * len(self._vectors), 64)
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self.size] = self._vectors[:self.size]
+        self._vectors = grown
+        cells = np.zeros(capacity, dtype=np.int32)
+        cells[:self.size] = self._cells[:self.size]
+        self._cells = cells
+
+    def upsert(self, ids, vectors, metadata=None):
+        """
+        Adds items, replacing the vector and metadata of IDs that are already present.
+
+        Raises:
+        - ValueError: If the vectors do not match the collection's dimension.
+        """
+        metadata = metadata or [None] * len(ids)
+        with self.lock:
+            vectors = self._prepare(vectors)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            self._reserve(self.size + len(ids))
+            rows = np.empty(len(ids), dtype=np.int64)
+            for position, (item_id, meta) in enumerate(zip(ids, metadata)):
+                row = self.rows.get(item_id)
+                if row is None:
+                    row = self.size
+                    self.rows[item_id] = row
+                    self.ids.append(item_id)
+                    self.metadata.append(meta)
+                    self.size += 1
+                else:
+                    self.metadata[row] = meta
+                    # The row may move to another cell
+                    self._dirty = self._dirty or row < self._indexed
+                rows[position] = row
+            self._vectors[rows] = vectors
+            if self.centroids is not None:
+                self._cells[rows] = _nearest_cells(vectors, self.centroids)
+
+    def remove(self, ids):
+        """
+        Removes items by ID; unknown IDs are ignored.
+
+        Returns:
+        - int: The number of items removed.
+        """
+        removed = 0
+        with self.lock:
+            for item_id in ids:
+                row = self.rows.pop(item_id, None)
+                if row is None:
+                    continue
+                # Move the last row into the gap so the matrix stays contiguous
+                last = self.size - 1
+                if row != last:
+                    self._vectors[row] = self._vectors[last]
+                    self._cells[row] = self._cells[last]
+                    self.ids[row] = self.ids[last]
+                    self.metadata[row] = self.metadata[last]
+                    self.rows[self.ids[row]] = row
+                self.ids.pop()
+                self.metadata.pop()
+                self.size -= 1
+                removed += 1
+            if removed:
+                self._dirty = True
+        return removed
+
+    def build(self, nlist=None):
+        """
+        Trains the IVF index on the current vectors and assigns every item to a cell.
+        """
+        with self.lock:
+            if not self.size:
+                return
+            self.nlist = nlist or self.nlist
+            cells = self.nlist or max(1, int(np.sqrt(self.size)))
+            self.centroids = train_ivf(self.vectors, cells)
+            self._cells[:self.size] = _nearest_cells(self.vectors, self.centroids)
+            self._trained_size = self.size
+            self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        cells = self._cells[:self.size]
+        self._order = np.argsort(cells, kind="stable")
+        self._offsets = np.searchsorted(cells[self._order], np.arange(len(self.centroids) + 1))
+        self._indexed = self.size
+        self._dirty = False
+
+    def _ensure_index(self):
+        if self.centroids is None or self.size > 4 * self._trained_size:
+            self.build()
+        elif self._dirty or self.size - self._indexed > max(1024, self._indexed // 10):
+            self._rebuild_lists()
+
+    def _candidates(self, query, nprobe):
+        half_norms = 0.5 * np.einsum("ij,ij->i", self.centroids, self.centroids)
+        probes = top_k(self.centroids @ query - half_norms, nprobe)
+        parts = [self._order[self._offsets[cell]:self._offsets[cell + 1]] for cell in probes]
+        # Items added since the lists were built are always scanned
+        parts.append(np.arange(self._indexed, self.size))
+        return np.concatenate(parts)
+
+    def search(self, queries, k, nprobe=None, exact=False):
+        """
+        Finds the `k` nearest items of each query.
+
+        Args:
+        - queries: One query vector or a matrix of them.
+        - k (int): Results per query.
+        - nprobe (int): IVF cells to scan; overrides the collection's setting.
+        - exact (bool): Scan every item even when the collection uses the IVF index.
+
+        Returns:
+        - tuple: The index used (`exact` or `ivf`) and, per query, a list of `{"id", "score", "metadata"}`.
+        """
+        with self.lock:
+            if not self.size:
+                return "exact", [[] for _ in np.atleast_2d(queries)]
+            queries = self._prepare(queries)
+            results = []
+            if exact or not self.uses_ivf():
+                scores = self.vectors @ queries.T
+                for column in range(len(queries)):
+                    best = top_k(scores[:, column], k)
+                    results.append(self._hits(best, scores[best, column]))
+                return "exact", results
+
+            self._ensure_index()
+            nprobe = nprobe or self.nprobe or VECTOR_INDEX_NPROBE
+            for query in queries:
+                candidates = self._candidates(query, nprobe)
+                scores = self._vectors[candidates] @ query
+                best = top_k(scores, k)
+                results.append(self._hits(candidates[best], scores[best]))
+            return "ivf", results
+
+    def _hits(self, rows, scores):
+        return [{"id": self.ids[row], "score": float(score), "metadata": self.metadata[row]}
+                for row, score in zip(rows, scores)]
+
+    def describe(self):
+        with self.lock:
+            return {"name": self.name, "size": self.size, "dim": self.dim, "metric": self.metric,
+                    "index": self.index, "active_index": "ivf" if self.uses_ivf() else "exact",
+                    "nlist": len(self.centroids) if self.centroids is not None else self.nlist,
+                    "nprobe": self.nprobe or VECTOR_INDEX_NPROBE, "model": self.model,
+                    "memory_bytes": int(self.size * (self.dim or 0) * 4)}
+
+    def save(self, path):
+        """
+        Writes the collection to the directory `path`, replacing what was there only once the new copy is complete.
+        """
+        staging = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        with self.lock:
+            np.save(os.path.join(staging, "vectors.npy"), self.vectors)
+            with open(os.path.join(staging, "items.jsonl"), "w") as f:
+                for item_id, meta in zip(self.ids, self.metadata):
+                    f.write(json.dumps({"id": item_id, "metadata": meta}) + "\n")
+            if self.centroids is not None:
+                np.save(os.path.join(staging, "centroids.npy"), self.centroids)
+                np.save(os.path.join(staging, "cells.npy"), self._cells[:self.size])
+            meta = {"name": self.name, "dim": self.dim, "metric": self.metric, "index": self.index, "nlist": self.nlist,
+                    "nprobe": self.nprobe, "model": self.model, "trained_size": self._trained_size}
+            with open(os.path.join(staging, "collection.json"), "w") as f:
+                json.dump(meta, f)
+
+        previous = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.replace(path, previous)
+        os.replace(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a collection written by `save`.
+        """
+        with open(os.path.join(path, "collection.json")) as f:
+            meta = json.load(f)
+        collection = cls(meta["name"], meta["dim"], meta["metric"], meta["index"], meta["nlist"], meta["nprobe"],
+                         meta["model"])
+        vectors = np.load(os.path.join(path, "vectors.npy"))
+        with open(os.path.join(path, "items.jsonl")) as f:
+            items = [json.loads(line) for line in f]
+        collection._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        collection._cells = np.zeros(len(vectors), dtype=np.int32)
+        collection.size = len(vectors)
+        collection.ids = [item["id"] for item in items]
+        collection.metadata = [item["metadata"] for item in items]
+        collection.rows = {item_id: row for row, item_id in enumerate(collection.ids)}
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            collection.centroids = np.load(os.path.join(path, "centroids.npy"))
+            collection._cells[:] = np.load(os.path.join(path, "cells.npy"))
+            collection._trained_size = meta["trained_size"]
+            collection._rebuild_lists()
+        return collection
+
+
+class VectorIndex:
+    """
+    The named collections of this process, optionally persisted under `directory`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.collections = {}
+        self._lock = threading.Lock()
+
+    def create(self, name, **options):
+        """
+        Creates an empty collection.
+
+        Raises:
+        - ValueError: If the name is invalid or taken, or an option is invalid.
+        """
+        if not COLLECTION_NAME.match(name):
+            raise ValueError("Collection names may only use letters, digits, '-' and '_' (at most 64).")
+        collection = VectorCollection(name, **options)
+        with self._lock:
+            if name in self.collections:
+                raise ValueError(f"Collection '{name}' already exists.")
+            self.collections[name] = collection
+        return collection
+
+    def drop(self, name):
+        """
+        Removes a collection, from disk as well.
+
+        Raises:
+        - KeyError: If there is no such collection.
+        """
+        with self._lock:
+            del self.collections[name]
+        if self.directory:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def save(self, name):
+        if not self.directory:
+            raise ValueError("Persistence is disabled; set VECTOR_INDEX_DIR.")
+        os.makedirs(self.directory, exist_ok=True)
+        self.collections[name].save(os.path.join(self.directory, name))
+
+    def save_all(self):
+        if self.directory:
+            for name in list(self.collections):
+                self.save(name)
+
+    def load_all(self):
+        """
+        Loads every saved collection from the directory.
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if COLLECTION_NAME.match(name) and os.path.exists(os.path.join(path, "collection.json")):
+                self.collections[name] = VectorCollection.load(path)
+
+
+vector_index = VectorIndex(VECTOR_INDEX_DIR)
+
+def current_model():
+    return registry_name(text2vec_service.model_name, text2vec_service.TEXT2VEC_BACKEND)
+
+# Create a router instance
+vector_index_router = APIRouter()
+
+# Models for your request and response
+class CollectionRequest(BaseModel):
+    metric: Literal["cosine", "dot"] = "cosine"
+    index: Literal["auto", "exact", "ivf"] = "auto"
+    nlist: Optional[int] = None
+    nprobe: Optional[int] = None
+
+class CollectionItem(BaseModel):
+    id: Union[str, int]
+    text: Optional[str] = None
+    vector: Optional[List[float]] = None
+    metadata: Optional[dict] = None
+
+class CollectionItemsRequest(BaseModel):
+    items: List[CollectionItem]
+
+class RemoveItemsRequest(BaseModel):
+    ids: List[Union[str, int]]
+
+class BuildRequest(BaseModel):
+    nlist: Optional[int] = None
+
+class SearchRequest(BaseModel):
+    collection: str
+    text: Optional[str] = None
+    vector: Optional[List[float]] = None
+    k: int = 10
+    nprobe: Optional[int] = None
+    exact: bool = False
+
+def unknown_collection(name):
+    return JSONResponse(content={"error": f"Unknown collection '{name}'."}, status_code=404)
+
+def model_mismatch(collection):
+    # Text items and queries are embedded with the current model; mixing models makes scores meaningless
+    if collection.model is not None and collection.model != current_model():
+        count_error("text2vec", "model_mismatch")
+        return JSONResponse(content={"error": f"Collection '{collection.name}' was built with {collection.model}; the service now runs {current_model()}."}, status_code=409)
+    return None
+
+@vector_index_router.put("/collections/{name}", status_code=201)
+def create_collection(name: str, request: CollectionRequest = None):
+    request = request or CollectionRequest()
+    try:
+        collection = vector_index.create(name, metric=request.metric, index=request.index, nlist=request.nlist,
+                                         nprobe=request.nprobe, model=current_model())
+    except ValueError as exc:
+        return JSONResponse(content={"error": str(exc)}, status_code=400)
+    return collection.describe()
+
+@vector_index_router.get("/collections")
+def list_collections():
+    return {"collections": [collection.describe() for collection in list(vector_index.collections.values())]}
+
+@vector_index_router.get("/collections/{name}")
+def describe_collection(name: str):
+    collection = vector_index.collections.get(name)
+    if collection is None:
+        return unknown_collection(name)
+    return collection.describe()
+
+@vector_index_router.delete("/collections/{name}")
+async def drop_collection(name: str):
+    if name not in vector_index.collections:
+        return unknown_collection(name)
+    await run_in_threadpool(vector_index.drop, name)
+    return {"name": name, "dropped": True}
+
+@vector_index_router.post("/collections/{name}/items")
+async def add_items(name: str, request: CollectionItemsRequest):
+    collection = vector_index.collections.get(name)
+    if collection is None:
+        return unknown_collection(name)
+    if len(request.items) > BATCH_MAX_TEXTS:
+        count_error("text2vec", "batch_too_large")
+        return JSONResponse(content={"error": f"Batch exceeds {BATCH_MAX_TEXTS} items. Please split it into smaller batches."}, status_code=400)
+
+    with stage("text2vec", "validate"):
+        for item in request.items:
+            if (item.text is None) == (item.vector is None):
+                count_error("text2vec", "validation")
+                return JSONResponse(content={"error": f"Item '{item.id}' needs either 'text' or 'vector'."}, status_code=400)
+            if item.text is not None and len(item.text.split()) > text2vec_service.WORD_LIMIT:
+                count_error("text2vec", "input_too_long")
+                return JSONResponse(content={"error": f"Item '{item.id}' exceeds {text2vec_service.WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
+
+    texts = [item.text for item in request.items if item.text is not None]
+    if texts:
+        mismatch = model_mismatch(collection)
+        if mismatch is not None:
+            return mismatch
+        # Texts are embedded together, through the embedding cache, like /text2vec/batch
+        async with text2vec_service.text2vec_executor.admit():
+            encoded = iter(await text2vec_service.vectorize_many_async(texts))
+    vectors = [next(encoded) if item.text is not None else item.vector for item in request.items]
+
+    try:
+        await run_in_threadpool(collection.upsert, [item.id for item in request.items], vectors,
+                                [item.metadata for item in request.items])
+    except ValueError as exc:
+        return JSONResponse(content={"error": str(exc)}, status_code=400)
+    return {"name": name, "upserted": len(request.items), "size": collection.size}
+
+@vector_index_router.post("/collections/{name}/remove")
+async def remove_items(name: str, request: RemoveItemsRequest):
+    collection = vector_index.collections.get(name)
+    if collection is None:
+        return unknown_collection(name)
+    removed = await run_in_threadpool(collection.remove, request.ids)
+    return {"name": name, "removed": removed, "size": collection.size}
+
+@vector_index_router.post("/collections/{name}/build")
+async def build_collection(name: str, request: BuildRequest = None):
+    collection = vector_index.collections.get(name)
+    if collection is None:
+        return unknown_collection(name)
+    await run_in_threadpool(collection.build, request.nlist if request else None)
+    return collection.describe()
+
+@vector_index_router.post("/collections/{name}/save")
+async def save_collection(name: str):
+    if name not in vector_index.collections:
+        return unknown_collection(name)
+    try:
+        await run_in_threadpool(vector_index.save, name)
+    except ValueError as exc:
+        return JSONResponse(content={"error": str(exc)}, status_code=400)
+    return {"name": name, "saved": True}
+
+@vector_index_router.post("/search")
+async def search(request: SearchRequest):
+    collection = vector_index.collections.get(request.collection)
+    if collection is None:
+        return unknown_collection(request.collection)
+    with stage("text2vec", "validate"):
+        if (request.text is None) == (request.vector is None):
+            count_error("text2vec", "validation")
+            return JSONResponse(content={"error": "Send either 'text' or 'vector'."}, status_code=400)
+        if not 1 <= request.k <= VECTOR_INDEX_MAX_K:
+            count_error("text2vec", "validation")
+            return JSONResponse(content={"error": f"'k' must be between 1 and {VECTOR_INDEX_MAX_K}."}, status_code=400)
+        if request.text is not None and len(request.text.split()) > text2vec_service.WORD_LIMIT:
+            count_error("text2vec", "input_too_long")
+            return JSONResponse(content={"error": f"Input text exceeds {text2vec_service.WORD_LIMIT} words. Please provide shorter text."}, status_code=400)
+
+    query = request.vector
+    if request.text is not None:
+        mismatch = model_mismatch(collection)
+        if mismatch is not None:
+            return mismatch
+        # The query is micro-batched and cached like any /text2vec/ request
+        async with text2vec_service.text2vec_executor.admit():
+            query = await text2vec_service.vectorize_async(request.text, len(request.text.split()))
+
+    def run_search():
+        with stage("text2vec", "search"):
+            return collection.search(query, request.k, request.nprobe, request.exact)
+
+    try:
+        index, results = await run_in_threadpool(run_search)
+    except ValueError as exc:
+        return JSONResponse(content={"error": str(exc)}, status_code=400)
+    return {"collection": request.collection, "index": index, "results": results[0]}
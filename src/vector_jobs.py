@@ -0,0 +1,521 @@
+"""
+vector_jobs.py
+==============
+
+This module runs bulk vectorization jobs for corpus backfills that are too large for request/response.
+
+A client submits an NDJSON corpus, one `{"id": ..., "text": ...}` object per line, either as the request body or
+as a path on the server, and gets a job ID back at once. A worker then processes the job in two streaming passes,
+so memory use stays flat however large the corpus is:
+
+    1. `indexing`: Every line is validated. The ID of each valid line is written to `ids.jsonl`, so row `i` of the
+       output belongs to line `i` of that file. Invalid lines (including texts of more than
+       CHUNK_MAX_CHUNKS chunks) are written to `errors.jsonl` with their line number and skipped.
+    2. `running`: The input is read again in batches of VECTOR_JOB_BATCH_SIZE texts. Each batch is encoded on the
+       text2vec executor, in its bulk lane (see `executors.py`), and written into `vectors.npy`, a float32 `.npy`
+       file preallocated for every row and written through a memory map.
+
+After each batch the vectors are flushed to disk before the job's progress (rows done and the input offset to
+continue from) is saved to `job.json`. A job interrupted by a crash or restart therefore resumes at its last
+saved batch when the app starts again, redoing at most one batch. Jobs bypass the embedding cache, so a
+backfill does not evict the entries that serve interactive requests.
+
+Imports:
+    - `asyncio`, `json` and `numpy` for the workers, the job files and the memory-mapped output.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - VECTOR_JOBS_DIR: Directory holding one subdirectory per job. Jobs are disabled while it is empty (the default).
+    - VECTOR_JOBS_INPUT_DIR: Directory that local input paths are resolved against. Paths outside it are refused,
+      and local paths are disabled while it is empty (the default); uploads work either way.
+    - VECTOR_JOB_BATCH_SIZE: Texts read, encoded and checkpointed per step (default is 512).
+    - VECTOR_JOB_WORKERS: Jobs processed at the same time (default is 1).
+
+Classes:
+    - `VectorJobs`: Job store and worker pool.
+
+Functions:
+    - `parse_record`: Validates one NDJSON line.
+    - `encode_batch`: Encodes a batch of job texts into a float32 matrix.
+
+API Endpoints (mounted under `/text2vec/jobs`):
+    - POST `/`: Submits a job. The body is either the NDJSON corpus itself or `{"path": ...}` as JSON.
+    - GET `/`: Lists the jobs.
+    - GET `/{job_id}`: Reports a job's state, progress, throughput and estimated time left.
+    - GET `/{job_id}/vectors`: Downloads `vectors.npy` once the job is done.
+    - GET `/{job_id}/ids` / GET `/{job_id}/errors`: Download the ID index and the rejected lines.
+    - DELETE `/{job_id}`: Cancels a job and deletes its files.
+
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
+from decouple import config
+from .backends import registry_name
+from .chunking import chunking_requested, pool_vectors, CHUNK_MAX_CHUNKS
+from .metrics import count_error
+from .vector_formats import NPY_MEDIA_TYPE
+from . import text2vec_service
+
+VECTOR_JOBS_DIR = config('VECTOR_JOBS_DIR', default="")
+VECTOR_JOBS_INPUT_DIR = config('VECTOR_JOBS_INPUT_DIR', default="")
+VECTOR_JOB_BATCH_SIZE = config('VECTOR_JOB_BATCH_SIZE', default=512, cast=int)
+VECTOR_JOB_WORKERS = config('VECTOR_JOB_WORKERS', default=1, cast=int)
+VECTOR_JOBS_ENABLED = bool(VECTOR_JOBS_DIR)
+
+# States a job can still make progress from; anything else is final
+ACTIVE_STATES = ("queued", "indexing", "running")
+
+# Texts per forward pass inside one job batch; larger batches only pad more
+ENCODE_BATCH_SIZE = 64
+
+INPUT_FILE = "input.ndjson"
+JOB_FILE = "job.json"
+IDS_FILE = "ids.jsonl"
+ERRORS_FILE = "errors.jsonl"
+VECTORS_FILE = "vectors.npy"
+
+# Uploads are written to "<directory>/.upload-<job_id>" and renamed into place once complete
+UPLOAD_PREFIX = ".upload-"
+
+
+def is_job_id(name):
+    """
+    Returns whether `name` has the form of a job ID (a hex UUID).
+    """
+    return len(name) == 32 and all(char in "0123456789abcdef" for char in name)
+
+
+def parse_record(raw, number):
+    """
+    Validates one NDJSON line of a job's input.
+
+    Args:
+    - raw (bytes): The line.
+    - number (int): Its 1-based line number, used as the ID when the record has none.
+
+    Returns:
+    - tuple: `(id, text)`.
+
+    Raises:
+    - ValueError: If the line is not a JSON object with a `text` string, or the text is over WORD_LIMIT words
+      while chunking is off (CHUNK_LONG_TEXTS), or splits into more than CHUNK_MAX_CHUNKS chunks.
+    """
+    try:
+        record = json.loads(raw)
+    except ValueError:
+        raise ValueError("Line is not valid JSON.")
+    if not isinstance(record, dict) or not isinstance(record.get("text"), str):
+        raise ValueError("Each line must be a JSON object with a 'text' string.")
+    if len(record["text"].split()) > text2vec_service.WORD_LIMIT:
+        if not chunking_requested(None):
+            raise ValueError(f"Input text exceeds {text2vec_service.WORD_LIMIT} words. Please provide shorter text.")
+        # Same bound as the `/text2vec/` endpoint, so one huge row cannot hold up a whole batch
+        if len(text2vec_service.chunk_document(record["text"])) > CHUNK_MAX_CHUNKS:
+            raise ValueError(f"Input text exceeds {CHUNK_MAX_CHUNKS} chunks. Please provide shorter text.")
+    return record.get("id", number), record["text"]
+
+
+def encode_batch(texts):
+    """
+    Encodes job texts into one float32 row each. Texts over WORD_LIMIT (only accepted with CHUNK_LONG_TEXTS) are
+    chunked and pooled like the `/text2vec/` endpoint does; `parse_record` has already rejected texts with more
+    than CHUNK_MAX_CHUNKS chunks.
+    """
+    short = [index for index, text in enumerate(texts) if len(text.split()) <= text2vec_service.WORD_LIMIT]
+    rows = {}
+    if short:
+        encoded = text2vec_service.encode_matrix([texts[index] for index in short], ENCODE_BATCH_SIZE)
+        rows.update(zip(short, encoded))
+    for index in range(len(texts)):
+        if index not in rows:
+            chunks = text2vec_service.chunk_document(texts[index])
+            vectors = text2vec_service.encode_matrix([chunk.text for chunk in chunks], ENCODE_BATCH_SIZE)
+            rows[index] = np.asarray(pool_vectors(vectors, chunks), dtype=np.float32)
+    return np.stack([rows[index] for index in range(len(texts))])
+
+
+class VectorJobs:
+    """
+    Stores bulk vectorization jobs on disk and processes them with a fixed number of asyncio workers.
+
+    Job state lives in `<directory>/<job_id>/job.json` and is only changed from the event loop; file work runs
+    on the thread pool and encoding on `executor`.
+
+    Args:
+    - directory (str): Where job directories are created.
+    - encode_fn (callable): Takes a list of texts and returns a float32 matrix with one row per text. Must be a
+      picklable top-level function when `executor` runs in process mode.
+    - executor (InferenceExecutor): Executor the batches are encoded on.
+    - model (str): Identifier of the model in use; a job is not resumed with a different model.
+    - batch_size (int): Texts per step. Defaults to VECTOR_JOB_BATCH_SIZE.
+    - workers (int): Jobs processed at once. Defaults to VECTOR_JOB_WORKERS.
+    - input_dir (str): Root for local input paths. Defaults to VECTOR_JOBS_INPUT_DIR.
+    """
+
+    def __init__(self, directory, encode_fn, executor, model, batch_size=None, workers=None, input_dir=None):
+        self.directory = directory
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.model = model
+        self.batch_size = VECTOR_JOB_BATCH_SIZE if batch_size is None else batch_size
+        self.workers = VECTOR_JOB_WORKERS if workers is None else workers
+        self.input_dir = VECTOR_JOBS_INPUT_DIR if input_dir is None else input_dir
+        self.jobs = {}
+        self._active = set()
+        self._queue = None
+        self._tasks = []
+
+    def path(self, job_id, name=""):
+        return os.path.join(self.directory, job_id, name)
+
+    async def start(self):
+        """
+        Loads the existing jobs, queues the unfinished ones (oldest first) and starts the workers.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = asyncio.Queue()
+        for job in await run_in_threadpool(self._load_jobs):
+            self.jobs[job["id"]] = job
+            if job["state"] in ACTIVE_STATES:
+                self._queue.put_nowait(job["id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Stops the workers. Running jobs keep their saved progress and resume on the next `start()`.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _load_jobs(self):
+        jobs = []
+        for job_id in os.listdir(self.directory):
+            if job_id.startswith(UPLOAD_PREFIX):
+                # An upload the app stopped in the middle of
+                shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+                continue
+            try:
+                with open(self.path(job_id, JOB_FILE)) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                if is_job_id(job_id) and os.path.isdir(self.path(job_id)):
+                    # Created just before a crash, before its job file was written
+                    shutil.rmtree(self.path(job_id), ignore_errors=True)
+                # Anything else is not ours to remove
+                continue
+            if job["state"] == "cancelled":
+                shutil.rmtree(self.path(job_id), ignore_errors=True)
+                continue
+            jobs.append(job)
+        return sorted(jobs, key=lambda job: job["created"])
+
+    def resolve_input(self, path):
+        """
+        Resolves a client-supplied input path against the input directory.
+
+        Raises:
+        - ValueError: If local paths are disabled or `path` is not a file inside the input directory.
+        """
+        if not self.input_dir:
+            raise ValueError("Local input paths are disabled; upload the corpus as the request body instead.")
+        root = os.path.realpath(self.input_dir)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root or not os.path.isfile(resolved):
+            raise ValueError(f"'{path}' is not a file in the job input directory.")
+        return resolved
+
+    async def submit_upload(self, body):
+        """
+        Creates a job from an uploaded corpus, streaming `body` (async iterable of bytes) to disk.
+        """
+        job_id = uuid.uuid4().hex
+        # The upload only becomes a job directory once it is complete; an interrupted one is removed
+        partial = os.path.join(self.directory, UPLOAD_PREFIX + job_id)
+        os.makedirs(partial)
+        try:
+            with open(os.path.join(partial, INPUT_FILE), "wb") as f:
+                async for chunk in body:
+                    await run_in_threadpool(f.write, chunk)
+        except BaseException:
+            await run_in_threadpool(shutil.rmtree, partial, True)
+            raise
+        os.replace(partial, self.path(job_id))
+        return await self._create(job_id, "upload", self.path(job_id, INPUT_FILE))
+
+    async def submit_path(self, path):
+        """
+        Creates a job that reads `path`, relative to the input directory.
+
+        Raises:
+        - ValueError: See `resolve_input`.
+        """
+        resolved = self.resolve_input(path)
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.path(job_id))
+        return await self._create(job_id, path, resolved)
+
+    async def _create(self, job_id, source, input_path):
+        stat = os.stat(input_path)
+        now = time.time()
+        job = {"id": job_id, "state": "queued", "source": source, "input": input_path, "input_size": stat.st_size,
+               "input_mtime": stat.st_mtime, "model": self.model, "dim": None, "rows": None, "rows_done": 0,
+               "errors": 0, "offset": 0, "line": 0, "seconds": 0.0, "created": now, "updated": now, "error": None}
+        await self._save(job)
+        self.jobs[job_id] = job
+        self._queue.put_nowait(job_id)
+        return job
+
+    async def _save(self, job):
+        job["updated"] = time.time()
+        await run_in_threadpool(self._write_job, dict(job))
+
+    def _write_job(self, job):
+        # Write-then-rename, so a crash never leaves a half-written job file
+        path = self.path(job["id"], JOB_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def describe(self, job_id):
+        """
+        Reports a job's state and progress.
+
+        Returns:
+        - dict: `id`, `state`, `source`, `model`, `dim`, `rows` (known once indexed), `rows_done`, `errors`,
+          `progress`, `docs_per_second`, `eta_seconds`, timestamps and `error` for failed jobs.
+
+        Raises:
+        - KeyError: If there is no such job.
+        """
+        job = self.jobs[job_id]
+        info = {key: job[key] for key in ("id", "state", "source", "model", "dim", "rows", "rows_done", "errors",
+                                          "created", "updated")}
+        if job["rows"] is not None:
+            info["progress"] = round(job["rows_done"] / job["rows"], 4) if job["rows"] else 1.0
+        if job["seconds"]:
+            rate = job["rows_done"] / job["seconds"]
+            info["docs_per_second"] = round(rate, 1)
+            if job["state"] == "running" and rate:
+                info["eta_seconds"] = round((job["rows"] - job["rows_done"]) / rate, 1)
+        if job["error"]:
+            info["error"] = job["error"]
+        return info
+
+    async def delete(self, job_id):
+        """
+        Cancels a job and deletes its files; a running job stops at its next batch.
+
+        Raises:
+        - KeyError: If there is no such job.
+        """
+        job = self.jobs.pop(job_id)
+        if job_id in self._active:
+            # The worker removes the files once it lets go of them
+            job["state"] = "cancelled"
+            await self._save(job)
+        else:
+            await run_in_threadpool(shutil.rmtree, self.path(job_id), True)
+
+    async def _worker(self):
+        while True:
+            job = self.jobs.get(await self._queue.get())
+            if job is None or job["state"] not in ACTIVE_STATES:
+                continue
+            self._active.add(job["id"])
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                # Shutting down; the job resumes from its last saved batch on the next start
+                raise
+            except Exception as exc:
+                if job["state"] != "cancelled":
+                    count_error("text2vec", "job_failed")
+                    job["state"] = "failed"
+                    job["error"] = str(exc)
+                    await self._save(job)
+            finally:
+                self._active.discard(job["id"])
+            if job["state"] == "cancelled":
+                await run_in_threadpool(shutil.rmtree, self.path(job["id"]), True)
+
+    def _check_input(self, job):
+        stat = os.stat(job["input"])
+        if stat.st_size != job["input_size"] or stat.st_mtime != job["input_mtime"]:
+            raise ValueError("The input file changed after the job was submitted.")
+        if job["rows_done"] and job["model"] != self.model:
+            raise ValueError(f"The job was started with {job['model']} but the service now runs {self.model}.")
+        job["model"] = self.model
+
+    async def _run(self, job):
+        await run_in_threadpool(self._check_input, job)
+        # A job deleted while an await above was pending must stay cancelled, so the worker removes its files
+        if job["state"] == "cancelled":
+            return
+
+        if job["state"] != "running":
+            # Indexing is cheap next to encoding, so an interrupted index is simply redone
+            job["state"] = "indexing"
+            await self._save(job)
+            job["rows"], job["errors"] = await run_in_threadpool(self._index, job)
+            if job["state"] == "cancelled":
+                return
+            job["state"] = "running"
+            await self._save(job)
+
+        vectors = None
+        with open(job["input"], "rb") as source:
+            source.seek(job["offset"])
+            while job["rows_done"] < job["rows"]:
+                if job["state"] == "cancelled":
+                    return
+                start = time.perf_counter()
+                texts, line = await run_in_threadpool(self._read_batch, source, job["line"])
+                if not texts:
+                    raise ValueError("The input ended before every indexed row was vectorized.")
+                # Backfills yield to interactive requests for the same model
+                matrix = await self.executor.run(self.encode_fn, texts, lane="bulk")
+                vectors = await run_in_threadpool(self._write_rows, job, vectors, matrix)
+                job["rows_done"] += len(texts)
+                job["offset"] = source.tell()
+                job["line"] = line
+                job["seconds"] += time.perf_counter() - start
+                await self._save(job)
+
+        del vectors
+        if not os.path.exists(self.path(job["id"], VECTORS_FILE)):
+            # Nothing to encode; still leave a valid (empty) output
+            await run_in_threadpool(np.save, self.path(job["id"], VECTORS_FILE), np.zeros((0, 0), dtype=np.float32))
+        if job["state"] != "cancelled":
+            job["state"] = "done"
+            await self._save(job)
+
+    def _index(self, job):
+        rows = errors = 0
+        with open(job["input"], "rb") as source, open(self.path(job["id"], IDS_FILE), "w") as ids, \
+                open(self.path(job["id"], ERRORS_FILE), "w") as rejected:
+            for number, raw in enumerate(source, 1):
+                if not raw.strip():
+                    continue
+                try:
+                    record_id, _ = parse_record(raw, number)
+                except ValueError as exc:
+                    errors += 1
+                    rejected.write(json.dumps({"line": number, "error": str(exc)}) + "\n")
+                    continue
+                ids.write(json.dumps(record_id) + "\n")
+                rows += 1
+        return rows, errors
+
+    def _read_batch(self, source, line):
+        # Next batch of valid texts; invalid lines were recorded while indexing and are skipped the same way here
+        texts = []
+        while len(texts) < self.batch_size:
+            raw = source.readline()
+            if not raw:
+                break
+            line += 1
+            if not raw.strip():
+                continue
+            try:
+                texts.append(parse_record(raw, line)[1])
+            except ValueError:
+                continue
+        return texts, line
+
+    def _write_rows(self, job, vectors, matrix):
+        path = self.path(job["id"], VECTORS_FILE)
+        if vectors is None:
+            if job["dim"] is None or not os.path.exists(path):
+                # First batch: the model's output size is known now, so preallocate every row
+                job["dim"] = int(matrix.shape[1])
+                vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(job["rows"], job["dim"]))
+            else:
+                vectors = np.load(path, mmap_mode="r+")
+        vectors[job["rows_done"]:job["rows_done"] + len(matrix)] = matrix
+        # On disk before the progress that covers these rows is saved
+        vectors.flush()
+        return vectors
+
+
+vector_jobs = VectorJobs(VECTOR_JOBS_DIR, encode_batch, text2vec_service.text2vec_executor,
+                         registry_name(text2vec_service.model_name, text2vec_service.TEXT2VEC_BACKEND))
+
+# Create a router instance
+vector_jobs_router = APIRouter()
+
+def unknown_job(job_id):
+    return JSONResponse(content={"error": f"Unknown job '{job_id}'."}, status_code=404)
+
+@vector_jobs_router.post("/", status_code=202)
+async def submit_job(request: Request):
+    if request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.json()
+        path = body.get("path") if isinstance(body, dict) else None
+        if not isinstance(path, str):
+            count_error("text2vec", "validation")
+            return JSONResponse(content={"error": "Send {\"path\": ...} as JSON, or the NDJSON corpus as the request body."}, status_code=400)
+        try:
+            job = await vector_jobs.submit_path(path)
+        except ValueError as exc:
+            count_error("text2vec", "validation")
+            return JSONResponse(content={"error": str(exc)}, status_code=400)
+    else:
+        job = await vector_jobs.submit_upload(request.stream())
+    return vector_jobs.describe(job["id"])
+
+@vector_jobs_router.get("/")
+def list_jobs():
+    return {"jobs": [vector_jobs.describe(job_id) for job_id in list(vector_jobs.jobs)]}
+
+@vector_jobs_router.get("/{job_id}")
+def job_status(job_id: str):
+    if job_id not in vector_jobs.jobs:
+        return unknown_job(job_id)
+    return vector_jobs.describe(job_id)
+
+@vector_jobs_router.get("/{job_id}/vectors")
+def job_vectors(job_id: str):
+    job = vector_jobs.jobs.get(job_id)
+    if job is None:
+        return unknown_job(job_id)
+    if job["state"] != "done":
+        return JSONResponse(content={"error": f"Job '{job_id}' is {job['state']}; vectors are available once it is done."}, status_code=409)
+    return FileResponse(vector_jobs.path(job_id, VECTORS_FILE), media_type=NPY_MEDIA_TYPE, filename=f"{job_id}.npy")
+
+@vector_jobs_router.get("/{job_id}/ids")
+def job_ids(job_id: str):
+    job = vector_jobs.jobs.get(job_id)
+    if job is None:
+        return unknown_job(job_id)
+    if job["rows"] is None:
+        return JSONResponse(content={"error": f"Job '{job_id}' has not been indexed yet."}, status_code=409)
+    return FileResponse(vector_jobs.path(job_id, IDS_FILE), media_type="application/x-ndjson", filename=f"{job_id}.ids.jsonl")
+
+@vector_jobs_router.get("/{job_id}/errors")
+def job_errors(job_id: str):
+    job = vector_jobs.jobs.get(job_id)
+    if job is None:
+        return unknown_job(job_id)
+    if job["rows"] is None:
+        return JSONResponse(content={"error": f"Job '{job_id}' has not been indexed yet."}, status_code=409)
+    return FileResponse(vector_jobs.path(job_id, ERRORS_FILE), media_type="application/x-ndjson", filename=f"{job_id}.errors.jsonl")
+
+@vector_jobs_router.delete("/{job_id}")
+async def delete_job(job_id: str):
+    if job_id not in vector_jobs.jobs:
+        return unknown_job(job_id)
+    await vector_jobs.delete(job_id)
+    return {"id": job_id, "state": "cancelled"}
@@ -0,0 +1,140 @@
+"""
+weaviate_service.py
+===================
+
+This module exposes the text2vec model through the HTTP API of Weaviate's `text2vec-transformers` inference
+container, so Weaviate can use this service as its vectorizer directly instead of through a proxy.
+
+Point Weaviate's `TRANSFORMERS_INFERENCE_API` at this app (plus WEAVIATE_API_PREFIX, if set). Weaviate sends one
+request per object, many at a time during imports; concurrent requests are micro-batched into shared
+`model.encode` calls and served from the embedding cache like the rest of the text2vec service. Clients other
+than Weaviate may also send a whole batch in one request.
+
+These routes cannot carry the `X-API-KEY` header (Weaviate has no setting for it), so they are off by default
+and should only be enabled on a network Weaviate alone can reach.
+
+Configuration:
+    - WEAVIATE_API_ENABLED: Mount these routes (default is False). Requires TEXT2VEC_ENABLED.
+    - WEAVIATE_API_PREFIX: Path prefix for the routes (default is "", i.e. `/vectors`, `/meta`, ...).
+
+API Endpoints:
+    - GET `/.well-known/live`: 204 while the app is up.
+    - GET `/.well-known/ready`: 204 once the text2vec model is loaded, 503 before that.
+    - GET `/meta`: The model's name, backend, dimensions and configuration.
+    - POST `/vectors`: Takes `{"text": ..., "config": {...}}` and returns `{"text", "vector", "dim"}`, as
+      Weaviate expects. Also takes `{"texts": [...]}` and returns `{"texts", "vectors", "dim"}` for a whole batch
+      in one call. Texts over WORD_LIMIT are chunked and pooled (see `chunking.py`) instead of rejected, since a
+      rejection would fail the Weaviate import. The `pooling_strategy` in `config` is accepted but not used: the
+      SentenceTransformer applies the pooling it was trained with.
+
+"""
+
+import threading
+from fastapi import APIRouter, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from decouple import config
+from .model_registry import registry
+from .backends import registry_name
+from .batching import BATCH_MAX_TEXTS
+from .chunking import CHUNK_MAX_CHUNKS
+from .metrics import stage, count_error
+from . import text2vec_service
+
+WEAVIATE_API_ENABLED = config('WEAVIATE_API_ENABLED', default=False, cast=bool)
+WEAVIATE_API_PREFIX = config('WEAVIATE_API_PREFIX', default="")
+
+weaviate_router = APIRouter()
+
+class VectorInputConfig(BaseModel):
+    pooling_strategy: Optional[str] = None
+    task_type: Optional[str] = None
+
+class VectorInput(BaseModel):
+    text: Optional[str] = None
+    texts: Optional[List[str]] = None
+    config: Optional[VectorInputConfig] = None
+
+def model_state():
+    statuses = registry.status()
+    name = registry_name(text2vec_service.model_name, text2vec_service.TEXT2VEC_BACKEND)
+    for model in statuses:
+        if model["role"] == "text2vec.model" and model["name"] == name:
+            return model["state"]
+    return "pending"
+
+async def document_vector(text):
+    # Texts within the word limit are micro-batched; longer ones are chunked and pooled
+    with stage("text2vec", "validate"):
+        words = len(text.split())
+    if words <= text2vec_service.WORD_LIMIT:
+        return await text2vec_service.vectorize_async(text, words)
+    chunks = await run_in_threadpool(text2vec_service.chunk_document, text)
+    if len(chunks) > CHUNK_MAX_CHUNKS:
+        count_error("text2vec", "too_many_chunks")
+        raise ValueError(f"Input text exceeds {CHUNK_MAX_CHUNKS} chunks. Please provide shorter text.")
+    if len(chunks) == 1:
+        return await text2vec_service.vectorize_async(text, words)
+    return await text2vec_service.vectorize_chunks(chunks)
+
+@weaviate_router.get("/.well-known/live")
+def live():
+    return Response(status_code=204)
+
+@weaviate_router.get("/.well-known/ready")
+def ready():
+    state = model_state()
+    if state == "ready":
+        return Response(status_code=204)
+    if state == "pending":
+        # Nothing is loading it yet (MODEL_LOADING=lazy); Weaviate asking means it is about to be used
+        start_loader()
+    return Response(status_code=503)
+
+# At most one loader thread, however often readiness is polled while the model is still pending
+_loader = None
+_loader_lock = threading.Lock()
+
+def start_loader():
+    global _loader
+    with _loader_lock:
+        if _loader is None or not _loader.is_alive():
+            _loader = threading.Thread(target=text2vec_service.get_model, name="weaviate-model-loader", daemon=True)
+            _loader.start()
+
+@weaviate_router.get("/meta")
+async def meta():
+    model = await run_in_threadpool(text2vec_service.get_model)
+    info = {"name": text2vec_service.model_name, "backend": text2vec_service.TEXT2VEC_BACKEND,
+            "dimensions": model.get_sentence_embedding_dimension()}
+    # The transformer's own configuration, as the reference container reports it
+    first_module = getattr(model, "_first_module", None)
+    model_config = getattr(getattr(first_module(), "auto_model", None), "config", None) if first_module else None
+    if model_config is not None:
+        info.update(model_config.to_dict())
+    return {"model": info}
+
+@weaviate_router.post("/vectors")
+async def vectors(request: VectorInput):
+    if (request.text is None) == (request.texts is None):
+        count_error("text2vec", "validation")
+        return JSONResponse(content={"error": "Send either 'text' or 'texts'."}, status_code=422)
+    if request.texts is not None and len(request.texts) > BATCH_MAX_TEXTS:
+        count_error("text2vec", "batch_too_large")
+        return JSONResponse(content={"error": f"Batch exceeds {BATCH_MAX_TEXTS} texts. Please split it into smaller batches."}, status_code=422)
+
+    try:
+        async with text2vec_service.text2vec_executor.admit():
+            if request.text is not None:
+                vector = await document_vector(request.text)
+                return {"text": request.text, "vector": vector, "dim": len(vector)}
+
+            short = [text for text in request.texts if len(text.split()) <= text2vec_service.WORD_LIMIT]
+            # Texts within the limit go through one batched encode; the rest are chunked one by one
+            encoded = dict(zip(short, await text2vec_service.vectorize_many_async(short))) if short else {}
+            vectors = [encoded[text] if text in encoded else await document_vector(text) for text in request.texts]
+    except ValueError as exc:
+        return JSONResponse(content={"error": str(exc)}, status_code=422)
+    return {"texts": request.texts, "vectors": vectors, "dim": len(vectors[0]) if vectors else 0}
@@ -0,0 +1,166 @@
+"""
+worker_pool.py
+==============
+
+This module provides the shared pool of inference worker processes used when INFERENCE_EXECUTOR is `process`.
+
+Running more uvicorn workers loads every model once per worker and lets the PyTorch intra-op thread pools of
+all three models fight over the same cores. Instead, the FastAPI front end runs as a single process and
+dispatches inference to this pool:
+
+    - All declared models (see `model_registry.py`) are loaded in the parent before the pool forks, so the
+      workers share the weights copy-on-write. `gc.freeze()` keeps the garbage collector from touching (and so copying) those pages.
+    - Each worker is pinned to its own set of cores and sets its torch thread count to match, so workers
+      do not oversubscribe the CPU.
+
+Imports:
+    - Standard library modules for process management and CPU affinity.
+    - Environment variable management using 'decouple'.
+
+Configuration:
+    - WORKER_PROCESSES: Number of inference worker processes (default is 2).
+    - WORKER_CORES: Explicit core sets, one per worker, separated by ';' (e.g. "0-3;4-7"). By default the
+      cores available to the app are split evenly between the workers.
+    - WORKER_TORCH_THREADS: torch intra-op threads per worker (default is 0, meaning one per pinned core).
+
+Functions:
+    - `parse_core_sets`: Parses WORKER_CORES.
+    - `start`: Loads the declared models and forks the workers.
+    - `get_pool`: Returns the running pool, starting it if needed.
+    - `is_running`: Whether the workers have been forked.
+    - `shutdown`: Stops the workers.
+
+"""
+
+import gc
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from .model_registry import registry
+
+WORKER_PROCESSES = config('WORKER_PROCESSES', default=2, cast=int)
+WORKER_CORES = config('WORKER_CORES', default="")
+WORKER_TORCH_THREADS = config('WORKER_TORCH_THREADS', default=0, cast=int)
+
+_pool = None
+_lock = threading.Lock()
+
+
+def parse_core_sets(spec, workers):
+    """
+    Parses a core set specification such as "0-3;4,5;6-7".
+
+    Args:
+    - spec (str): ';'-separated core sets; each is a ','-separated list of cores or 'a-b' ranges.
+      An empty spec splits the available cores evenly between `workers`.
+    - workers (int): Number of workers.
+
+    Returns:
+    - list: One sorted list of core ids per worker.
+    """
+    if not spec:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        if workers > len(cores):
+            # More workers than cores: let them share rather than leave some unpinned
+            return [[cores[i % len(cores)]] for i in range(workers)]
+        per_worker = len(cores) // workers
+        return [cores[i * per_worker:(i + 1) * per_worker] for i in range(workers)]
+
+    core_sets = []
+    for part in spec.split(";"):
+        cores = []
+        for item in part.split(","):
+            item = item.strip()
+            if "-" in item:
+                first, last = item.split("-")
+                cores.extend(range(int(first), int(last) + 1))
+            elif item:
+                cores.append(int(item))
+        core_sets.append(sorted(cores))
+    if len(core_sets) != workers:
+        raise ValueError(f"WORKER_CORES lists {len(core_sets)} core sets but WORKER_PROCESSES is {workers}.")
+    return core_sets
+
+
+def _init_worker(core_sets, torch_threads, counter):
+    # Each worker claims the next core set in turn
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    cores = core_sets[index % len(core_sets)]
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    torch.set_num_threads(torch_threads or len(cores))
+
+
+def _ready():
+    return os.getpid()
+
+
+def start(workers=None, core_spec=None, torch_threads=None):
+    """
+    Loads every declared model in the parent, then forks and pins the workers.
+
+    Returns:
+    - ProcessPoolExecutor: The running pool.
+    """
+    global _pool
+    workers = WORKER_PROCESSES if workers is None else workers
+    core_spec = WORKER_CORES if core_spec is None else core_spec
+    torch_threads = WORKER_TORCH_THREADS if torch_threads is None else torch_threads
+
+    with _lock:
+        if _pool is not None:
+            return _pool
+
+        # Failures are reported by the readiness endpoint; workers would retry them on first use
+        registry.load_declared()
+
+        # Move everything loaded so far out of the collector's reach, so workers never write to those pages
+        gc.collect()
+        gc.freeze()
+
+        core_sets = parse_core_sets(core_spec, workers)
+        counter = multiprocessing.get_context("fork").Value("i", 0)
+        _pool = ProcessPoolExecutor(max_workers=workers,
+                                    mp_context=multiprocessing.get_context("fork"),
+                                    initializer=_init_worker,
+                                    initargs=(core_sets, torch_threads, counter))
+
+        # Fork all workers now, while the parent is idle, rather than on the first requests
+        for future in [_pool.submit(_ready) for _ in range(workers)]:
+            future.result()
+        return _pool
+
+
+def get_pool():
+    """
+    Returns the running pool, starting it if needed.
+    """
+    if _pool is None:
+        return start()
+    return _pool
+
+
+def is_running():
+    """
+    Returns True once the workers have been forked.
+    """
+    return _pool is not None
+
+
+def shutdown():
+    """
+    Stops the workers.
+    """
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            gc.unfreeze()
@@ -0,0 +1,55 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src.backends import registry_name, load_seq2seq, _agreement
+
+def test_registry_name_keeps_fp32_name():
+    assert registry_name("t5-small", "torch") == "t5-small"
+    assert registry_name("t5-small", "torch-int8") == "t5-small [torch-int8]"
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        load_seq2seq("t5-small", "tensorrt")
+
+def test_ner_agreement_f1():
+    baseline = [{(0, 5, "B-PER"), (10, 15, "B-LOC")}]
+    candidate = [{(0, 5, "B-PER")}]
+    assert _agreement("ner", baseline, candidate) == {"entity_f1": round(2 / 3, 4)}
+
+def test_artifacts_are_reused_from_cache(tmp_path):
+    from src.backends import _cached, artifact_dir
+    builds = []
+
+    def build():
+        builds.append(1)
+        return "converted"
+
+    def save(model, path):
+        with open(os.path.join(path, "model.txt"), "w") as f:
+            f.write(model)
+
+    def restore(path):
+        with open(os.path.join(path, "model.txt")) as f:
+            return f.read()
+
+    for _ in range(2):
+        assert _cached("org/model", "torch-int8", build, save, restore, str(tmp_path)) == "converted"
+    assert len(builds) == 1
+    assert os.path.isdir(artifact_dir("org/model", "torch-int8", str(tmp_path)))
+
+def test_onnx_sentence_transformer_matches_fp32(tmp_path, monkeypatch):
+    pytest.importorskip("optimum.onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    import numpy as np
+    from src import backends
+    name = "sentence-transformers/multi-qa-MiniLM-L6-cos-v1"
+    texts = ["Jenny Cox lives in Seattle.", "The weather is nice today."]
+    baseline = backends.load_sentence_transformer(name, "torch").encode(texts)
+    monkeypatch.setattr(backends, "MODEL_CACHE_DIR", str(tmp_path))
+    for _ in range(2):
+        # The second load restores the exported encoder from the cache
+        vectors = backends.load_sentence_transformer(name, "onnx").encode(texts)
+        assert vectors.shape == baseline.shape
+        assert np.allclose(vectors, baseline, atol=1e-3)
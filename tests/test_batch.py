@@ -0,0 +1,52 @@
+import sys
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.batch import read_records, length_batches, resume_point, process, detect_format
+
+def upper_case(texts):
+    return [{"text": text.upper()} for text in texts]
+
+def test_jsonl_records_keep_their_position_and_report_bad_lines(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"id": "a", "text": "first"}\nnot json\n\n{"text": "third"}\n{"body": "x"}\n')
+    assert list(read_records(str(path), "jsonl")) == [
+        ("a", "first", None),
+        (2, None, "Line is not valid JSON."),
+        (3, "third", None),
+        (4, None, "Each line must be a JSON object with a 'text' string."),
+    ]
+
+def test_csv_records_use_the_named_columns(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text('key,body\nk1,"Hello, world"\n,second\n')
+    assert detect_format(str(path)) == "csv"
+    assert list(read_records(str(path), "csv", text_field="body", id_field="key")) == [
+        ("k1", "Hello, world", None), (2, "second", None)]
+
+def test_batches_group_texts_of_similar_length():
+    texts = {0: "a b c d", 1: "a", 2: "a b c", 3: "a b"}
+    assert length_batches(texts, 2) == [[1, 3], [2, 0]]
+
+def test_results_are_written_in_input_order(tmp_path):
+    records = [(index, "word " * (index % 7 + 1), None) for index in range(50)]
+    records[10] = (10, None, "Line is not valid JSON.")
+    records[20] = (20, "word " * 9, None)
+    path = tmp_path / "out.jsonl"
+    with ThreadPoolExecutor(max_workers=4) as pool, open(path, "w") as output:
+        stats = process(records, upper_case, pool, output, word_limit=8, batch_size=4, window=16)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["id"] for line in lines] == list(range(50))
+    assert lines[3] == {"id": 3, "text": "WORD WORD WORD WORD "}
+    assert lines[10] == {"id": 10, "error": "Line is not valid JSON."}
+    assert "exceeds 8 words" in lines[20]["error"]
+    assert stats["records"] == 50 and stats["errors"] == 2
+
+def test_resume_drops_a_partial_last_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    assert resume_point(str(path)) == 0
+    path.write_text('{"id": 1}\n{"id": 2}\n{"id": 3, "ent')
+    assert resume_point(str(path)) == 2
+    assert path.read_text() == '{"id": 1}\n{"id": 2}\n'
@@ -0,0 +1,50 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.testclient import TestClient
+from src.main import app
+from decouple import config
+
+WORD_LIMIT = int(config("WORD_LIMIT", default=400))
+headers = {"X-API-KEY": config("DEV_API_KEY")}
+
+client = TestClient(app)
+
+short_text = "Jenny Cox washed the dishes from the morning rush in the Silo."
+long_text = "word " * (WORD_LIMIT + 1)
+batch_payload = {"texts": [short_text, long_text, short_text]}
+
+def check_batch_results(results, key):
+    assert len(results) == 3
+    assert key in results[0]
+    assert results[1] == {"error": f"Input text exceeds {WORD_LIMIT} words. Please provide shorter text."}
+    assert results[2] == results[0]
+
+def test_text2vec_batch():
+    response = client.post("/text2vec/batch", json=batch_payload, headers=headers)
+    assert response.status_code == 200
+    check_batch_results(response.json()["results"], "vector")
+
+def test_ner_batch():
+    response = client.post("/ner/batch", json=batch_payload, headers=headers)
+    assert response.status_code == 200
+    check_batch_results(response.json()["results"], "entities")
+
+def test_paraphrase_batch():
+    response = client.post("/paraphrase/batch", json=batch_payload, headers=headers)
+    assert response.status_code == 200
+    check_batch_results(response.json()["results"], "paraphrased_text")
+
+def test_analyze_batch():
+    response = client.post("/analyze/", json={**batch_payload, "operations": ["ner", "paraphrase"]}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    check_batch_results(body["results"], "ner")
+    assert body["results"][0]["paraphrase"] == client.post("/paraphrase/", json={"text": short_text}, headers=headers).json()
+    assert set(body["timings_ms"]) == {"ner", "paraphrase", "total"}
+
+def test_analyze_text():
+    response = client.post("/analyze/", json={"text": short_text, "operations": ["text2vec"]}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["text2vec"] == client.post("/text2vec/", json={"text": short_text}, headers=headers).json()
@@ -0,0 +1,95 @@
+import sys
+import os
+import asyncio
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src import deadlines
+from src.batching import MicroBatcher
+from src.deadlines import DeadlineExceeded
+
+def test_results_return_to_their_callers():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(batch_fn, window_ms=10, max_batch_size=8, length_bucket=0)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(text) for text in ["a", "b", "c"]))
+
+    assert asyncio.run(run()) == ["A", "B", "C"]
+    assert calls == [["a", "b", "c"]]
+
+def test_groups_by_length():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return items
+
+    batcher = MicroBatcher(batch_fn, window_ms=10, max_batch_size=8, length_bucket=10)
+
+    async def run():
+        lengths = {"short1": 1, "long1": 50, "short2": 2, "short3": 3}
+        return await asyncio.gather(*(batcher.submit(text, length) for text, length in lengths.items()))
+
+    assert asyncio.run(run()) == ["short1", "long1", "short2", "short3"]
+    assert sorted(calls) == [["long1"], ["short1", "short2", "short3"]]
+
+def test_respects_max_batch_size():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return items
+
+    batcher = MicroBatcher(batch_fn, window_ms=10, max_batch_size=2, length_bucket=0)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(text) for text in "abcde"))
+
+    assert asyncio.run(run()) == list("abcde")
+    assert all(len(call) <= 2 for call in calls)
+    assert sorted(item for call in calls for item in call) == list("abcde")
+
+def test_errors_reach_every_caller():
+    def batch_fn(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(batch_fn, window_ms=1)
+
+    async def run():
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_expired_and_abandoned_items_are_dropped_before_batching():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return items
+
+    batcher = MicroBatcher(batch_fn, window_ms=20, max_batch_size=8, length_bucket=0)
+
+    async def submit(item, deadline_ms=None):
+        deadlines.request_options(deadline_ms=deadline_ms)
+        return await batcher.submit(item)
+
+    async def run():
+        expiring = asyncio.ensure_future(submit("expiring", 1))
+        abandoned = asyncio.ensure_future(submit("abandoned"))
+        kept = asyncio.ensure_future(submit("kept"))
+        await asyncio.sleep(0.005)
+        abandoned.cancel()
+        with pytest.raises(DeadlineExceeded):
+            await expiring
+        return await kept
+
+    assert asyncio.run(run()) == "kept"
+    assert calls == [["kept"]]
@@ -0,0 +1,41 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.benchmark import parse_lengths, make_texts, summarize, compare
+from src.model_registry import ModelRegistry
+from src import stub_models
+
+def test_texts_are_reproducible_and_follow_the_mix():
+    lengths = parse_lengths("5:1,50:0")
+    texts = make_texts(20, lengths, seed=3)
+    assert texts == make_texts(20, lengths, seed=3)
+    assert all(len(text.split()) == 5 for text in texts)
+
+def test_summary_percentiles_and_errors():
+    summary = summarize([0.001 * i for i in range(1, 101)], {"503": 2}, 2.0)
+    assert summary["requests"] == 102
+    assert summary["rps"] == 50.0
+    assert 50 <= summary["p50_ms"] <= 51
+    assert 99 <= summary["p99_ms"] <= 100
+
+def test_compare_reports_relative_change():
+    baseline = {"results": [{"route": "ner", "concurrency": 8, "p50_ms": 10.0, "rps": 100.0}]}
+    current = {"results": [{"route": "ner", "concurrency": 8, "p50_ms": 12.0, "rps": 80.0},
+                           {"route": "text2vec", "concurrency": 8, "p50_ms": 5.0, "rps": 10.0}]}
+    changes = compare(current, baseline)
+    assert changes == [{"route": "ner", "concurrency": 8,
+                        "p50_ms": {"baseline": 10.0, "current": 12.0, "change": 0.2},
+                        "rps": {"baseline": 100.0, "current": 80.0, "change": -0.2}}]
+
+def test_stubs_replace_declared_models():
+    registry = ModelRegistry()
+    registry.declare("text2vec.model", "some/model", lambda: 1 / 0)
+    assert stub_models.install(registry) == [("text2vec.model", "some/model")]
+    model = registry.get("text2vec.model", "some/model")
+    first, second = model.encode(["a text", "a text"])
+    assert (first == second).all()
+
+def test_stub_ner_tags_capitalized_runs():
+    entities = stub_models.StubTokenClassifier()("Jenny Cox lives here.")
+    assert [(e["word"], e["entity"][:2]) for e in entities] == [("Jenny", "B-"), ("Cox", "I-")]
@@ -0,0 +1,35 @@
+import sys
+import os
+import re
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.chunking import chunk_text, pool_vectors, stitch_entities, Chunk
+
+def whitespace_tokenizer(text, add_special_tokens=False, return_offsets_mapping=True):
+    # Stands in for a fast tokenizer: one token per word, with character offsets
+    return {"offset_mapping": [match.span() for match in re.finditer(r"\S+", text)]}
+
+def test_short_text_is_a_single_chunk():
+    chunks = chunk_text(whitespace_tokenizer, "one two three", max_tokens=5, overlap=1)
+    assert [chunk.text for chunk in chunks] == ["one two three"]
+
+def test_chunks_overlap_and_keep_offsets():
+    text = "a b c d e f g"
+    chunks = chunk_text(whitespace_tokenizer, text, max_tokens=3, overlap=1)
+    assert [chunk.text for chunk in chunks] == ["a b c", "c d e", "e f g"]
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+
+def test_pooling():
+    chunks = [Chunk("a", 0, 1, 1), Chunk("b", 2, 3, 3)]
+    assert pool_vectors([[0.0, 4.0], [4.0, 0.0]], chunks, "mean") == [2.0, 2.0]
+    assert pool_vectors([[0.0, 4.0], [4.0, 0.0]], chunks, "weighted") == [3.0, 1.0]
+
+def test_stitch_entities_shifts_offsets_and_drops_overlap_duplicates():
+    chunks = [Chunk("Jenny Cox", 0, 9, 2), Chunk("Cox went", 6, 14, 2)]
+    entities_per_chunk = [
+        [{"word": "Jenny", "entity": "B-PER", "score": 0.9, "start": 0, "end": 5},
+         {"word": "Cox", "entity": "I-PER", "score": 0.6, "start": 6, "end": 9}],
+        [{"word": "Cox", "entity": "I-PER", "score": 0.8, "start": 0, "end": 3}],
+    ]
+    entities = stitch_entities(chunks, entities_per_chunk)
+    assert [(entity["word"], entity["start"], entity["score"]) for entity in entities] == [("Jenny", 0, 0.9), ("Cox", 6, 0.8)]
@@ -0,0 +1,63 @@
+import sys
+import os
+import asyncio
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src import deadlines
+from src.deadlines import DeadlineMiddleware, ClientDisconnected, cancel_on_disconnect
+
+class FakeRequest:
+    # Reports a disconnect once `after` seconds have passed
+    def __init__(self, after):
+        self.disconnect_at = time.monotonic() + after
+
+    async def is_disconnected(self):
+        return time.monotonic() >= self.disconnect_at
+
+def test_work_is_cancelled_when_the_client_disconnects():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(ClientDisconnected):
+            await cancel_on_disconnect("test", FakeRequest(0.05), work())
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [True]
+
+def test_connected_clients_get_their_result():
+    async def work():
+        await asyncio.sleep(0.01)
+        return "done"
+
+    assert asyncio.run(cancel_on_disconnect("test", FakeRequest(5), work())) == "done"
+
+def test_middleware_reads_priority_and_deadline_headers():
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["lane"] = deadlines.current_lane()
+        seen["remaining"] = deadlines.current_deadline() - time.monotonic()
+
+    headers = [(b"x-priority", b"bulk"), (b"x-deadline-ms", b"250")]
+    asyncio.run(DeadlineMiddleware(app)({"type": "http", "headers": headers}, None, None))
+    assert seen["lane"] == "bulk"
+    assert 0 < seen["remaining"] <= 0.25
+
+def test_body_fields_override_headers_and_batches_default_to_bulk():
+    async def run(priority, default_lane):
+        deadlines.request_options(priority, default_lane=default_lane)
+        return deadlines.current_lane()
+
+    assert asyncio.run(run(None, "bulk")) == "bulk"
+    assert asyncio.run(run("interactive", "bulk")) == "interactive"
+    assert asyncio.run(run(None, None)) == "interactive"
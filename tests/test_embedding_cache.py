@@ -0,0 +1,71 @@
+import sys
+import os
+import asyncio
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from src.embedding_cache import EmbeddingCache
+from src.backends import registry_name
+
+def test_memory_tier_is_lru_bounded():
+    cache = EmbeddingCache("model-a", max_entries=2, path="")
+    cache.put("one", [1.0])
+    cache.put("two", [2.0])
+    cache.get("one")
+    cache.put("three", [3.0])
+    assert cache.get("two") is None
+    assert cache.get("one") is not None
+    assert cache.stats()["memory_entries"] == 2
+
+def test_normalized_text_shares_an_entry():
+    cache = EmbeddingCache("model-a", max_entries=10, path="")
+    cache.put("Jenny  Cox\n washed", [1.0, 2.0])
+    assert np.array_equal(cache.get(" Jenny Cox washed "), np.array([1.0, 2.0], dtype=np.float32))
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 0
+
+def test_disk_tier_survives_restart_and_model_change(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache("model-a", max_entries=10, path=path)
+    cache.put("text", [0.5, 0.25])
+
+    restarted = EmbeddingCache("model-a", max_entries=10, path=path)
+    assert restarted.get("text").tolist() == [0.5, 0.25]
+    assert restarted.stats()["disk_hits"] == 1
+
+    other_model = EmbeddingCache("model-b", max_entries=10, path=path)
+    assert other_model.get("text") is None
+    assert other_model.stats()["disk_entries"] == 0
+
+def test_changing_the_backend_misses_the_cache(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    torch_cache = EmbeddingCache(registry_name("model-a", "torch"), max_entries=10, path=path)
+    torch_cache.put("text", [0.5, 0.25])
+
+    onnx_cache = EmbeddingCache(registry_name("model-a", "onnx"), max_entries=10, path=path)
+    assert onnx_cache.get("text") is None
+    assert onnx_cache.key("text") != torch_cache.key("text")
+
+def record_disk_threads(cache, threads):
+    for name in ("_from_disk", "_to_disk"):
+        method = getattr(cache, name)
+        def on_thread(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+        setattr(cache, name, on_thread)
+    return cache
+
+def test_async_calls_use_the_disk_tier_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    disk_threads = []
+
+    async def run():
+        cache = record_disk_threads(EmbeddingCache("model-a", max_entries=10, path=path), disk_threads)
+        await cache.put_many_async([("one", [1.0]), ("two", [2.0])])
+        restarted = record_disk_threads(EmbeddingCache("model-a", max_entries=10, path=path), disk_threads)
+        return await restarted.lookup_async(["two", "three", "one", "two"]), restarted.stats()
+    vectors, stats = asyncio.run(run())
+    assert [None if vector is None else vector.tolist() for vector in vectors] == [[2.0], None, [1.0], [2.0]]
+    assert stats["disk_hits"] == 3 and stats["misses"] == 1
+    assert len(disk_threads) == 2 and threading.get_ident() not in disk_threads
@@ -0,0 +1,142 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src import deadlines
+from src.deadlines import DeadlineExceeded
+from src.executors import InferenceExecutor, ServiceOverloaded
+
+def test_runs_blocking_work_off_the_event_loop():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=4)
+
+    async def run():
+        ticks = []
+
+        async def ticker():
+            for _ in range(3):
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(executor.run(time.sleep, 0.1), ticker())
+        return ticks
+
+    assert len(asyncio.run(run())) == 3
+    executor.shutdown()
+
+def test_rejects_when_queue_is_full():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=1)
+
+    async def run():
+        async with executor.admit():
+            with pytest.raises(ServiceOverloaded) as info:
+                async with executor.admit():
+                    pass
+        assert info.value.retry_after >= 0
+        # The slot is released once the first request finishes
+        async with executor.admit():
+            return executor.pending
+
+    assert asyncio.run(run()) == 1
+
+def test_interactive_work_runs_before_queued_bulk_work():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=8)
+    order = []
+
+    async def submit(name, lane, delay=0.0):
+        await asyncio.sleep(delay)
+        deadlines.request_options(lane)
+        await executor.run(lambda: (order.append(name), time.sleep(0.02)))
+
+    async def run():
+        # The first bulk call holds the only slot while the rest queue up behind it
+        await asyncio.gather(submit("bulk1", "bulk"), submit("bulk2", "bulk", 0.005), submit("bulk3", "bulk", 0.005),
+                             submit("interactive", "interactive", 0.01))
+
+    asyncio.run(run())
+    assert order == ["bulk1", "interactive", "bulk2", "bulk3"]
+    executor.shutdown()
+
+def test_bulk_work_can_be_kept_off_reserved_slots():
+    executor = InferenceExecutor("TEST", max_concurrency=2, max_queue=8, bulk_max_concurrency=1)
+    running = []
+    peak = []
+
+    def work():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.02)
+        running.pop()
+
+    async def run():
+        await asyncio.gather(*(executor.run(work, lane="bulk") for _ in range(3)))
+
+    asyncio.run(run())
+    assert max(peak) == 1
+    executor.shutdown()
+
+def test_work_that_expires_while_queued_is_dropped():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=8)
+    calls = []
+
+    async def run():
+        blocker = asyncio.ensure_future(executor.run(time.sleep, 0.1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(DeadlineExceeded):
+            await executor.run(calls.append, "late", deadline=time.monotonic() + 0.02)
+        await blocker
+
+    asyncio.run(run())
+    assert calls == []
+    assert executor.dropped == 1
+    executor.shutdown()
+
+def test_work_that_finishes_after_its_deadline_returns_its_result():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=8)
+
+    async def run():
+        return await executor.run(lambda: (time.sleep(0.05), "done")[1], deadline=time.monotonic() + 0.01)
+
+    assert asyncio.run(run()) == "done"
+    executor.shutdown()
+
+def test_expired_requests_are_not_admitted():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=8)
+
+    async def run():
+        deadlines.request_options(deadline_ms=-1)
+        with pytest.raises(DeadlineExceeded):
+            async with executor.admit():
+                pass
+
+    asyncio.run(run())
+    assert executor.pending == 0
+
+def test_cancelled_caller_stops_running_work_and_keeps_its_slot_until_it_ends():
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=8)
+    started = threading.Event()
+    stopped = []
+
+    def work():
+        # Polls deadlines.cancelled() the way generate() does between decoding steps
+        started.set()
+        for _ in range(200):
+            if deadlines.cancelled():
+                stopped.append(True)
+                return
+            time.sleep(0.005)
+
+    async def run():
+        task = asyncio.ensure_future(executor.run(work))
+        while not started.is_set():
+            await asyncio.sleep(0.005)
+        task.cancel()
+        # The next call only starts once the cancelled one has really returned
+        await executor.run(lambda: stopped.append("next"))
+
+    asyncio.run(run())
+    assert stopped == [True, "next"]
+    executor.shutdown()
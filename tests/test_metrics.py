@@ -0,0 +1,29 @@
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prometheus_client import REGISTRY
+from src.metrics import stage, count_error, render
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_nested_stage_time_is_not_counted_twice():
+    outer_before = sample("riptide_stage_seconds_sum", service="test", stage="outer")
+    inner_before = sample("riptide_stage_seconds_sum", service="test", stage="inner")
+    with stage("test", "outer"):
+        with stage("test", "inner"):
+            time.sleep(0.05)
+    outer = sample("riptide_stage_seconds_sum", service="test", stage="outer") - outer_before
+    inner = sample("riptide_stage_seconds_sum", service="test", stage="inner") - inner_before
+    assert inner >= 0.05
+    assert outer < 0.05
+
+def test_errors_are_counted_and_rendered():
+    before = sample("riptide_errors_total", service="test", type="input_too_long")
+    count_error("test", "input_too_long")
+    assert sample("riptide_errors_total", service="test", type="input_too_long") == before + 1
+    body, content_type = render()
+    assert b"riptide_errors_total" in body
+    assert content_type.startswith("text/plain")
@@ -0,0 +1,189 @@
+import sys
+import os
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src.model_registry import ModelRegistry, ModelNotAllowed, select_model
+
+class FakeTensor:
+    def __init__(self, size):
+        self.size = size
+
+    def numel(self):
+        return self.size
+
+    def element_size(self):
+        return 1
+
+class FakeModel:
+    # Reports `size` bytes of weights to estimate_memory_bytes()
+    def __init__(self, size):
+        self.weights = [FakeTensor(size)]
+        self.warmed_up = False
+
+    def parameters(self):
+        return self.weights
+
+def test_loads_once():
+    registry = ModelRegistry()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    first = registry.get("test.model", "dummy", loader)
+    second = registry.get("test.model", "dummy", loader)
+    assert first is second
+    assert len(calls) == 1
+
+def test_concurrent_first_use_loads_once():
+    registry = ModelRegistry()
+    calls = []
+    results = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    threads = [threading.Thread(target=lambda: results.append(registry.get("test.model", "dummy", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({id(result) for result in results}) == 1
+
+def test_describe_lists_loaded_models():
+    registry = ModelRegistry()
+    registry.get("test.tokenizer", "dummy", lambda: "tokenizer")
+    description = registry.describe()
+    assert description["models"][0]["role"] == "test.tokenizer"
+    assert description["models"][0]["name"] == "dummy"
+    assert description["total_memory_bytes"] == 0
+
+def test_declared_models_load_on_demand_and_report_status():
+    registry = ModelRegistry()
+    registry.declare("test.model", "dummy", lambda: "model")
+    assert registry.status()[0]["state"] == "pending"
+    assert not registry.is_loaded("test.model", "dummy")
+
+    assert registry.load_declared() == []
+    assert registry.status()[0]["state"] == "ready"
+    assert registry.get("test.model", "dummy") == "model"
+
+def test_failed_load_is_reported_and_retried():
+    registry = ModelRegistry()
+    attempts = []
+
+    def loader():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return "model"
+
+    registry.declare("test.model", "dummy", loader)
+    failures = registry.load_declared()
+    assert failures == [("test.model", "dummy", "download failed")]
+    assert registry.status()[0] == {"role": "test.model", "name": "dummy", "group": "test.model:dummy",
+                                    "state": "failed", "seconds": 0.0, "on_demand": False, "pinned": True,
+                                    "error": "download failed"}
+
+    assert registry.get("test.model", "dummy") == "model"
+    assert registry.status()[0]["state"] == "ready"
+
+def test_least_recently_used_on_demand_group_is_evicted_over_budget():
+    registry = ModelRegistry(memory_budget_bytes=250, pinned_groups=[])
+    registry.declare("test.model", "default", lambda: FakeModel(100))
+    for name in ("a", "b"):
+        registry.declare("test.model", name, lambda: FakeModel(100), group=f"test:{name}", on_demand=True)
+
+    assert registry.load_declared() == []
+    assert not registry.is_loaded("test.model", "a")
+    registry.get("test.model", "a")
+    registry.get("test.model", "b")
+    assert not registry.is_loaded("test.model", "a")
+    assert registry.is_loaded("test.model", "default")
+    assert registry.is_loaded("test.model", "b")
+    assert registry.describe()["evictions"] == 1
+
+    # An evicted model loads again on its next use
+    registry.get("test.model", "a")
+    assert not registry.is_loaded("test.model", "b")
+    assert registry.describe()["total_memory_bytes"] == 200
+
+def test_pinned_groups_are_loaded_at_startup_and_never_evicted():
+    registry = ModelRegistry(memory_budget_bytes=150, pinned_groups=["test:hot"])
+    registry.declare("test.model", "hot", lambda: FakeModel(100), group="test:hot", on_demand=True)
+    registry.declare("test.model", "cold", lambda: FakeModel(100), group="test:cold", on_demand=True)
+    registry.load_declared()
+    assert registry.is_loaded("test.model", "hot")
+
+    registry.get("test.model", "cold")
+    assert registry.is_loaded("test.model", "hot")
+    assert registry.is_loaded("test.model", "cold")
+
+    registry.load_group("test:cold", pin=True)
+    assert registry.status()[1]["pinned"]
+
+def test_warmup_runs_once_after_loading():
+    registry = ModelRegistry()
+    warmed = []
+    registry.declare("test.model", "dummy", lambda: FakeModel(1), warmup=warmed.append)
+    model = registry.get("test.model", "dummy")
+    registry.get("test.model", "dummy")
+    assert warmed == [model]
+
+def test_select_model_enforces_the_allow_list():
+    assert select_model("ner", None, ["default", "other"]) == "default"
+    assert select_model("ner", "other", ["default", "other"]) == "other"
+    with pytest.raises(ModelNotAllowed):
+        select_model("ner", "unknown", ["default", "other"])
+
+class FakeQuantizedModel:
+    # Like an int8 dynamic-quantized module: the packed (weight, bias) pairs are only in the state dict
+    def __init__(self, size):
+        self.packed = (FakeTensor(size), FakeTensor(4))
+
+    def parameters(self):
+        return []
+
+    def modules(self):
+        return [self]
+
+    def state_dict(self, keep_vars=False):
+        return {"linear._packed_params._packed_params": self.packed}
+
+class FakeOnnxModel:
+    def __init__(self, directory):
+        self.model_save_dir = directory
+        self.model = object()
+
+def test_memory_estimate_covers_int8_and_onnx_models(tmp_path):
+    from src.model_registry import estimate_memory_bytes
+    assert estimate_memory_bytes(FakeQuantizedModel(100)) == 104
+    (tmp_path / "model.onnx").write_bytes(b"x" * 300)
+    (tmp_path / "config.json").write_text("{}")
+    assert estimate_memory_bytes(FakeOnnxModel(str(tmp_path))) == 300
+
+def test_get_never_returns_an_evicted_value():
+    registry = ModelRegistry()
+    registry.declare("test.model", "dummy", lambda: object(), group="test:dummy", on_demand=True)
+    stop = threading.Event()
+    results = []
+
+    def read():
+        while not stop.is_set():
+            results.append(registry.get("test.model", "dummy"))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for _ in range(2000):
+        registry.evict("test:dummy")
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert results and all(value is not None for value in results)
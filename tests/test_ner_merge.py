@@ -0,0 +1,29 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+
+# The merge is pure Python, but it lives next to the pipeline in ner_service
+pytest.importorskip("torch")
+from src.ner_service import merge_entity_spans
+
+text = "Jenny Cox washed dishes in Silo Eighteen with Bob."
+tokens = [
+    {"word": "Jenny", "entity": "I-PER", "score": 0.9, "start": 0, "end": 5},
+    {"word": "Co", "entity": "I-PER", "score": 0.8, "start": 6, "end": 8},
+    {"word": "##x", "entity": "I-PER", "score": 0.7, "start": 8, "end": 9},
+    {"word": "Silo", "entity": "I-LOC", "score": 0.6, "start": 27, "end": 31},
+    {"word": "Eighteen", "entity": "I-MISC", "score": 0.5, "start": 32, "end": 40},
+    {"word": "Bob", "entity": "B-PER", "score": 0.9, "start": 46, "end": 49},
+]
+
+def test_merges_word_pieces_and_same_type_neighbours():
+    spans = merge_entity_spans(text, tokens)
+    assert spans[0]["word"] == "Jenny Cox"
+    assert (spans[0]["start"], spans[0]["end"]) == (0, 9)
+    assert spans[0]["score"] == pytest.approx(0.8)
+
+def test_extends_over_following_capitalized_words():
+    spans = merge_entity_spans(text, tokens)
+    assert [(span["word"], span["entity_group"]) for span in spans] == [("Jenny Cox", "PER"), ("Silo Eighteen", "LOC"), ("Bob", "PER")]
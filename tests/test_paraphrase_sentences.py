@@ -0,0 +1,35 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from src import paraphraser_service
+from src.paraphraser_service import split_sentences, sentence_budgets, EndAtBudget, paraphrase_sentences
+from src.stub_models import StubTokenizer, StubSeq2Seq
+
+def test_sentences_and_separators_rebuild_the_text():
+    text = "Jenny Cox lives in Seattle.  She works at Acme Corp!\n\nAlice visits on Tuesday."
+    sentences, separators = split_sentences(text)
+    assert len(sentences) == 3
+    assert len(separators) == 4
+    assert "".join(piece for pair in zip(separators, sentences + [""]) for piece in pair) == text
+
+def test_budgets_follow_the_input_length_up_to_the_word_limit():
+    short, long = sentence_budgets([4, 10 ** 6])
+    assert short < 20
+    assert long == paraphraser_service.WORD_LIMIT
+
+def test_rows_over_their_budget_can_only_end():
+    processor = EndAtBudget([1, 5], eos_token_id=2)
+    scores = processor(np.zeros((2, 2)), np.zeros((2, 4)))
+    assert scores[0].tolist() == [-np.inf, -np.inf, 0, -np.inf]
+    assert scores[1].tolist() == [0, 0, 0, 0]
+
+def test_sentences_are_paraphrased_together_and_reassembled_in_order(monkeypatch):
+    tokenizer = StubTokenizer()
+    monkeypatch.setattr(paraphraser_service, "get_tokenizer", lambda model=None: tokenizer)
+    monkeypatch.setattr(paraphraser_service, "get_model", lambda model=None: StubSeq2Seq())
+    results = paraphrase_sentences(["One two. Three four.", "", "Five six."], return_sequences=2)
+    assert results[0][0] == "two. One four. Three"
+    assert results[1] == ["", ""]
+    assert results[2] == ["six. Five", "Five six."]
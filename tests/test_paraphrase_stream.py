@@ -0,0 +1,75 @@
+import sys
+import os
+import asyncio
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+from fastapi import FastAPI
+from src import paraphraser_service
+from src.paraphraser_service import paraphraser_router, paraphrase_executor
+from src.deadlines import DeadlineMiddleware
+from src.stub_models import StubTokenizer
+
+def stream_app():
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware)
+    app.include_router(paraphraser_router, prefix="/paraphrase")
+    return app
+
+async def read_stream(app, body, timeout=5):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await asyncio.wait_for(client.post("/paraphrase/stream", json=body), timeout)
+        return response.status_code, response.text
+
+def test_stream_ends_with_an_error_when_the_model_cannot_load(monkeypatch):
+    def unavailable(model=None):
+        raise RuntimeError("model failed to load")
+    monkeypatch.setattr(paraphraser_service, "get_tokenizer", lambda model=None: StubTokenizer())
+    monkeypatch.setattr(paraphraser_service, "get_model", unavailable)
+    status, text = asyncio.run(read_stream(stream_app(), {"text": "One two three."}))
+    assert status == 200
+    assert text == 'event: error\ndata: "model failed to load"\n\n'
+    assert paraphrase_executor.pending == 0
+
+def test_stream_ends_when_its_deadline_passes_while_the_slot_is_busy(monkeypatch):
+    monkeypatch.setattr(paraphraser_service, "get_tokenizer", lambda model=None: StubTokenizer())
+    async def run():
+        busy = asyncio.ensure_future(paraphrase_executor.run(time.sleep, 1.0))
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        status, text = await read_stream(stream_app(), {"text": "One two three.", "deadline_ms": 100})
+        elapsed = time.monotonic() - start
+        await busy
+        return status, text, elapsed
+    status, text, elapsed = asyncio.run(run())
+    assert status == 200
+    assert text.startswith("event: error\n") and "deadline" in text
+    assert elapsed < 1.0
+    assert paraphrase_executor.pending == 0
+
+def test_stream_releases_its_place_when_the_body_is_never_sent(monkeypatch):
+    monkeypatch.setattr(paraphraser_service, "get_tokenizer", lambda model=None: StubTokenizer())
+    started = []
+    monkeypatch.setattr(paraphraser_service, "paraphrase_streaming", lambda *args: started.append(args))
+    async def run():
+        body = b'{"text": "One two three."}'
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+                 "scheme": "http", "path": "/paraphrase/stream", "raw_path": b"/paraphrase/stream",
+                 "root_path": "", "query_string": b"", "server": ("test", 80), "client": ("test", 1),
+                 "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]}
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(10)
+        async def send(message):
+            # The client is gone before the response starts
+            raise OSError("connection reset")
+        try:
+            await stream_app()(scope, receive, send)
+        except OSError:
+            pass
+    asyncio.run(run())
+    assert started == []
+    assert paraphrase_executor.pending == 0
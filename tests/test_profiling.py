@@ -0,0 +1,76 @@
+import sys
+import os
+import threading
+import zipfile
+import io
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import profiling
+from src.profiling import ProfileSession, ProfileBusy, begin, end, traced
+
+def test_traced_returns_the_function_itself_when_not_profiling():
+    def work():
+        return 1
+    assert profiling._session is None
+    assert traced(work) is work
+
+def test_only_one_profile_runs_at_a_time():
+    session = begin(1, interval_ms=50)
+    try:
+        try:
+            begin(1)
+            assert False, "expected ProfileBusy"
+        except ProfileBusy:
+            pass
+    finally:
+        end(session)
+    assert profiling._session is None
+    end(begin(1, interval_ms=50))
+
+def test_folded_stacks_start_with_the_thread():
+    session = ProfileSession(1)
+    session.stacks[("MainThread", "main (app.py:1)", "handle (app.py:5)")] += 3
+    session.stacks[("MainThread", "main (app.py:1)")] += 1
+    assert session.folded() == "MainThread;main (app.py:1) 1\nMainThread;main (app.py:1);handle (app.py:5) 3\n"
+
+def test_consecutive_samples_become_one_span_per_frame():
+    session = ProfileSession(1, interval_ms=10)
+    timeline = [(0.0, ("a", "b")), (10000.0, ("a", "b")), (20000.0, ("a", "c")), (100000.0, ("a",))]
+    spans = {(span["name"], span["ts"], span["dur"]) for span in session._sampled_spans(1, 7, timeline)}
+    # The gap before the last sample closes every frame one interval after the sample before it
+    assert spans == {("b", 0.0, 20000.0), ("c", 20000.0, 10000.0), ("a", 0.0, 30000.0), ("a", 100000.0, 10000.0)}
+
+def test_route_limits_sampling_to_matching_work():
+    session = ProfileSession(1, route="/ner/", interval_ms=2)
+    assert session.covers("/ner/batch") and not session.covers("/text2vec/")
+    release = threading.Event()
+    busy = threading.Thread(target=lambda: [0 for _ in iter(release.is_set, True)], name="busy")
+    busy.start()
+    session.start()
+    try:
+        threading.Event().wait(0.05)
+    finally:
+        session.stop()
+        release.set()
+        busy.join()
+    # Nothing was in flight for the route, so neither the busy thread nor this one was sampled
+    assert session.samples == 0
+
+    session = ProfileSession(1, interval_ms=2)
+    release.clear()
+    busy = threading.Thread(target=lambda: [0 for _ in iter(release.is_set, True)], name="busy")
+    busy.start()
+    session.start()
+    try:
+        threading.Event().wait(0.05)
+    finally:
+        session.stop()
+        release.set()
+        busy.join()
+    assert any(stack[0] == "busy" for stack in session.stacks)
+    archive = zipfile.ZipFile(io.BytesIO(session.archive()))
+    assert sorted(archive.namelist()) == ["profile.folded", "summary.json", "trace.json"]
+    trace = json.loads(archive.read("trace.json"))
+    assert any(event["ph"] == "X" and event["tid"] == busy.ident for event in trace["traceEvents"])
+    assert json.loads(archive.read("summary.json"))["samples"] == session.samples
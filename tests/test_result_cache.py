@@ -0,0 +1,86 @@
+import sys
+import os
+import asyncio
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src.result_cache import ResultCache
+
+def test_identical_requests_in_flight_share_one_computation():
+    cache = ResultCache("test", max_entries=10, ttl_seconds=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["result"]
+
+    async def run():
+        key = cache.key("model", "text")
+        return await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == [["result"]] * 5
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["entries"]) == (1, 4, 1)
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    cache = ResultCache("test", max_entries=10, ttl_seconds=60)
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_compute("key", compute))
+        second = asyncio.ensure_future(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+def test_computation_is_cancelled_once_every_caller_is_gone():
+    cache = ResultCache("test", max_entries=10, ttl_seconds=60)
+    finished = []
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "done"
+
+    async def run():
+        callers = [asyncio.ensure_future(cache.get_or_compute("key", compute)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.sleep(0.08)
+
+    asyncio.run(run())
+    assert finished == []
+    assert cache.stats()["in_flight"] == 0
+
+def test_failures_are_not_cached():
+    cache = ResultCache("test", max_entries=10, ttl_seconds=60)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_compute("key", fail))
+    assert cache.get("key") is None
+
+def test_entries_expire_and_are_evicted():
+    cache = ResultCache("test", max_entries=2, ttl_seconds=0.05)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    time.sleep(0.06)
+    assert cache.get("c") is None
+
+def test_key_depends_on_every_part():
+    assert ResultCache.key("t5-small", 0.9, 35, "text") != ResultCache.key("t5-small", 0.9, 36, "text")
+    assert ResultCache.key("model-a", "text") != ResultCache.key("model-b", "text")
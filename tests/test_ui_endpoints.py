@@ -34,6 +34,18 @@ def test_test_endpoint():
     assert response.status_code == 200
     assert response.json() == {"message": "Test endpoint is working"}
 
+def test_health_live():
+    response = client.get("/health/live")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+def test_health_ready_reports_model_states():
+    response = client.get("/health/ready")
+    assert response.status_code in (200, 503)
+    body = response.json()
+    assert body["ready"] == (response.status_code == 200)
+    assert all(model["state"] in ("pending", "loading", "ready", "failed") for model in body["models"])
+
 def test_read_css():
     response = client.get("/styles.css")
     assert response.status_code == 200
@@ -80,4 +92,15 @@ def test_post_vectors_overload():
 def test_post_paraphraser_overload():
     response = client.post("/paraphraser/", data=overloaded_payload)
     assert response.status_code == 200
-    assert "Input text exceeds 400 words. Please provide shorter text." in response.text
\ No newline at end of file
+    assert "Input text exceeds 400 words. Please provide shorter text." in response.text
+def test_post_paraphraser_stream():
+    with client.stream("POST", "/paraphraser/stream", data=sample_payload) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+    assert "event: done" in body
+
+def test_post_paraphraser_stream_overload():
+    response = client.post("/paraphraser/stream", data=overloaded_payload)
+    assert response.status_code == 400
+    assert "Input text exceeds 400 words. Please provide shorter text." in response.text
@@ -0,0 +1,51 @@
+import sys
+import os
+import base64
+import io
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from src.vector_formats import resolve_format, prepare_vectors, encode_vector, npy_bytes, DimensionsTooLarge
+from src.text2vec_service import TextVectorRequest, TextVectorBatchRequest
+from src.analyze_service import AnalyzeRequest
+
+vector = np.array([0.5, -1.0, 0.25, 2.0], dtype=np.float32)
+
+def test_resolve_format():
+    assert resolve_format(None) == "json"
+    assert resolve_format(None, "application/x-npy") == "npy"
+    assert resolve_format("int8", "application/x-npy") == "int8"
+
+def test_truncate_then_normalize():
+    prepared = prepare_vectors([[3.0, 4.0, 12.0]], dimensions=2, normalize=True)
+    assert np.allclose(prepared, [[0.6, 0.8]])
+
+def test_binary_encodings_round_trip():
+    encoded = encode_vector(vector, "float32")
+    assert np.array_equal(np.frombuffer(base64.b64decode(encoded["vector_b64"]), dtype="<f4"), vector)
+
+    encoded = encode_vector(vector, "float16")
+    assert np.allclose(np.frombuffer(base64.b64decode(encoded["vector_b64"]), dtype="<f2"), vector)
+
+    encoded = encode_vector(vector, "int8")
+    values = np.frombuffer(base64.b64decode(encoded["vector_b64"]), dtype=np.int8)
+    assert np.allclose(values * encoded["scale"], vector, atol=encoded["scale"])
+
+def test_npy():
+    matrix = np.load(io.BytesIO(npy_bytes([vector, vector])))
+    assert matrix.shape == (2, 4) and matrix.dtype == np.float32
+
+def test_dimensions_must_be_positive():
+    for request_model, body in ((TextVectorRequest, {"text": "x"}), (TextVectorBatchRequest, {"texts": ["x"]}),
+                                (AnalyzeRequest, {"text": "x"})):
+        for dimensions in (0, -2):
+            with pytest.raises(ValidationError):
+                request_model(**body, dimensions=dimensions)
+        assert request_model(**body, dimensions=2).dimensions == 2
+
+def test_dimensions_cannot_exceed_the_vector():
+    with pytest.raises(DimensionsTooLarge):
+        prepare_vectors([vector], dimensions=5)
+    assert prepare_vectors([vector], dimensions=4).shape == (1, 4)
@@ -0,0 +1,83 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pytest
+from src.vector_index import VectorCollection, VectorIndex, top_k
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def test_top_k_returns_best_first():
+    assert top_k(np.array([0.1, 0.9, 0.5, 0.7]), 2).tolist() == [1, 3]
+    assert top_k(np.array([0.1]), 5).tolist() == [0]
+
+def test_exact_search_matches_brute_force():
+    vectors = random_vectors(300)
+    collection = VectorCollection("test", index="exact")
+    collection.upsert(list(range(300)), vectors)
+    query = vectors[17] + 0.01
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5].tolist()
+    index, results = collection.search(query, 5)
+    assert index == "exact"
+    assert [hit["id"] for hit in results[0]] == expected
+
+def test_ivf_scanning_every_cell_equals_exact_search():
+    vectors = random_vectors(2000)
+    collection = VectorCollection("test", index="ivf", nlist=20)
+    collection.upsert(list(range(2000)), vectors)
+    index, approximate = collection.search(vectors[:3], 10, nprobe=20)
+    _, exact = collection.search(vectors[:3], 10, exact=True)
+    assert index == "ivf"
+    assert [[hit["id"] for hit in hits] for hits in approximate] == [[hit["id"] for hit in hits] for hits in exact]
+
+def test_items_added_after_training_are_found():
+    collection = VectorCollection("test", index="ivf", nlist=8)
+    collection.upsert(list(range(500)), random_vectors(500))
+    collection.build()
+    late = random_vectors(1, seed=1)
+    collection.upsert(["late"], late)
+    _, results = collection.search(late[0], 1, nprobe=1)
+    assert results[0][0]["id"] == "late"
+
+def test_upsert_replaces_and_remove_keeps_rows_contiguous():
+    vectors = random_vectors(4)
+    collection = VectorCollection("test", metric="dot")
+    collection.upsert(["a", "b", "c"], vectors[:3], [{"n": 1}, {"n": 2}, {"n": 3}])
+    collection.upsert(["b"], vectors[3:], [{"n": 4}])
+    assert collection.size == 3
+    assert collection.remove(["a", "missing"]) == 1
+    assert sorted(collection.ids) == ["b", "c"]
+    assert np.allclose(collection.vectors[collection.rows["b"]], vectors[3])
+    assert collection.metadata[collection.rows["b"]] == {"n": 4}
+
+def test_dimension_mismatch_is_rejected():
+    collection = VectorCollection("test")
+    collection.upsert(["a"], random_vectors(1, dim=8))
+    with pytest.raises(ValueError):
+        collection.upsert(["b"], random_vectors(1, dim=4))
+
+def test_collections_persist(tmp_path):
+    vectors = random_vectors(100)
+    index = VectorIndex(str(tmp_path))
+    collection = index.create("docs", index="ivf", nlist=4)
+    collection.upsert([f"doc{i}" for i in range(100)], vectors, [{"i": i} for i in range(100)])
+    collection.build()
+    index.save_all()
+
+    restored = VectorIndex(str(tmp_path))
+    restored.load_all()
+    _, before = collection.search(vectors[5], 3)
+    _, after = restored.collections["docs"].search(vectors[5], 3)
+    assert after == before
+    assert after[0][0] == {"id": "doc5", "score": pytest.approx(1.0), "metadata": {"i": 5}}
+
+def test_collection_names_are_validated(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    with pytest.raises(ValueError):
+        index.create("../escape")
+    index.create("docs")
+    with pytest.raises(ValueError):
+        index.create("docs")
@@ -0,0 +1,164 @@
+import sys
+import os
+import asyncio
+import json
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pytest
+from src.executors import InferenceExecutor
+from src import vector_jobs, text2vec_service
+from src.vector_jobs import VectorJobs, parse_record
+
+def fake_encode(texts):
+    # Row i of the output encodes the number at the end of its text
+    return np.asarray([[float(text.split()[-1]), 1.0] for text in texts], dtype=np.float32)
+
+def write_corpus(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"doc{i}", "text": f"document {i}"}) + "\n")
+        f.write("not json\n")
+
+async def wait_for(jobs, job_id, states=("done", "failed")):
+    for _ in range(500):
+        if jobs.jobs[job_id]["state"] in states:
+            return jobs.describe(job_id)
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job stuck in {jobs.jobs[job_id]['state']}")
+
+def test_job_writes_vectors_ids_and_errors(tmp_path):
+    write_corpus(tmp_path / "corpus.ndjson", 25)
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=4)
+    jobs = VectorJobs(str(tmp_path / "jobs"), fake_encode, executor, "test-model", batch_size=10, input_dir=str(tmp_path))
+
+    async def run():
+        await jobs.start()
+        job = await jobs.submit_path("corpus.ndjson")
+        status = await wait_for(jobs, job["id"])
+        await jobs.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert status["state"] == "done"
+    assert (status["rows"], status["rows_done"], status["errors"], status["dim"]) == (25, 25, 1, 2)
+    vectors = np.load(jobs.path(status["id"], "vectors.npy"))
+    assert vectors[:, 0].tolist() == list(range(25))
+    with open(jobs.path(status["id"], "ids.jsonl")) as f:
+        assert [json.loads(line) for line in f][:2] == ["doc0", "doc1"]
+    executor.shutdown()
+
+def test_paths_outside_the_input_dir_are_refused(tmp_path):
+    jobs = VectorJobs(str(tmp_path / "jobs"), fake_encode, None, "test-model", input_dir=str(tmp_path / "inputs"))
+    os.makedirs(tmp_path / "inputs")
+    with pytest.raises(ValueError):
+        jobs.resolve_input("../corpus.ndjson")
+    with pytest.raises(ValueError):
+        VectorJobs(str(tmp_path / "jobs"), fake_encode, None, "test-model", input_dir="").resolve_input("corpus.ndjson")
+
+def test_interrupted_job_resumes_from_its_last_batch(tmp_path):
+    write_corpus(tmp_path / "corpus.ndjson", 30)
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=4)
+    blocked = threading.Event()
+    calls = []
+
+    def stalling_encode(texts):
+        # The second batch never finishes before the workers are stopped
+        calls.append(len(texts))
+        if len(calls) == 2:
+            blocked.wait(5)
+        return fake_encode(texts)
+
+    async def first_run():
+        jobs = VectorJobs(str(tmp_path / "jobs"), stalling_encode, executor, "test-model", batch_size=10,
+                          input_dir=str(tmp_path))
+        await jobs.start()
+        job = await jobs.submit_path("corpus.ndjson")
+        while len(calls) < 2:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        blocked.set()
+        return job["id"]
+
+    async def second_run(job_id):
+        jobs = VectorJobs(str(tmp_path / "jobs"), fake_encode, executor, "test-model", batch_size=10,
+                          input_dir=str(tmp_path))
+        await jobs.start()
+        assert jobs.jobs[job_id]["rows_done"] == 10
+        status = await wait_for(jobs, job_id)
+        await jobs.stop()
+        return jobs, status
+
+    job_id = asyncio.run(first_run())
+    jobs, status = asyncio.run(second_run(job_id))
+    assert status["state"] == "done"
+    assert np.load(jobs.path(job_id, "vectors.npy"))[:, 0].tolist() == list(range(30))
+    executor.shutdown()
+
+def test_incomplete_uploads_leave_nothing_behind(tmp_path):
+    directory = tmp_path / "jobs"
+    jobs = VectorJobs(str(directory), fake_encode, None, "test-model")
+
+    async def broken_body():
+        yield b'{"text": "document 1"}\n'
+        raise ConnectionError("client went away")
+
+    async def run():
+        await jobs.start()
+        with pytest.raises(ConnectionError):
+            await jobs.submit_upload(broken_body())
+        await jobs.stop()
+
+    async def restart():
+        await jobs.start()
+        await jobs.stop()
+
+    asyncio.run(run())
+    assert os.listdir(directory) == []
+
+    # Left by a process that stopped mid-upload or before writing a job file
+    os.makedirs(directory / ".upload-0123")
+    os.makedirs(directory / ("a" * 32))
+    os.makedirs(directory / "unrelated")
+    asyncio.run(restart())
+    assert os.listdir(directory) == ["unrelated"]
+
+def test_texts_over_the_chunk_limit_are_rejected(monkeypatch):
+    monkeypatch.setattr(vector_jobs, "chunking_requested", lambda flag: True)
+    monkeypatch.setattr(vector_jobs, "CHUNK_MAX_CHUNKS", 2)
+    monkeypatch.setattr(text2vec_service, "WORD_LIMIT", 3)
+    monkeypatch.setattr(text2vec_service, "chunk_document", lambda text: text.split()[::2])
+    assert parse_record(b'{"text": "a b c d"}', 1) == (1, "a b c d")
+    with pytest.raises(ValueError, match="2 chunks"):
+        parse_record(b'{"text": "a b c d e"}', 1)
+
+def test_job_deleted_while_indexing_is_removed(tmp_path, monkeypatch):
+    write_corpus(tmp_path / "corpus.ndjson", 5)
+    executor = InferenceExecutor("TEST", max_concurrency=1, max_queue=4)
+    jobs = VectorJobs(str(tmp_path / "jobs"), fake_encode, executor, "test-model", input_dir=str(tmp_path))
+    indexing, deleted = threading.Event(), threading.Event()
+    index = jobs._index
+
+    def slow_index(job):
+        indexing.set()
+        deleted.wait(5)
+        return index(job)
+    monkeypatch.setattr(jobs, "_index", slow_index)
+
+    async def run():
+        await jobs.start()
+        job = await jobs.submit_path("corpus.ndjson")
+        while not indexing.is_set():
+            await asyncio.sleep(0.01)
+        await jobs.delete(job["id"])
+        deleted.set()
+        while os.path.exists(jobs.path(job["id"])):
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return job["id"]
+
+    job_id = asyncio.run(asyncio.wait_for(run(), 5))
+    assert job_id not in jobs.jobs
+    assert os.listdir(tmp_path / "jobs") == []
+    executor.shutdown()
@@ -0,0 +1,51 @@
+import sys
+import os
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src import weaviate_service
+from src.weaviate_service import weaviate_router
+
+app = FastAPI()
+app.include_router(weaviate_router)
+client = TestClient(app)
+
+def test_live_returns_no_content():
+    response = client.get("/.well-known/live")
+    assert response.status_code == 204
+
+def test_vectors_requires_text_or_texts():
+    assert client.post("/vectors", json={}).status_code == 422
+    assert client.post("/vectors", json={"text": "a", "texts": ["b"]}).status_code == 422
+
+def test_vectors_returns_weaviate_shape():
+    response = client.post("/vectors", json={"text": "Riptide runs on the Silo.", "config": {"pooling_strategy": "masked_mean"}})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["text"] == "Riptide runs on the Silo."
+    assert body["dim"] == len(body["vector"])
+
+def test_vectors_batch_keeps_order():
+    texts = ["first text", "second text", "first text"]
+    body = client.post("/vectors", json={"texts": texts}).json()
+    assert body["texts"] == texts
+    assert len(body["vectors"]) == 3
+    assert body["vectors"][0] == body["vectors"][2]
+
+def test_readiness_polls_start_one_loader(monkeypatch):
+    release = threading.Event()
+    loads = []
+    def slow_load():
+        loads.append(1)
+        release.wait(5)
+    monkeypatch.setattr(weaviate_service, "model_state", lambda: "pending")
+    monkeypatch.setattr(weaviate_service.text2vec_service, "get_model", slow_load)
+    try:
+        for _ in range(20):
+            assert client.get("/.well-known/ready").status_code == 503
+    finally:
+        release.set()
+    weaviate_service._loader.join(5)
+    assert len(loads) == 1
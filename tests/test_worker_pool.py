@@ -0,0 +1,17 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from src.worker_pool import parse_core_sets
+
+def test_explicit_core_sets():
+    assert parse_core_sets("0-3;4,5;6-7", 3) == [[0, 1, 2, 3], [4, 5], [6, 7]]
+
+def test_core_sets_must_match_worker_count():
+    with pytest.raises(ValueError):
+        parse_core_sets("0-3;4-7", 3)
+
+def test_default_split_gives_each_worker_distinct_cores():
+    core_sets = parse_core_sets("", 1)
+    assert len(core_sets) == 1 and core_sets[0]